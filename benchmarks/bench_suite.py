@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+SDK 性能测试套件，使用本地模拟服务 zaoshu.mock.MockServer 离线运行，不需要 API_KEY 及网络
+测试项: 签名吞吐量、小请求 requests/s(串行及并发)、下载速度 MB/s 及下载时的峰值内存、
+       import zaoshu 加一个签名请求的冷启动时间(各传输)
+运行: python benchmarks/bench_suite.py [--quick] [--save result.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import shutil
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zaoshu
+from zaoshu import ZaoshuSdk, ZaoshuSigner
+from zaoshu.mock import MockServer
+
+API_KEY = 'mock-key'
+API_SECRET = 'mock-secret'
+INSTANCE_ID = 'instance-0'
+TASK_ID = 'task-0'
+# 结果比基准慢多少视为退化
+REGRESSION_THRESHOLD = 0.10
+
+# 各测试项的参数，quick 模式用于快速检查
+SETTINGS = {
+    'full': {'sign': 100000, 'get': 2000, 'concurrent_get': 4000, 'workers': 8,
+             'rows': 500000, 'repeat': 3},
+    'quick': {'sign': 20000, 'get': 300, 'concurrent_get': 600, 'workers': 8,
+              'rows': 50000, 'repeat': 1},
+}
+# 下载方式: (名称, download_run_data 的参数)
+DOWNLOADS = [
+    ('download_fileobj', {'fileobj': True}),
+    ('download_save', {'save_file': True}),
+    ('download_parallel', {'save_file': True, 'workers': 4, 'part_size': 4 * 1024 * 1024}),
+    ('download_memory', {}),
+]
+# 冷启动测试的传输
+STARTUP_TRANSPORTS = ('requests', 'stdlib')
+# 冷启动测试的子进程，不受本进程已导入模块的影响
+STARTUP_CODE = """
+from time import perf_counter
+start = perf_counter()
+import zaoshu
+sdk = zaoshu.ZaoshuSdk(%r, %r, base_url=%r, transport=%r)
+assert sdk.instance.item(%r).status_code == 200
+print(perf_counter() - start)
+"""
+
+
+def best(func, repeat):
+    """
+    重复运行，返回最短耗时
+    """
+    return min(timed(func) for _ in range(repeat))
+
+
+def timed(func):
+    start = perf_counter()
+    func()
+    return perf_counter() - start
+
+
+def bench_sign(settings):
+    """签名吞吐量"""
+    signer = ZaoshuSigner(API_KEY, API_SECRET)
+    number = settings['sign']
+
+    def run():
+        for _ in range(number):
+            signer.headers('GET', {'contentType': 'csv'})
+    return {'sign': {'value': number / best(run, settings['repeat']), 'unit': 'headers/s'}}
+
+
+def bench_get(settings, url):
+    """小请求的 requests/s"""
+    results = {}
+    with ZaoshuSdk(API_KEY, API_SECRET, base_url=url, pool_maxsize=settings['workers']) as sdk:
+        sdk.instance.item(INSTANCE_ID)
+        number = settings['get']
+
+        def serial():
+            for _ in range(number):
+                sdk.instance.item(INSTANCE_ID)
+        results['get_serial'] = {'value': number / best(serial, settings['repeat']),
+                                 'unit': 'requests/s'}
+
+        keys = [INSTANCE_ID] * settings['concurrent_get']
+
+        def concurrent():
+            for result in sdk.instance.items_many(keys, workers=settings['workers']):
+                if result.error is not None:
+                    raise result.error
+        results['get_concurrent'] = {'value': len(keys) / best(concurrent, settings['repeat']),
+                                     'unit': 'requests/s'}
+    return results
+
+
+def peak_rss():
+    """
+    当前进程的峰值内存(字节)
+    Linux 下 ru_maxrss 会从父进程继承(exec 后不重置)，优先读取 /proc/self/status 的 VmHWM
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def download_child(url, name):
+    """
+    在子进程中下载一次，输出耗时、字节数及峰值内存
+    """
+    options = dict(dict(DOWNLOADS)[name])
+    save_dir = tempfile.mkdtemp()
+    try:
+        with ZaoshuSdk(API_KEY, API_SECRET, base_url=url) as sdk:
+            before = peak_rss()
+            start = perf_counter()
+            if options.pop('fileobj', False):
+                with open(os.devnull, 'wb') as fileobj:
+                    size = sdk.instance.download_run_data(INSTANCE_ID, TASK_ID, fileobj=fileobj)
+            elif options.get('save_file'):
+                os.chdir(save_dir)
+                path = sdk.instance.download_run_data(INSTANCE_ID, TASK_ID, save_path='/data',
+                                                      **options)
+                size = os.path.getsize(path)
+            else:
+                size = len(sdk.instance.download_run_data(INSTANCE_ID, TASK_ID)[0])
+            seconds = perf_counter() - start
+            after = peak_rss()
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    print(json.dumps({'seconds': seconds, 'bytes': size, 'peak_rss': after,
+                      'rss_growth': after - before}))
+
+
+def bench_download(settings, url):
+    """下载速度及峰值内存，每种下载方式在独立的子进程中运行"""
+    results = {}
+    for name, _ in DOWNLOADS:
+        runs = []
+        for _ in range(settings['repeat']):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                              '--child', name, '--url', url])
+            runs.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+        fastest = min(runs, key=lambda run: run['seconds'])
+        results[name] = {'value': fastest['bytes'] / fastest['seconds'] / 1e6, 'unit': 'MB/s'}
+        results[name + '_peak_rss'] = {'value': max(run['peak_rss'] for run in runs) / 1e6,
+                                       'unit': 'MB', 'lower_is_better': True}
+        results[name + '_rss_growth'] = {'value': max(run['rss_growth'] for run in runs) / 1e6,
+                                         'unit': 'MB', 'lower_is_better': True}
+    return results
+
+
+def bench_startup(settings, url):
+    """import zaoshu 加一个签名请求的冷启动时间，取多次中的最小值"""
+    results = {}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for transport in STARTUP_TRANSPORTS:
+        code = STARTUP_CODE % (API_KEY, API_SECRET, url, transport, INSTANCE_ID)
+        seconds = min(float(subprocess.check_output([sys.executable, '-c', code], cwd=root))
+                      for _ in range(settings['repeat'] * 3))
+        results['startup_' + transport] = {'value': seconds * 1000, 'unit': 'ms',
+                                           'lower_is_better': True}
+    return results
+
+
+def run_suite(mode):
+    """
+    运行全部测试
+    :return: dict
+    """
+    settings = SETTINGS[mode]
+    results = {}
+    results.update(bench_sign(settings))
+    with MockServer(API_KEY, API_SECRET, result_rows=settings['rows']) as server:
+        results.update(bench_get(settings, server.url))
+        results.update(bench_startup(settings, server.url))
+        results.update(bench_download(settings, server.url))
+    return {
+        'meta': {
+            'mode': mode,
+            'settings': settings,
+            'sdk_version': zaoshu.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline_path):
+    """
+    与基准结果比较，返回退化的测试项
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    regressions = []
+    print('\n%-22s %14s %14s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name, result in sorted(report['results'].items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], result['value']
+        change = (new - old) / old if old else 0.0
+        worse = -change if not result.get('lower_is_better') else change
+        flag = ''
+        if worse > REGRESSION_THRESHOLD:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-22s %14.2f %14.2f %+7.1f%%%s' % (name, old, new, change * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='zaoshu SDK benchmark suite')
+    parser.add_argument('--quick', action='store_true', help='smaller workloads, one repeat')
+    parser.add_argument('--save', help='save results as json to this path')
+    parser.add_argument('--compare', help='compare with a saved baseline json')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        download_child(args.url, args.child)
+        return
+
+    report = run_suite('quick' if args.quick else 'full')
+    for name, result in sorted(report['results'].items()):
+        print('%-22s %14.2f %s' % (name, result['value'], result['unit']))
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare and compare(report, args.compare):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
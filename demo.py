@@ -3,8 +3,6 @@
 """
 造数SKD 使用dome
 """
-from time import sleep
-
 from zaoshu import ZaoshuSdk
 
 
@@ -68,43 +66,28 @@ if __name__ == '__main__':
         instance_edit_response = sdk.instance.edit(instance_id, title='测试修改实例数据标题')
         print_resopnse_info(instance_edit_response, '编辑实例的数据')
 
-        # 运行实例
-        instance_run_response = sdk.instance.run(instance_id)
-        print_resopnse_info(instance_run_response, '运行实例')
-        print('暂停10秒,等待实例运行完成')
-        sleep(10)
+        # 运行实例，并等待新建的任务运行结束
+        task_id, instance_task_response = sdk.instance.run_and_wait(instance_id, timeout=600)
+        print_resopnse_info(instance_task_response, '运行实例并等待任务结束')
 
         # 获取实例任务列表
         instance_task_list_response = sdk.instance.task_list(instance_id)
         print_resopnse_info(instance_task_list_response, '获取实例任务列表')
 
-        # 解析实例任务列表
-        tasks = instance_task_list_response.json()
-
-        # 获取任务详情
-        if tasks['data']:
-            # 任务id
-            task_id = tasks['data'][-1]['id']
-
-            # 获取任务详情
-            instance_task_response = sdk.instance.task(instance_id, task_id)
-            print_resopnse_info(instance_task_response, '获取任务详情')
-
-            # 实例任务数据下载
-
-            instance_download_path = sdk.instance.download_run_data(instance_id, task_id,
-                                                                    file_type='json',
-                                                                    save_file=True,
-                                                                    save_path='/data')
-            print('====[实例任务数据下载]========================================')
-            print('下载路径：'+instance_download_path)
-
-            # 实例任务数据下载
-            instance_download_object = sdk.instance.download_run_data(instance_id, task_id,
-                                                                    file_type='json')
-            print('====[实例任务数据下载]========================================')
-            print('下载数据为：' )
-            print(instance_download_object)
+        # 实例任务数据下载
+        instance_download_path = sdk.instance.download_run_data(instance_id, task_id,
+                                                                file_type='json',
+                                                                save_file=True,
+                                                                save_path='/data')
+        print('====[实例任务数据下载]========================================')
+        print('下载路径：'+instance_download_path)
+
+        # 实例任务数据下载
+        instance_download_object = sdk.instance.download_run_data(instance_id, task_id,
+                                                                  file_type='json')
+        print('====[实例任务数据下载]========================================')
+        print('下载数据为：' )
+        print(instance_download_object)
 
     else:
         print("没有实例无法继续，请创建实例后继续")
@@ -1,5 +1,62 @@
-from zaoshu.zaoshu import __version__
-from zaoshu.zaoshu import ZaoshuRequests
-from zaoshu.zaoshu import ZaoshuSdk
-from zaoshu.zaoshu import Instance
-from zaoshu.zaoshu import User
+"""
+造数SDK，导出的名称在第一次访问时才导入所在的模块，import zaoshu 本身不导入任何依赖。
+Python 3.6 不支持模块的 __getattr__(PEP 562)，导入时即导入所有导出的名称
+"""
+import sys
+from importlib import import_module
+
+# {导出的名称: 所在的模块}
+_EXPORTS = {
+    '__version__': 'zaoshu.zaoshu',
+    'ZaoshuRequests': 'zaoshu.zaoshu',
+    'ZaoshuSigner': 'zaoshu.zaoshu',
+    'ZaoshuSdk': 'zaoshu.zaoshu',
+    'Instance': 'zaoshu.zaoshu',
+    'User': 'zaoshu.zaoshu',
+    'BatchResult': 'zaoshu.batch',
+    'ResponseCache': 'zaoshu.cache',
+    'MemoryCache': 'zaoshu.cache',
+    'DiskCache': 'zaoshu.cache',
+    'ResultStore': 'zaoshu.store',
+    'RateLimiter': 'zaoshu.limit',
+    'Metrics': 'zaoshu.metrics',
+    'SyncEngine': 'zaoshu.sync',
+    'BatchJob': 'zaoshu.jobs',
+    'ClientPool': 'zaoshu.pool',
+    'InstanceInfo': 'zaoshu.models',
+    'Task': 'zaoshu.models',
+    'Schema': 'zaoshu.models',
+    'Account': 'zaoshu.models',
+    'Wallet': 'zaoshu.models',
+    'RowDecoder': 'zaoshu.decoder',
+    'ParallelParser': 'zaoshu.parallel',
+    'RequestsTransport': 'zaoshu.transport',
+    'StdlibTransport': 'zaoshu.transport',
+    'MemoryTransport': 'zaoshu.transport',
+    'AsyncZaoshuRequests': 'zaoshu.aio',
+    'AsyncZaoshuSdk': 'zaoshu.aio',
+    'AsyncInstance': 'zaoshu.aio',
+    'AsyncUser': 'zaoshu.aio',
+    'WebhookReceiver': 'zaoshu.webhook',
+}
+
+__all__ = [name for name in _EXPORTS if name != '__version__']
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module 'zaoshu' has no attribute '%s'" % name)
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+if sys.version_info < (3, 7):
+    for _name in _EXPORTS:
+        __getattr__(_name)
+    del _name
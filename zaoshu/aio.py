@@ -0,0 +1,633 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+aio 模块提供基于 asyncio 的造数SDK: AsyncZaoshuRequests, AsyncZaoshuSdk, AsyncInstance, AsyncUser。
+方法名与同步版本一致，均为协程；需要安装 aiohttp，aiohttp 自行协商压缩并解压
+"""
+import asyncio
+import os
+
+from zaoshu.zaoshu import ZaoshuRequests, ZaoshuSigner
+from zaoshu.codec import get_codec, encode_body, STDLIB
+from zaoshu.coalesce import AsyncSingleFlight, flight_key
+from zaoshu.batch import BatchResult
+from zaoshu.wait import POLL_INITIAL, POLL_MAXIMUM, Backoff, is_task_finished, run_task_id
+from zaoshu.wait import check_poll
+from zaoshu.download import parse_file_name, data_file_path, decode_run_data
+from zaoshu.download import DOWNLOAD_CHUNK_SIZE
+
+
+class _NoLimit(object):
+    """
+    不限制并发时使用的空上下文
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_LIMIT = _NoLimit()
+
+
+class AsyncResponse(object):
+    """
+    异步请求的响应，内容已读取完毕，属性与 requests.Response 保持一致
+    """
+
+    def __init__(self, url, status_code, headers, content, codec=STDLIB):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # 解析json响应内容的编解码器
+        self.codec = codec
+
+    @property
+    def text(self):
+        """
+        响应内容文本
+        :return: str
+        """
+        return self.content.decode('utf-8')
+
+    def json(self):
+        """
+        解析json响应内容
+        :return: dict
+        """
+        return self.codec.loads(self.content)
+
+
+class AsyncZaoshuRequests(object):
+    """
+    造数异步HTTP类，与 ZaoshuRequests 使用相同的签名规则，所有请求共用一个连接池
+    """
+
+    def __init__(self, api_key, api_secret, limit=100, limit_per_host=0, concurrency=None,
+                 keep_alive=True, timeout=60, max_retries=3, backoff_factor=0.5,
+                 retry_status=None, retry_methods=None, coalesce=False, json_codec=None):
+        """
+        构造函数
+        :param api_key: 从造数获取的api key
+        :param api_secret: 从造数获取的api secret
+        :param limit: 连接池最大连接数
+        :param limit_per_host: 每个主机的最大连接数，0为不限制
+        :param concurrency: 同时进行的最大请求数，None为不限制
+        :param keep_alive: 是否保持长连接
+        :param timeout: 请求总超时时间(秒)
+        :param max_retries: 5xx 或连接被重置时的最大重试次数
+        :param backoff_factor: 退避系数
+        :param retry_status: 需要重试的状态码
+        :param retry_methods: 允许重试的请求类型
+        :param coalesce: 是否合并同时进行的相同 GET 请求，只发送一次、所有调用方共用同一个响应对象
+        :param json_codec: JSON 编解码器，见 ZaoshuRequests
+        """
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._signer = None
+
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.concurrency = concurrency
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_status = tuple(retry_status or ZaoshuRequests.RETRY_STATUS)
+        self.retry_methods = tuple(retry_methods or ZaoshuRequests.RETRY_METHODS)
+        # 请求合并，None为不合并
+        self.flights = AsyncSingleFlight() if coalesce else None
+        self.codec = get_codec(json_codec)
+
+        self._session = None
+        self._semaphore = None
+
+    @property
+    def signer(self):
+        """
+        签名器，第一次使用时创建
+        :return: ZaoshuSigner
+        """
+        if self._signer is None:
+            self._signer = ZaoshuSigner(self._api_key, self._api_secret)
+        return self._signer
+
+    @property
+    def session(self):
+        """
+        连接池，需在事件循环中第一次使用时创建
+        :return: aiohttp.ClientSession
+        """
+        if self._session is None:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def concurrency_limit(self):
+        """
+        并发限制，在 async with 中使用
+        :return: asyncio.Semaphore
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency \
+                else _NO_LIMIT
+        return self._semaphore
+
+    async def close(self):
+        """
+        关闭连接池
+        :return: None
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def get_headers(self, method, query=None, body=None):
+        """
+        获得请求头信息
+        :param method: 请求类型 GET, POST, PATCH
+        :param query: 查询条件
+        :param body: 内参
+        :return: 返回带签名的请求头
+        """
+        return self.signer.headers(method, query=query, body=body)
+
+    async def send(self, method, url, params=None, body=None, headers=None):
+        """
+        发送带签名的请求，失败时按退避策略重试，每次重试都会重新签名
+        调用方需要在使用完毕后释放返回的响应
+        :param method: 请求类型 GET, POST, PATCH
+        :param url: 请求url
+        :param params: 请求参数
+        :param body: 内容 str、bytes，或由 JSON 编解码器编码的对象
+        :param headers: 额外的请求头，不参与签名
+        :return: aiohttp.ClientResponse
+        """
+        import aiohttp
+        # 只编码一次，签名与发送(包括重试)使用同样的字节
+        body = encode_body(body, self.codec)
+        session = self.session
+        retries = self.max_retries if method in self.retry_methods else 0
+        attempt = 0
+        while True:
+            request_headers = self.get_headers(method, query=params, body=body)
+            if headers:
+                request_headers.update(headers)
+            try:
+                response = await session.request(method, url, params=params, data=body,
+                                                 headers=request_headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status not in self.retry_status or attempt >= retries:
+                    return response
+                response.release()
+
+            attempt += 1
+            await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+
+    async def request(self, method, url, params=None, body=None, headers=None):
+        """
+        发送带签名的请求并读取全部响应内容
+        :param method: 请求类型 GET, POST, PATCH
+        :param url: 请求url
+        :param params: 请求参数
+        :param body: 内容
+        :param headers: 额外的请求头，不参与签名
+        :return: AsyncResponse
+        """
+        async with self.concurrency_limit():
+            response = await self.send(method, url, params=params, body=body, headers=headers)
+            async with response:
+                content = await response.read()
+        return AsyncResponse(str(response.url), response.status, response.headers, content,
+                             self.codec)
+
+    async def get(self, url, params=None, headers=None):
+        """
+        get请求
+        :param url: 请求url
+        :param params: 请求参数
+        :param headers: 额外的请求头
+        :return: AsyncResponse
+        """
+        if self.flights is not None:
+            return await self.flights.do(
+                flight_key('GET', url, params, headers),
+                lambda: self.request('GET', url, params=params, headers=headers))
+        return await self.request('GET', url, params=params, headers=headers)
+
+    async def post(self, url, params=None, body=None):
+        """
+        post请求
+        :param url:请求url
+        :param params:请求参数
+        :param body:内容
+        :return: AsyncResponse
+        """
+        return await self.request('POST', url, params=params, body=body)
+
+    async def patch(self, url, params=None, body=None):
+        """
+        patch请求
+        :param url:请求url
+        :param params:请求参数
+        :param body:内容
+        :return: AsyncResponse
+        """
+        return await self.request('PATCH', url, params=params, body=body)
+
+
+class AsyncZaoshuSdk(object):
+    """
+    造数异步SDK 这里整合里造数各功能类的异步版本
+    """
+
+    def __init__(self, api_key, api_secret, base_url='https://openapi.zaoshu.io/v2',
+                 **pool_options):
+        """
+        构造函数
+        :param api_key: 从造数获取的api key
+        :param api_secret: 从造数获取的api secret
+        :param base_url: 造数基本API接口
+        :param pool_options: 连接池、并发数及重试设置，见 AsyncZaoshuRequests
+        """
+        self._api_key = api_key
+        self._api_secret = api_secret
+
+        self._base_url = base_url
+        self.request = AsyncZaoshuRequests(api_key, api_secret, **pool_options)
+        self.instance = AsyncInstance(self._base_url, self.request)
+        self.user = AsyncUser(self._base_url, self.request)
+
+    def get_api_key(self):
+        """
+        get api_key
+        :return:
+        """
+        return self._api_key
+
+    def get_api_secret(self):
+        """
+        get api_secret
+        :return:
+        """
+        return self._api_secret
+
+    def get_base_url(self):
+        """
+        get api_base_url
+        :return:
+        """
+        return self._base_url
+
+    async def close(self):
+        """
+        关闭连接池
+        :return: None
+        """
+        await self.request.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def _call(func, key):
+    """
+    调用协程 func(key)，捕获异常
+    :return: BatchResult
+    """
+    try:
+        return BatchResult(key, await func(key), None)
+    except Exception as error:
+        return BatchResult(key, None, error)
+
+
+async def fan_out(func, keys, workers=10, ordered=True):
+    """
+    并发调用协程 func(key)，同时进行的请求不超过 workers，单个请求出错不会中断整个批次
+    :param func: 对每个 key 调用的协程函数
+    :param keys: key 的可迭代对象
+    :param workers: 同时进行的请求数
+    :param ordered: True 按 keys 的顺序产出结果，False 按完成的顺序产出
+    :return: 异步生成器 BatchResult
+    """
+    keys = iter(keys)
+    pending = []
+    try:
+        while True:
+            for key in keys:
+                pending.append(asyncio.ensure_future(_call(func, key)))
+                if len(pending) >= workers:
+                    break
+            if not pending:
+                return
+            if ordered:
+                result = await pending.pop(0)
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+                result = future.result()
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class AsyncInstance(object):
+    """
+    爬虫实例的异步版本
+    """
+
+    def __init__(self, base_url, request):
+        """
+        构造函数
+        :param base_url: 造数基本API接口
+        :param request: 造数异步HTTP对象
+        """
+        self._request = request
+        self.instance_list_url = base_url + "/instances"
+        self.instance_url = base_url + "/instance/:instance_id"
+        self.instance_schema_url = base_url + "/instance/:instance_id/schema"
+        self.task_list_url = base_url + "/instance/:instance_id/tasks"
+        self.task_url = base_url + "/instance/:instance_id/task/:task_id"
+        self.download_url = base_url + "/instance/:instance_id/task/:task_id/result/file"
+
+    async def list(self, params=None):
+        """
+        获取实例列表
+        :param params: 请求参数，如分页参数
+        :return: AsyncResponse
+        """
+        return await self._request.get(self.instance_list_url, params=params)
+
+    async def item(self, instance_id):
+        """
+        获取实例详情
+        :param instance_id: 运行实例的id编号，可以从实例列表中获取
+        :return: AsyncResponse
+        """
+        url = self.instance_url.replace(':instance_id', instance_id)
+        return await self._request.get(url)
+
+    async def schema(self, instance_id):
+        """
+        获取单个实例的数据格式
+        :param instance_id:
+        :return: AsyncResponse
+        """
+        url = self.instance_schema_url.replace(':instance_id', instance_id)
+        return await self._request.get(url)
+
+    async def task_list(self, instance_id, params=None):
+        """
+        获取某实例下的任务列表
+        :param instance_id:
+        :param params: 请求参数，如分页参数
+        :return: AsyncResponse
+        """
+        url = self.task_list_url.replace(':instance_id', instance_id)
+        return await self._request.get(url, params=params)
+
+    async def task(self, instance_id, task_id):
+        """
+        获取某实例下，单个任务详情
+        :param instance_id:
+        :param task_id:
+        :return: AsyncResponse
+        """
+        url = self.task_url.replace(':instance_id', instance_id).replace(':task_id', task_id)
+        return await self._request.get(url)
+
+    def _workers(self, workers):
+        """
+        批量请求的并发数，默认与连接池大小一致
+        """
+        return workers or self._request.concurrency or self._request.limit
+
+    def items_many(self, instance_ids, workers=None, ordered=True):
+        """
+        并发获取多个实例详情
+        :param instance_ids: 实例id的可迭代对象
+        :param workers: 同时进行的请求数
+        :param ordered: True 按输入顺序产出结果，False 按完成的顺序产出
+        :return: 异步生成器 BatchResult(instance_id, AsyncResponse, 异常)
+        """
+        return fan_out(self.item, instance_ids, self._workers(workers), ordered)
+
+    def schemas_many(self, instance_ids, workers=None, ordered=True):
+        """
+        并发获取多个实例的数据格式
+        :param instance_ids: 实例id的可迭代对象
+        :param workers: 同时进行的请求数
+        :param ordered: True 按输入顺序产出结果，False 按完成的顺序产出
+        :return: 异步生成器 BatchResult(instance_id, AsyncResponse, 异常)
+        """
+        return fan_out(self.schema, instance_ids, self._workers(workers), ordered)
+
+    def task_many(self, instance_id, task_ids, workers=None, ordered=True):
+        """
+        并发获取某实例下多个任务详情
+        :param instance_id: 实例id
+        :param task_ids: 任务id的可迭代对象
+        :param workers: 同时进行的请求数
+        :param ordered: True 按输入顺序产出结果，False 按完成的顺序产出
+        :return: 异步生成器 BatchResult(task_id, AsyncResponse, 异常)
+        """
+        return fan_out(lambda task_id: self.task(instance_id, task_id), task_ids,
+                       self._workers(workers), ordered)
+
+    async def download_run_data(self, instance_id, task_id, file_type='csv', save_file=False,
+                                save_path=None, fileobj=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        下载运行结果，保存文件或写入 fileobj 时按块流式写入，不在内存中缓存整个文件
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型
+        :param save_file: 是否保存文件
+        :param save_path: 保存目录
+        :param fileobj: 可写的文件对象，内容按块写入其中
+        :param chunk_size: 每次读取的字节数
+        :return: 保存文件的路径/写入的字节数/文件内容的元组
+        """
+        if save_file and not save_path:
+            raise Exception("save_path Error")
+
+        params = {"contentType": file_type}
+        url = self.download_url.replace(':instance_id', instance_id).replace(':task_id', task_id)
+
+        async with self._request.concurrency_limit():
+            response = await self._request.send('GET', url, params=params)
+            async with response:
+                default_file_name, suffix = parse_file_name(
+                    response.headers['content-disposition'])
+
+                if save_file:
+                    save_file_path = data_file_path(save_path, default_file_name, suffix)
+                    with open(save_file_path, 'wb') as file:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            file.write(chunk)
+                    return os.path.abspath(save_file_path)
+                elif fileobj is not None:
+                    size = 0
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        fileobj.write(chunk)
+                        size += len(chunk)
+                    return size
+                else:
+                    return decode_run_data(await response.read(), suffix)
+
+    async def run(self, instance_id, body=None):
+        """
+        运行实例
+        :param instance_id: 运行实例的id编号，可以从实例列表中获取
+        :return: AsyncResponse
+        """
+        if body is None:
+            body = b'{}'
+
+        url = self.instance_url.replace(':instance_id', instance_id)
+        return await self._request.post(url, body=body)
+
+    async def wait_for_task(self, instance_id, task_id, timeout=None, initial=POLL_INITIAL,
+                            maximum=POLL_MAXIMUM, finished=is_task_finished):
+        """
+        等待任务运行结束，以带随机抖动的指数退避查询任务详情
+        :param instance_id: 实例id
+        :param task_id: 任务id
+        :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+        :param initial: 第一次查询前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        :return: 任务结束时的任务详情 AsyncResponse
+        """
+        responses = await self.wait_for_tasks([(instance_id, task_id)], timeout=timeout,
+                                              initial=initial, maximum=maximum, finished=finished)
+        return responses[(instance_id, task_id)]
+
+    async def wait_for_tasks(self, keys, timeout=None, initial=POLL_INITIAL,
+                             maximum=POLL_MAXIMUM, finished=is_task_finished):
+        """
+        在一个轮询循环中等待多个任务运行结束，每个任务独立退避，到期的任务并发查询
+        5xx 及连接错误继续退避重试，其他 4xx 响应(如任务不存在)抛出异常
+        :param keys: (instance_id, task_id) 的可迭代对象
+        :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+        :param initial: 第一次查询前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        :return: {(instance_id, task_id): 任务结束时的任务详情 AsyncResponse}
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        waiting = {}
+        for key in keys:
+            backoff = Backoff(initial, maximum)
+            waiting[tuple(key)] = [loop.time() + backoff.next(), backoff]
+        finished_tasks = {}
+
+        while waiting:
+            wake = min(state[0] for state in waiting.values())
+            if deadline is not None and wake > deadline:
+                raise TimeoutError('tasks not finished: %s' % sorted(waiting))
+            await asyncio.sleep(max(0, wake - loop.time()))
+
+            now = loop.time()
+            due = [key for key, state in waiting.items() if state[0] <= now]
+            responses = await asyncio.gather(*[self.task(*key) for key in due],
+                                             return_exceptions=True)
+            for key, response in zip(due, responses):
+                if not isinstance(response, Exception) and finished(response):
+                    finished_tasks[key] = response
+                    del waiting[key]
+                else:
+                    if not isinstance(response, Exception):
+                        check_poll(key, response)
+                    # 查询出错按未结束处理，继续退避
+                    state = waiting[key]
+                    state[0] = loop.time() + state[1].next()
+        return finished_tasks
+
+    async def run_and_wait(self, instance_id, body=None, timeout=None, initial=POLL_INITIAL,
+                           maximum=POLL_MAXIMUM, finished=is_task_finished):
+        """
+        运行实例并等待新建的任务运行结束
+        :param instance_id: 运行实例的id编号，可以从实例列表中获取
+        :param body: 运行参数
+        :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+        :param initial: 第一次查询前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        :return: (任务id, 任务结束时的任务详情 AsyncResponse)
+        """
+        response = await self.run(instance_id, body=body)
+        if response.status_code != 200:
+            raise Exception("run Error: %d %s" % (response.status_code, response.text))
+        task_id = run_task_id(response)
+        return task_id, await self.wait_for_task(instance_id, task_id, timeout=timeout,
+                                                 initial=initial, maximum=maximum,
+                                                 finished=finished)
+
+    async def edit(self, instance_id, title=None, result_notify_uri=None):
+        """
+        实例编辑
+        :param instance_id: 实例id
+        :param title: 要修改的实例标题
+        :param result_notify_uri: 回调url
+        :return: AsyncResponse
+        """
+        body = {
+            'title': title,
+            'result_notify_uri': result_notify_uri
+        }
+        url = self.instance_url.replace(':instance_id', instance_id)
+        return await self._request.patch(url, body=body)
+
+
+class AsyncUser(object):
+    """
+    用户类的异步版本
+    """
+
+    def __init__(self, base_url, request):
+        """
+        构造函数
+        :param base_url: 造数基础API 接口
+        :param request: 造数异步HTTP类
+        """
+        self._base_url = base_url
+        self._request = request
+        self.account_url = self._base_url+'/user/account'
+        self.wallet_url = self._base_url+'/user/wallet'
+
+    async def account(self):
+        """
+        获得用户帐号信息
+        :return: AsyncResponse
+        """
+        return await self._request.get(self.account_url)
+
+    async def wallet(self):
+        """
+        获得用户钱包信息
+        :return: AsyncResponse
+        """
+        return await self._request.get(self.wallet_url)
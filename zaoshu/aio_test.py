@@ -0,0 +1,153 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+造数异步模块的单元测试，使用本地服务离线运行
+"""
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from zaoshu import AsyncZaoshuSdk
+from zaoshu import ZaoshuRequests
+from zaoshu.zaoshu_test import LocalServer, task_server
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def run(coroutine):
+    """在新的事件循环中运行协程"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp 未安装')
+class TestAsyncZaoshuSdk(unittest.TestCase):
+    """
+    造数异步SDK AsyncZaoshuSdk 单元测试
+    """
+
+    def test_task_signed(self):
+        """测试异步请求签名与连接复用"""
+        task = json.dumps({'data': {'id': 't1'}}).encode()
+        with LocalServer([(200, None, task)]) as server:
+            async def main():
+                async with AsyncZaoshuSdk('key', 'secret', base_url=server.url,
+                                          concurrency=4) as sdk:
+                    return await asyncio.gather(*[sdk.instance.task('i1', 't1')
+                                                  for _ in range(20)])
+            responses = run(main())
+
+        self.assertEqual([r.json()['data']['id'] for r in responses], ['t1'] * 20)
+        self.assertLessEqual(len(server.client_ports), 4)
+        method, path, headers, _ = server.requests[0]
+        self.assertEqual((method, path), ('GET', '/instance/i1/task/t1'))
+        sign = ZaoshuRequests.sign('secret', 'GET', headers=headers,
+                                   parame={'query': None, 'body': None})
+        self.assertEqual(headers['Authorization'], 'ZAOSHU key:' + sign)
+
+    def test_task_many(self):
+        """测试异步批量获取任务详情"""
+        def respond(handler):
+            task_id = handler.path.rsplit('/', 1)[-1]
+            if task_id == 't3':
+                return 404, None, b''
+            return 200, None, json.dumps({'data': {'id': task_id}}).encode()
+
+        task_ids = ['t%d' % i for i in range(30)]
+        with LocalServer([(200, None, respond)]) as server:
+            async def main():
+                async with AsyncZaoshuSdk('key', 'secret', base_url=server.url) as sdk:
+                    ordered = [result async for result in
+                               sdk.instance.task_many('i1', task_ids, workers=5)]
+                    unordered = [result async for result in
+                                 sdk.instance.task_many('i1', task_ids, ordered=False)]
+                    return ordered, unordered
+            ordered, unordered = run(main())
+        self.assertEqual([result.key for result in ordered], task_ids)
+        self.assertEqual(ordered[3].response.status_code, 404)
+        self.assertEqual(sorted(result.key for result in unordered), sorted(task_ids))
+
+    def test_run_and_wait(self):
+        """测试异步运行实例并等待任务结束"""
+        with task_server({'t1': 1}) as server:
+            async def main():
+                async with AsyncZaoshuSdk('key', 'secret', base_url=server.url) as sdk:
+                    result = await sdk.instance.run_and_wait('i1', initial=0.01)
+                    responses = await sdk.instance.wait_for_tasks([('i1', 't1')], initial=0.01)
+                    return result, responses
+            (task_id, response), responses = run(main())
+        self.assertEqual(task_id, 't9')
+        self.assertEqual(response.json()['data']['status'], 'success')
+        self.assertEqual(list(responses), [('i1', 't1')])
+
+    def test_wait_for_tasks(self):
+        """测试一个轮询循环等待多个任务，任务不存在时抛出异常"""
+        polls = {'t1': 0, 't2': 3, 't3': 1}
+        with task_server(polls, missing=('t4',)) as server:
+            async def main():
+                async with AsyncZaoshuSdk('key', 'secret', base_url=server.url) as sdk:
+                    responses = await sdk.instance.wait_for_tasks(
+                        [('i1', task_id) for task_id in polls], initial=0.01, maximum=0.05)
+                    with self.assertRaises(Exception) as context:
+                        await sdk.instance.wait_for_task('i1', 't4', initial=0.01)
+                    return responses, context.exception
+            responses, error = run(main())
+        self.assertEqual(sorted(responses), [('i1', 't1'), ('i1', 't2'), ('i1', 't3')])
+        self.assertIn('i1/t4 404', str(error))
+        self.assertEqual(len(server.requests), sum(polls.values()) + len(polls) + 1)
+
+    def test_run_body(self):
+        """测试运行实例的请求内容"""
+        with LocalServer([(200, None, b'{}')]) as server:
+            async def main():
+                async with AsyncZaoshuSdk('key', 'secret', base_url=server.url) as sdk:
+                    return await sdk.instance.run('i1', {'a': 1})
+            response = run(main())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests[0][0], 'POST')
+        self.assertEqual(server.requests[0][3], b'{"a": 1}')
+
+    def test_download_run_data(self):
+        """测试异步流式下载"""
+        content = b'a,b\n' + b'1,2\n' * 10000
+        headers = {'content-disposition': "attachment; filename*=UTF-8''result.csv"}
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        with LocalServer([(200, headers, content)]) as server:
+            async def main():
+                async with AsyncZaoshuSdk('key', 'secret', base_url=server.url) as sdk:
+                    fileobj = io.BytesIO()
+                    size = await sdk.instance.download_run_data('i1', 't1', fileobj=fileobj,
+                                                                chunk_size=1024)
+                    path = await sdk.instance.download_run_data(
+                        'i1', 't1', save_file=True, save_path=os.path.relpath(save_dir, '/'))
+                    data = await sdk.instance.download_run_data('i1', 't1')
+                    return size, fileobj.getvalue(), path, data
+            cwd = os.getcwd()
+            os.chdir('/')
+            try:
+                size, written, path, data = run(main())
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(size, len(content))
+        self.assertEqual(written, content)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(data, (content.decode(),))
+        self.assertEqual(server.requests[0][1], '/instance/i1/task/t1/result/file?contentType=csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
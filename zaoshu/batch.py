@@ -0,0 +1,69 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+batch 模块提供批量请求的并发执行：有界线程池，按输入顺序或完成顺序产出结果，单个请求出错不中断批次
+"""
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 批量请求中单个请求的结果，key 为请求的id，出错时 response 为 None、error 为异常
+BatchResult = namedtuple('BatchResult', ['key', 'response', 'error'])
+
+
+def _call(func, key):
+    """
+    调用 func(key)，捕获异常
+    :return: BatchResult
+    """
+    try:
+        return BatchResult(key, func(key), None)
+    except Exception as error:
+        return BatchResult(key, None, error)
+
+
+def fan_out(func, keys, workers=10, ordered=True, executor=None):
+    """
+    在有界线程池中并发调用 func(key)，同时进行的请求不超过 workers 的两倍，
+    单个请求出错不会中断整个批次
+    :param func: 对每个 key 调用的函数
+    :param keys: key 的可迭代对象
+    :param workers: 线程数
+    :param ordered: True 按 keys 的顺序产出结果，False 按完成的顺序产出
+    :param executor: 复用的线程池，由调用方负责关闭；为None时为本批次新建线程池
+    :return: 生成器 BatchResult
+    """
+    if executor is not None:
+        for result in _submit(executor, func, keys, workers, ordered):
+            yield result
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in _submit(executor, func, keys, workers, ordered):
+            yield result
+
+
+def _submit(executor, func, keys, workers, ordered):
+    """
+    向线程池提交 func(key)，同时进行的请求不超过 workers 的两倍
+    :return: 生成器 BatchResult
+    """
+    if ordered:
+        pending = deque()
+        for key in keys:
+            pending.append(executor.submit(_call, func, key))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    else:
+        pending = set()
+        for key in keys:
+            pending.add(executor.submit(_call, func, key))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
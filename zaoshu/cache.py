@@ -0,0 +1,381 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+cache 模块提供实例列表、实例详情、数据格式、账户信息等元数据的响应缓存：
+按接口设置有效期，按条目数和字节数LRU淘汰，可选内存或磁盘存储，过期后使用 ETag/Last-Modified 重新验证
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from time import time
+
+from zaoshu.transport import Headers, RequestsTransport
+
+# 各接口默认的缓存有效期(秒)，按URL模板的结尾匹配
+DEFAULT_TTLS = {
+    '/instances': 60,
+    '/instance/:instance_id': 300,
+    '/instance/:instance_id/schema': 3600,
+    '/user/account': 300,
+}
+
+
+class CacheEntry(object):
+    """
+    缓存的响应
+    """
+
+    __slots__ = ('key', 'url', 'status_code', 'headers', 'content', 'stored_at')
+
+    def __init__(self, key, url, status_code, headers, content, stored_at=None):
+        self.key = key
+        self.url = url
+        self.status_code = status_code
+        self.headers = dict(headers)
+        self.content = content
+        self.stored_at = time() if stored_at is None else stored_at
+
+    @property
+    def size(self):
+        """
+        占用的字节数(近似)
+        """
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    def validators(self):
+        """
+        重新验证使用的条件请求头
+        :return: dict
+        """
+        headers = Headers(self.headers)
+        validators = {}
+        if headers.get('etag'):
+            validators['If-None-Match'] = headers['etag']
+        if headers.get('last-modified'):
+            validators['If-Modified-Since'] = headers['last-modified']
+        return validators
+
+    def to_response(self, transport=None):
+        """
+        还原为响应
+        :param transport: 发送请求的传输，返回与其响应相同类型的对象，默认为 requests.Response
+        :return: requests.Response
+        """
+        if transport is None:
+            transport = RequestsTransport()
+        return transport.build_response(self.url, self.status_code, self.headers, self.content)
+
+    @classmethod
+    def from_response(cls, key, response):
+        """
+        从 requests.Response 创建
+        :param key: 缓存键
+        :param response: requests.Response
+        :return: CacheEntry
+        """
+        return cls(key, response.url, response.status_code, response.headers, response.content)
+
+
+class MemoryCache(object):
+    """
+    进程内缓存，按条目数和字节数LRU淘汰，线程安全
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        """
+        构造函数
+        :param max_entries: 最大条目数
+        :param max_bytes: 最大字节数
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        获取缓存
+        :param key: 缓存键
+        :return: CacheEntry，不存在时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, entry):
+        """
+        写入缓存，超出限制时淘汰最久未使用的条目
+        :param entry: CacheEntry
+        :return: None
+        """
+        with self._lock:
+            self._remove(entry.key)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[entry.key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, match):
+        """
+        删除缓存键满足条件的缓存
+        :param match: 接收缓存键，返回是否删除的函数
+        :return: None
+        """
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                self._remove(key)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+class DiskCache(object):
+    """
+    磁盘缓存，每个条目一个文件(首行为json元数据，其后为响应内容)，按条目数和字节数LRU淘汰，
+    可在多个进程间共用
+    """
+
+    SUFFIX = '.cache'
+
+    def __init__(self, path, max_entries=4096, max_bytes=256 * 1024 * 1024):
+        """
+        构造函数
+        :param path: 缓存目录
+        :param max_entries: 最大条目数
+        :param max_bytes: 最大字节数(按缓存文件大小计算)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() +
+                            self.SUFFIX)
+
+    def _read(self, file_path):
+        with open(file_path, 'rb') as file:
+            meta = json.loads(file.readline().decode('utf-8'))
+            content = file.read()
+        return CacheEntry(meta['key'], meta['url'], meta['status_code'], meta['headers'],
+                          content, meta['stored_at'])
+
+    def get(self, key):
+        """
+        获取缓存
+        :param key: 缓存键
+        :return: CacheEntry，不存在时返回 None
+        """
+        file_path = self._file(key)
+        try:
+            entry = self._read(file_path)
+            # 以修改时间记录最近使用时间
+            os.utime(file_path, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        return entry if entry.key == key else None
+
+    def set(self, entry):
+        """
+        原子地写入缓存，超出限制时淘汰最久未使用的条目
+        :param entry: CacheEntry
+        :return: None
+        """
+        file_path = self._file(entry.key)
+        temp_path = '%s.%d.%d.tmp' % (file_path, os.getpid(), threading.get_ident())
+        meta = {
+            'key': entry.key,
+            'url': entry.url,
+            'status_code': entry.status_code,
+            'headers': entry.headers,
+            'stored_at': entry.stored_at,
+        }
+        with open(temp_path, 'wb') as file:
+            file.write(json.dumps(meta).encode('utf-8') + b'\n')
+            file.write(entry.content)
+        os.replace(temp_path, file_path)
+        self._evict()
+
+    def _files(self):
+        """
+        缓存文件列表，按最近使用时间排序
+        :return: [(mtime, size, path), ...]
+        """
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith(self.SUFFIX):
+                file_path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file_path))
+        files.sort()
+        return files
+
+    def _evict(self):
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        while files and (len(files) > self.max_entries or total > self.max_bytes):
+            _, size, file_path = files.pop(0)
+            total -= size
+            self._unlink(file_path)
+
+    @staticmethod
+    def _unlink(file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def delete(self, match):
+        """
+        删除缓存键满足条件的缓存
+        :param match: 接收缓存键，返回是否删除的函数
+        :return: None
+        """
+        for _, _, file_path in self._files():
+            try:
+                with open(file_path, 'rb') as file:
+                    key = json.loads(file.readline().decode('utf-8'))['key']
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+            if match(key):
+                self._unlink(file_path)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        for _, _, file_path in self._files():
+            self._unlink(file_path)
+
+
+class ResponseCache(object):
+    """
+    元数据响应缓存，只缓存设置了有效期的接口的 GET 200 响应
+    """
+
+    def __init__(self, backend=None, ttls=None, namespace=''):
+        """
+        构造函数
+        :param backend: MemoryCache 或 DiskCache，默认为 MemoryCache
+        :param ttls: {URL模板结尾: 有效期(秒)}，覆盖 DEFAULT_TTLS 中的对应项，有效期为 None 时不缓存
+        :param namespace: 缓存键的前缀，多个账号共用一个存储时区分各自的响应
+        """
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.namespace = namespace
+        self._endpoint_ttls = {}
+
+    def scoped(self, namespace):
+        """
+        获得共用存储及有效期设置、使用另一个键前缀的缓存
+        :param namespace: 缓存键的前缀，如 api key
+        :return: ResponseCache
+        """
+        cache = ResponseCache(self.backend, namespace=namespace)
+        cache.ttls = self.ttls
+        cache._endpoint_ttls = self._endpoint_ttls
+        return cache
+
+    def ttl(self, endpoint):
+        """
+        获得接口的有效期
+        :param endpoint: URL模板，如 https://openapi.zaoshu.io/v2/instance/:instance_id
+        :return: 秒，不缓存时返回 None
+        """
+        if endpoint not in self._endpoint_ttls:
+            matched = [suffix for suffix in self.ttls if endpoint.endswith(suffix)]
+            self._endpoint_ttls[endpoint] = self.ttls[max(matched, key=len)] if matched else None
+        return self._endpoint_ttls[endpoint]
+
+    def key(self, url, params=None):
+        """
+        获得缓存键
+        :param url: 请求url
+        :param params: 请求参数
+        :return: str
+        """
+        if not params:
+            return self.namespace + url
+        return self.namespace + url + '?' + '&'.join('%s=%s' % (k, params[k])
+                                                     for k in sorted(params))
+
+    def get(self, key):
+        """
+        获取缓存
+        :param key: 缓存键
+        :return: CacheEntry，不存在时返回 None
+        """
+        return self.backend.get(key)
+
+    def fresh(self, entry, endpoint):
+        """
+        缓存是否仍在有效期内
+        :param entry: CacheEntry
+        :param endpoint: URL模板
+        :return: bool
+        """
+        ttl = self.ttl(endpoint)
+        return ttl is not None and time() - entry.stored_at < ttl
+
+    def store(self, key, response):
+        """
+        写入缓存
+        :param key: 缓存键
+        :param response: requests.Response
+        :return: CacheEntry
+        """
+        entry = CacheEntry.from_response(key, response)
+        self.backend.set(entry)
+        return entry
+
+    def refresh(self, entry):
+        """
+        重新验证成功后更新缓存的写入时间
+        :param entry: CacheEntry
+        :return: CacheEntry
+        """
+        entry.stored_at = time()
+        self.backend.set(entry)
+        return entry
+
+    def invalidate(self, url):
+        """
+        使该url及其下级url(如实例详情下的数据格式、任务列表)的缓存失效
+        :param url: 请求url
+        :return: None
+        """
+        url = self.namespace + url
+        self.backend.delete(lambda key: key == url or key.startswith(url + '/') or
+                            key.startswith(url + '?'))
+
+    def clear(self):
+        """
+        清空缓存，设置了键前缀时只清除该前缀的缓存
+        """
+        if self.namespace:
+            self.backend.delete(lambda key: key.startswith(self.namespace))
+        else:
+            self.backend.clear()
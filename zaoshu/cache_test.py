@@ -0,0 +1,137 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+元数据响应缓存的单元测试
+"""
+import json
+import shutil
+import tempfile
+import unittest
+from time import sleep
+
+from zaoshu import Instance
+from zaoshu import User
+from zaoshu import ZaoshuRequests
+from zaoshu.cache import ResponseCache, MemoryCache, DiskCache, CacheEntry
+from zaoshu.zaoshu_test import LocalServer
+
+
+def etag_server():
+    """返回带 ETag 的实例详情，请求头 If-None-Match 匹配时返回 304"""
+    def respond(handler):
+        if handler.headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        body = json.dumps({'data': {'id': 'i1', 'title': handler.path}}).encode()
+        return 200, {'ETag': '"v1"', 'Content-Type': 'application/json'}, body
+    return LocalServer([(200, None, respond)])
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    元数据响应缓存 ResponseCache 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = etag_server().__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def instance(self, cache):
+        """创建使用缓存的 Instance"""
+        request = ZaoshuRequests('key', 'secret', cache=cache)
+        self.addCleanup(request.close)
+        return Instance(self.server.url, request)
+
+    def test_ttl(self):
+        """测试有效期内直接返回缓存"""
+        instance = self.instance(ResponseCache())
+        first = instance.item('i1')
+        second = instance.item('i1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(self.server.requests), 1)
+        # 任务详情默认不缓存
+        instance.task('i1', 't1')
+        instance.task('i1', 't1')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_revalidate(self):
+        """测试过期后使用 ETag 重新验证"""
+        instance = self.instance(ResponseCache(ttls={'/instance/:instance_id': 0.05}))
+        instance.item('i1')
+        sleep(0.1)
+        response = instance.item('i1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['id'], 'i1')
+        self.assertEqual(self.server.requests[-1][2].get('If-None-Match'), '"v1"')
+        # 重新验证后重新计算有效期
+        instance.item('i1')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_invalidate(self):
+        """测试运行和编辑实例使缓存失效"""
+        instance = self.instance(ResponseCache())
+        instance.item('i1')
+        instance.schema('i1')
+        instance.item('i10')
+        instance.list()
+        instance.edit('i1', title='new')
+        count = len(self.server.requests)
+        instance.item('i1')
+        instance.schema('i1')
+        instance.list()
+        instance.item('i10')
+        self.assertEqual(len(self.server.requests), count + 3)
+
+    def test_user_account(self):
+        """测试账户信息缓存"""
+        request = ZaoshuRequests('key', 'secret', cache=ResponseCache())
+        self.addCleanup(request.close)
+        user = User(self.server.url, request)
+        user.account()
+        user.account()
+        user.wallet()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_disk_backend(self):
+        """测试磁盘缓存可在多个 ResponseCache 间共用"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.instance(ResponseCache(DiskCache(path))).item('i1')
+        response = self.instance(ResponseCache(DiskCache(path))).item('i1')
+        self.assertEqual(response.json()['data']['id'], 'i1')
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class TestCacheBackend(unittest.TestCase):
+    """
+    缓存存储单元测试
+    """
+
+    def check_lru(self, backend):
+        """测试按条目数和字节数淘汰最久未使用的条目"""
+        for key in 'abc':
+            backend.set(CacheEntry(key, key, 200, {}, b'x' * 1000))
+            sleep(0.01)
+        backend.get('a')
+        sleep(0.01)
+        backend.set(CacheEntry('d', 'd', 200, {}, b'x' * 1000))
+        self.assertIsNone(backend.get('b'))
+        self.assertIsNotNone(backend.get('a'))
+        backend.set(CacheEntry('e', 'e', 200, {}, b'x' * 2600))
+        self.assertEqual([key for key in 'acde' if backend.get(key) is not None], ['e'])
+
+    def test_memory(self):
+        """测试内存缓存"""
+        self.check_lru(MemoryCache(max_entries=3, max_bytes=3500))
+
+    def test_disk(self):
+        """测试磁盘缓存"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.check_lru(DiskCache(path, max_entries=3, max_bytes=3500))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+coalesce 模块提供请求合并(single-flight)：同一时刻多个相同的读请求只发送一次，
+结果(或异常)由所有等待者共用。SingleFlight 用于多线程，AsyncSingleFlight 用于 asyncio
+"""
+import threading
+
+
+def flight_key(method, url, params=None, headers=None):
+    """
+    请求合并的键，请求类型、url、查询参数及额外请求头均相同的请求才会合并
+    :param method: 请求类型
+    :param url: 请求url
+    :param params: 请求参数
+    :param headers: 额外的请求头
+    :return: tuple
+    """
+    return (method, url,
+            tuple(sorted((str(key), repr(value)) for key, value in (params or {}).items())),
+            tuple(sorted((str(key).lower(), repr(value))
+                         for key, value in (headers or {}).items())))
+
+
+class _Call(object):
+    """
+    进行中的调用
+    """
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    多线程的请求合并，线程安全
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # 实际执行的次数及共用结果的次数
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, func):
+        """
+        执行 func，相同 key 的调用正在进行时等待并共用其结果
+        :param key: 键
+        :param func: 无参数的函数
+        :return: func 的返回值，共用时所有调用方得到同一个对象
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight(object):
+    """
+    asyncio 的请求合并，需在同一个事件循环中使用；asyncio 在第一次调用时才导入
+    调用在独立的 Task 中执行，某个等待者被取消不影响其他等待者
+    """
+
+    def __init__(self):
+        self._calls = {}
+        # 实际执行的次数及共用结果的次数
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, func):
+        """
+        执行 func，相同 key 的调用正在进行时等待并共用其结果
+        :param key: 键
+        :param func: 无参数、返回协程的函数
+        :return: 协程的返回值
+        """
+        import asyncio
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都被取消时，避免 "Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
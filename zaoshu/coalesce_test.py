@@ -0,0 +1,170 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+请求合并的单元测试
+"""
+import asyncio
+import threading
+import unittest
+from time import sleep
+
+from zaoshu import ZaoshuSdk, AsyncZaoshuSdk
+from zaoshu.coalesce import SingleFlight, AsyncSingleFlight, flight_key
+from zaoshu.mock import MockServer
+from zaoshu.transport import MemoryTransport
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def concurrently(func, count):
+    """在 count 个线程中同时调用 func，返回结果列表"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = func()
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    多线程请求合并 SingleFlight 单元测试
+    """
+
+    def test_shared(self):
+        """测试同时进行的相同调用只执行一次"""
+        flights = SingleFlight()
+        calls = []
+
+        def func():
+            calls.append(1)
+            sleep(0.2)
+            return object()
+
+        results = concurrently(lambda: flights.do('key', func), 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(id(result) for result in results)), 1)
+        self.assertEqual((flights.calls, flights.shared), (1, 7))
+        # 调用结束后不再共用
+        flights.do('key', func)
+        self.assertEqual(len(calls), 2)
+
+    def test_error(self):
+        """测试异常由所有等待者共用"""
+        flights = SingleFlight()
+
+        def func():
+            sleep(0.2)
+            raise ValueError('failed')
+
+        results = concurrently(lambda: flights.do('key', func), 4)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flights.calls, 1)
+
+    def test_key(self):
+        """测试请求合并的键"""
+        self.assertEqual(flight_key('GET', 'u', {'a': 1, 'b': 2}),
+                         flight_key('GET', 'u', {'b': 2, 'a': 1}))
+        self.assertNotEqual(flight_key('GET', 'u', {'a': 1}), flight_key('GET', 'u', {'a': '1'}))
+        self.assertNotEqual(flight_key('GET', 'u', headers={'Range': 'bytes=0-'}),
+                            flight_key('GET', 'u'))
+
+
+class TestCoalesce(unittest.TestCase):
+    """
+    ZaoshuRequests 请求合并单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(latency=0.2)
+        self.addCleanup(self.server.stop)
+
+    def test_coalesce(self):
+        """测试同时进行的相同 GET 请求只发送一次"""
+        sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                        transport=MemoryTransport(self.server.handle), coalesce=True)
+        results = concurrently(lambda: sdk.instance.item('instance-0'), 10)
+        self.assertEqual(self.server.requests, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(results[0].json()['data']['id'], 'instance-0')
+
+        concurrently(lambda: sdk.instance.task('instance-0', 'task-0'), 2)
+        concurrently(lambda: sdk.instance.task('instance-0', 'task-1'), 2)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_disabled(self):
+        """测试默认不合并"""
+        sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                        transport=MemoryTransport(self.server.handle))
+        concurrently(lambda: sdk.instance.item('instance-0'), 4)
+        self.assertEqual(self.server.requests, 4)
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    """
+    asyncio 请求合并 AsyncSingleFlight 单元测试
+    """
+
+    def run_async(self, coroutine):
+        """在新的事件循环中运行协程"""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_shared(self):
+        """测试共用结果，某个等待者被取消不影响其他等待者"""
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return 'result'
+
+        async def main():
+            first = asyncio.ensure_future(flights.do('key', func))
+            others = [asyncio.ensure_future(flights.do('key', func)) for _ in range(4)]
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await asyncio.gather(*others)
+
+        self.assertEqual(self.run_async(main()), ['result'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((flights.calls, flights.shared), (1, 4))
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp 未安装')
+    def test_sdk(self):
+        """测试 AsyncZaoshuSdk 合并同时进行的相同请求"""
+        server = MockServer(latency=0.2).start()
+        self.addCleanup(server.stop)
+
+        async def main():
+            async with AsyncZaoshuSdk('mock-key', 'mock-secret', base_url=server.url,
+                                      coalesce=True) as sdk:
+                return await asyncio.gather(*[sdk.instance.schema('instance-0')
+                                              for _ in range(10)])
+
+        responses = self.run_async(main())
+        self.assertEqual(server.requests, 1)
+        self.assertEqual([response.status_code for response in responses], [200] * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+codec 模块提供可替换的 JSON 编解码器：默认使用标准库 json，安装了 orjson 或 ujson 时可选用。
+编码结果为 bytes，请求内容按编码后的字节签名并原样发送；解码接受 bytes 或 str
+"""
+# 可按名称获得的编解码器，auto 为已安装的最快的一个
+CODECS = ('json', 'orjson', 'ujson', 'auto')
+
+
+class JsonCodec(object):
+    """
+    JSON 编解码器的接口
+    """
+
+    name = None
+
+    def dumps(self, obj):
+        """
+        编码
+        :param obj: 要编码的对象
+        :return: bytes
+        """
+        raise NotImplementedError
+
+    def loads(self, data):
+        """
+        解码
+        :param data: bytes 或 str
+        :return: 解码后的对象
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self.name)
+
+
+class StdlibCodec(JsonCodec):
+    """
+    标准库 json，编码结果与 json.dumps(obj).encode('utf-8') 一致
+    """
+
+    name = 'json'
+
+    def dumps(self, obj):
+        import json
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        import json
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    orjson，编码结果为紧凑的 utf-8(不转义非 ASCII 字符)
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+    def loads(self, data):
+        return self._loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    """
+    ujson
+    """
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+        self._loads = ujson.loads
+
+    def dumps(self, obj):
+        return self._dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        return self._loads(data)
+
+
+# 默认的编解码器
+STDLIB = StdlibCodec()
+
+
+def get_codec(codec=None):
+    """
+    获得编解码器
+    :param codec: None/json 为标准库，orjson、ujson，auto 为已安装的 orjson > ujson > json，
+                  或有 dumps/loads 方法的编解码器对象
+    :return: JsonCodec
+    """
+    if codec is None or codec == 'json':
+        return STDLIB
+    if codec == 'orjson':
+        return OrjsonCodec()
+    if codec == 'ujson':
+        return UjsonCodec()
+    if codec == 'auto':
+        for create in (OrjsonCodec, UjsonCodec):
+            try:
+                return create()
+            except ImportError:
+                pass
+        return STDLIB
+    if isinstance(codec, str):
+        raise ValueError('unknown json codec: %s' % codec)
+    return codec
+
+
+def encode_body(body, codec=STDLIB):
+    """
+    把请求内容编码为发送的字节
+    :param body: None、str(按 utf-8 编码)、bytes(原样)或由编解码器编码的对象
+    :param codec: JsonCodec
+    :return: bytes，没有内容时返回 None
+    """
+    if body is None or isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return codec.dumps(body)
+
+
+def response_codec(response):
+    """
+    获得发送请求时使用的编解码器
+    :param response: ZaoshuRequests 返回的响应
+    :return: JsonCodec，没有设置时为标准库
+    """
+    return getattr(response, 'codec', None) or STDLIB
+
+
+def decode_json(response):
+    """
+    用发送请求时的编解码器解析json响应内容，
+    requests.Response.json 总是使用标准库，SDK 内部统一使用本函数
+    :param response: ZaoshuRequests 返回的响应
+    :return: 解码后的对象
+    """
+    return response_codec(response).loads(response.content)
@@ -0,0 +1,127 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+JSON 编解码器的单元测试
+"""
+import json
+import unittest
+
+from zaoshu import ZaoshuSdk, ZaoshuSigner
+from zaoshu.codec import STDLIB, JsonCodec, decode_json, encode_body, get_codec
+from zaoshu.mock import MockServer
+from zaoshu.transport import MemoryTransport
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RecordingCodec(JsonCodec):
+    """记录调用次数的编解码器"""
+
+    name = 'recording'
+
+    def __init__(self):
+        self.calls = []
+
+    def dumps(self, obj):
+        self.calls.append('dumps')
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def loads(self, data):
+        self.calls.append('loads')
+        return json.loads(data)
+
+
+class TestCodec(unittest.TestCase):
+    """
+    get_codec 及编码单元测试
+    """
+
+    def test_get_codec(self):
+        """测试按名称获得编解码器"""
+        self.assertIs(get_codec(), STDLIB)
+        self.assertIs(get_codec('json'), STDLIB)
+        self.assertIsInstance(get_codec('auto'), JsonCodec)
+        codec = RecordingCodec()
+        self.assertIs(get_codec(codec), codec)
+        with self.assertRaises(ValueError):
+            get_codec('simplejson')
+
+    def test_encode_body(self):
+        """测试标准库编码结果不变，str/bytes 原样发送"""
+        body = {'title': '中文', 'page': [1, 2]}
+        self.assertEqual(encode_body(body), json.dumps(body).encode('utf-8'))
+        self.assertEqual(encode_body('{"a": "中"}'), '{"a": "中"}'.encode('utf-8'))
+        self.assertEqual(encode_body(b'{}'), b'{}')
+        self.assertIsNone(encode_body(None))
+        self.assertEqual(STDLIB.loads('{"a": 1}'.encode('utf-8')), {'a': 1})
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson(self):
+        """测试 orjson 编解码"""
+        codec = get_codec('orjson')
+        self.assertEqual(codec.dumps({'a': '中'}), '{"a":"中"}'.encode('utf-8'))
+        self.assertEqual(codec.loads(b'{"a": [1]}'), {'a': [1]})
+        self.assertEqual(get_codec('auto').name, 'orjson')
+
+    def test_sign_bytes(self):
+        """测试 bytes 内容按原样签名，与 utf-8 编码后的 str 结果一致"""
+        signer = ZaoshuSigner('key', 'secret')
+        date = 'Mon, 19 Oct 2026 00:00:00 GMT'
+        body = '{"title": "中文"}'
+        self.assertEqual(signer.sign('POST', date, None, body.encode('utf-8')),
+                         signer.sign('POST', date, None, body))
+        self.assertNotEqual(signer.sign('POST', date, None, b'{"title":"x"}'),
+                            signer.sign('POST', date, None, b'{"title": "x"}'))
+
+
+class TestRequestCodec(unittest.TestCase):
+    """
+    ZaoshuRequests 使用编解码器的单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(instances=2, tasks=2)
+        self.addCleanup(self.server.stop)
+        self.transport = MemoryTransport(self.server.handle)
+        self.codec = RecordingCodec()
+        self.sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                             transport=self.transport, json_codec=self.codec, max_retries=0)
+
+    def test_body(self):
+        """测试请求内容由编解码器编码一次，签名覆盖实际发送的字节"""
+        response = self.sdk.instance.run('instance-0', body={'keyword': '中文'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.transport.requests[-1][3], '{"keyword":"中文"}'.encode('utf-8'))
+        self.assertEqual(self.codec.calls, ['dumps'])
+
+        response = self.sdk.instance.edit('instance-0', title='新标题')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sdk.instance.get_instance('instance-0').title, '新标题')
+
+    def test_response(self):
+        """测试响应由编解码器解码"""
+        response = self.sdk.instance.task('instance-0', 'task-0')
+        self.assertIs(response.codec, self.codec)
+        self.assertEqual(decode_json(response)['data']['id'], 'task-0')
+        self.assertEqual(response.json()['data']['id'], 'task-0')
+        self.assertEqual(self.codec.calls, ['loads', 'loads'])
+        tasks = list(self.sdk.instance.iter_tasks('instance-0', prefetch=False))
+        self.assertEqual(len(tasks), 2)
+
+    def test_models(self):
+        """测试模型的字段由编解码器解码"""
+        tasks = self.sdk.instance.get_tasks('instance-0')
+        del self.codec.calls[:]
+        self.assertEqual(tasks[1].id, 'task-1')
+        self.assertEqual(tasks[0].to_dict()['id'], 'task-0')
+        self.assertEqual(self.sdk.instance.get_task('instance-0', 'task-0').status, 'success')
+        self.assertEqual(self.codec.calls, ['loads', 'loads', 'loads'])
+
+
+if __name__ == '__main__':
+    unittest.main()
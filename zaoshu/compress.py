@@ -0,0 +1,266 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+compress 模块提供响应内容压缩的协商及流式解压：标准库支持 gzip、deflate，
+安装了 brotli 或 zstandard(Python 3.14 起为标准库 compression.zstd)时同时支持 br、zstd。
+解压按块进行，内存占用与响应大小无关
+"""
+import zlib
+from importlib.util import find_spec
+
+# 流式解压时每次从原始字节流读取的字节数
+READ_CHUNK_SIZE = 64 * 1024
+# 不压缩，分段下载及断点续传使用，使 Range 的字节位置对应文件本身
+IDENTITY = 'identity'
+
+_accept_encoding = None
+
+
+def _installed(name):
+    """
+    模块是否已安装，不导入模块本身
+    """
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def supported_encodings():
+    """
+    当前环境支持解压的编码
+    :return: tuple，按优先顺序
+    """
+    encodings = ['gzip', 'deflate']
+    if _installed('brotli') or _installed('brotlicffi'):
+        encodings.append('br')
+    if _installed('zstandard') or _installed('compression.zstd'):
+        encodings.append('zstd')
+    return tuple(encodings)
+
+
+def accept_encoding():
+    """
+    请求头 Accept-Encoding 的值，第一次调用时检测
+    :return: str
+    """
+    global _accept_encoding
+    if _accept_encoding is None:
+        _accept_encoding = ', '.join(supported_encodings())
+    return _accept_encoding
+
+
+class _DeflateDecoder(object):
+    """
+    deflate 解压，兼容带 zlib 头及不带头(raw deflate)的内容
+    """
+
+    def __init__(self):
+        self._first = True
+        self._data = b''
+        self._decoder = zlib.decompressobj()
+
+    def decompress(self, data):
+        if not self._first:
+            return self._decoder.decompress(data)
+        # 保留已收到的内容，zlib 头校验失败时按 raw deflate 重新解压
+        self._data += data
+        try:
+            decompressed = self._decoder.decompress(data)
+        except zlib.error:
+            # 服务器发送的是不带 zlib 头的 raw deflate
+            self._first = False
+            self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            try:
+                return self.decompress(self._data)
+            finally:
+                self._data = None
+        if decompressed:
+            self._first = False
+            self._data = None
+        return decompressed
+
+    def flush(self):
+        return self._decoder.flush()
+
+
+class _GzipDecoder(object):
+    """
+    gzip 解压，支持多个 gzip 成员首尾相连的内容
+    """
+
+    def __init__(self):
+        self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        output = []
+        while data:
+            output.append(self._decoder.decompress(data))
+            data = self._decoder.unused_data
+            if not data:
+                break
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return b''.join(output)
+
+    def flush(self):
+        return self._decoder.flush()
+
+
+class _BrotliDecoder(object):
+    """
+    brotli 解压
+    """
+
+    def __init__(self):
+        try:
+            import brotli
+        except ImportError:
+            import brotlicffi as brotli
+        self._decoder = brotli.Decompressor()
+
+    def decompress(self, data):
+        if hasattr(self._decoder, 'process'):
+            return self._decoder.process(data)
+        return self._decoder.decompress(data)
+
+    def flush(self):
+        return b''
+
+
+class _ZstdDecoder(object):
+    """
+    zstd 解压
+    """
+
+    def __init__(self):
+        try:
+            from compression.zstd import ZstdDecompressor
+            self._decoder = ZstdDecompressor()
+        except ImportError:
+            import zstandard
+            self._decoder = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self._decoder.decompress(data)
+
+    def flush(self):
+        return b''
+
+
+_DECODERS = {
+    'gzip': _GzipDecoder,
+    'x-gzip': _GzipDecoder,
+    'deflate': _DeflateDecoder,
+    'br': _BrotliDecoder,
+    'zstd': _ZstdDecoder,
+}
+
+
+def content_encodings(headers):
+    """
+    响应头 Content-Encoding 中的编码，按解压的顺序
+    :param headers: 响应头
+    :return: list，没有压缩时为空
+    """
+    value = headers.get('content-encoding') or ''
+    encodings = [item.strip().lower() for item in value.split(',')]
+    return [item for item in reversed(encodings) if item and item != IDENTITY]
+
+
+class Decompressor(object):
+    """
+    按 Content-Encoding 依次解压的增量解压器
+    """
+
+    def __init__(self, encodings):
+        """
+        构造函数
+        :param encodings: 编码列表，按解压的顺序
+        """
+        unsupported = [item for item in encodings if item not in _DECODERS]
+        if unsupported:
+            raise Exception("content encoding Error: %s" % ', '.join(unsupported))
+        self._decoders = [_DECODERS[item]() for item in encodings]
+
+    def decompress(self, data):
+        """
+        解压一块内容
+        :param data: bytes
+        :return: bytes，可能为空
+        """
+        for decoder in self._decoders:
+            data = decoder.decompress(data)
+        return data
+
+    def flush(self):
+        """
+        内容结束，取出剩余的解压结果
+        :return: bytes
+        """
+        data = b''
+        for decoder in self._decoders:
+            if data:
+                data = decoder.decompress(data)
+            data += decoder.flush()
+        return data
+
+
+def decompress(content, encodings):
+    """
+    一次解压全部内容
+    :param content: bytes
+    :param encodings: 编码列表，按解压的顺序
+    :return: bytes
+    """
+    if not encodings:
+        return content
+    decompressor = Decompressor(encodings)
+    return decompressor.decompress(content) + decompressor.flush()
+
+
+class DecodingReader(object):
+    """
+    包装原始字节流，read 返回解压后的内容，按块读取及解压
+    """
+
+    def __init__(self, raw, encodings, chunk_size=READ_CHUNK_SIZE):
+        """
+        构造函数
+        :param raw: 原始字节流，有 read(size) 方法
+        :param encodings: 编码列表，按解压的顺序
+        :param chunk_size: 每次从原始字节流读取的字节数
+        """
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self._decompressor = Decompressor(encodings)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        """
+        读取解压后的内容
+        :param size: 最多读取的字节数，负数或 None 为读取全部
+        :return: bytes，内容结束时为空
+        """
+        buffer = self._buffer
+        while not self._eof and (size is None or size < 0 or len(buffer) < size):
+            chunk = self.raw.read(self.chunk_size)
+            if chunk:
+                buffer += self._decompressor.decompress(chunk)
+            else:
+                buffer += self._decompressor.flush()
+                self._eof = True
+        if size is None or size < 0 or size >= len(buffer):
+            data = bytes(buffer)
+            buffer.clear()
+        else:
+            data = bytes(buffer[:size])
+            del buffer[:size]
+        return data
+
+    def close(self):
+        self.raw.close()
@@ -0,0 +1,124 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+响应压缩协商及流式解压的单元测试
+"""
+import gzip
+import unittest
+import zlib
+from io import BytesIO
+
+from zaoshu import ZaoshuRequests
+from zaoshu.compress import DecodingReader, Decompressor, accept_encoding, content_encodings
+from zaoshu.compress import decompress
+from zaoshu.mock import MockServer, csv_result
+from zaoshu.transport import Headers
+
+CONTENT = csv_result(2000)
+
+
+def deflate(content, wbits=zlib.MAX_WBITS):
+    """deflate 压缩，wbits 为负数时不带 zlib 头"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    return compressor.compress(content) + compressor.flush()
+
+
+class TestDecompress(unittest.TestCase):
+    """
+    解压单元测试
+    """
+
+    def test_encodings(self):
+        """测试协商的编码及 Content-Encoding 的解压顺序"""
+        self.assertTrue(accept_encoding().startswith('gzip, deflate'))
+        headers = Headers({'Content-Encoding': 'deflate, GZIP'})
+        self.assertEqual(content_encodings(headers), ['gzip', 'deflate'])
+        self.assertEqual(content_encodings(Headers({'Content-Encoding': 'identity'})), [])
+        with self.assertRaises(Exception):
+            Decompressor(['compress'])
+
+    def test_decompress(self):
+        """测试 gzip(含多个成员)、带及不带 zlib 头的 deflate 以及叠加的编码"""
+        middle = len(CONTENT) // 2
+        cases = [
+            (gzip.compress(CONTENT), ['gzip']),
+            (gzip.compress(CONTENT[:middle]) + gzip.compress(CONTENT[middle:]), ['gzip']),
+            (deflate(CONTENT), ['deflate']),
+            (deflate(CONTENT, -zlib.MAX_WBITS), ['deflate']),
+            (gzip.compress(deflate(CONTENT)), ['gzip', 'deflate']),
+        ]
+        for content, encodings in cases:
+            self.assertEqual(decompress(content, encodings), CONTENT)
+            # 每次只收到很少的字节
+            decompressor = Decompressor(encodings)
+            chunks = [decompressor.decompress(content[start:start + 7])
+                      for start in range(0, len(content), 7)]
+            self.assertEqual(b''.join(chunks) + decompressor.flush(), CONTENT)
+
+    def test_reader(self):
+        """测试按块读取解压后的内容"""
+        reader = DecodingReader(BytesIO(gzip.compress(CONTENT)), ['gzip'], chunk_size=100)
+        chunks = []
+        while True:
+            chunk = reader.read(1000)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), 1000)
+            chunks.append(chunk)
+        self.assertEqual(b''.join(chunks), CONTENT)
+        reader = DecodingReader(BytesIO(deflate(CONTENT)), ['deflate'])
+        self.assertEqual(reader.read(), CONTENT)
+
+
+class TestNegotiation(unittest.TestCase):
+    """
+    与模拟服务协商压缩的单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(result_rows=2000).start()
+        self.addCleanup(self.server.stop)
+        self.url = self.server.url + '/instance/instance-0/task/task-0/result/file'
+
+    def request(self, transport):
+        """创建 ZaoshuRequests"""
+        request = ZaoshuRequests('mock-key', 'mock-secret', transport=transport, max_retries=0)
+        self.addCleanup(request.close)
+        return request
+
+    def test_transports(self):
+        """测试标准库及 requests 传输收到压缩的响应并解压"""
+        for transport in ('stdlib', 'requests'):
+            request = self.request(transport)
+            response = request.get(self.url)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(response.content, CONTENT)
+
+            response = request.get(self.url, stream=True)
+            self.assertEqual(b''.join(response.iter_content(chunk_size=4096)), CONTENT)
+            response.close()
+
+    def test_stream(self):
+        """测试标准库传输流式解压，连接在读取完毕后复用"""
+        request = self.request('stdlib')
+        response = request.get(self.url, stream=True)
+        self.assertIsInstance(response.raw, DecodingReader)
+        self.assertEqual(response.raw.read(10), CONTENT[:10])
+        self.assertEqual(response.content, CONTENT[10:])
+        self.assertEqual([len(pool) for pool in request.transport._pools.values()], [1])
+
+    def test_identity(self):
+        """测试不接受压缩时及 Range 请求返回原始内容"""
+        request = self.request('stdlib')
+        response = request.get(self.url, headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.content, CONTENT)
+        response = request.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.content, CONTENT[10:20])
+
+
+if __name__ == '__main__':
+    unittest.main()
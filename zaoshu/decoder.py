@@ -0,0 +1,545 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+decoder 模块根据实例的数据格式(schema)把 csv/json 运行结果解码为带类型的值：
+RowDecoder 按字段预先确定转换方式，按批逐列转换(C实现的 map 代替逐行逐字段的 Python 代码)，
+可产出带类型的行(tuple)，也可按列输出 NumPy 数组(未安装 NumPy 时为 array 模块的数组)
+"""
+import codecs
+import csv
+from array import array
+from collections import namedtuple
+from itertools import chain, islice
+from operator import methodcaller
+
+from zaoshu.pages import to_timestamp
+from zaoshu.results import iter_json
+
+# 字段类型
+STRING = 'string'
+INTEGER = 'integer'
+FLOAT = 'float'
+BOOLEAN = 'boolean'
+TIMESTAMP = 'timestamp'
+# 数据格式中的类型名 -> 字段类型
+TYPE_ALIASES = {
+    'string': STRING, 'str': STRING, 'text': STRING, 'url': STRING, 'link': STRING,
+    'image': STRING,
+    'integer': INTEGER, 'int': INTEGER, 'long': INTEGER,
+    'float': FLOAT, 'double': FLOAT, 'number': FLOAT, 'decimal': FLOAT, 'price': FLOAT,
+    'boolean': BOOLEAN, 'bool': BOOLEAN,
+    'timestamp': TIMESTAMP, 'datetime': TIMESTAMP, 'date': TIMESTAMP, 'time': TIMESTAMP,
+}
+# 数据格式中字段名及类型的键
+NAME_KEYS = ('name', 'key', 'field', 'column')
+TYPE_KEYS = ('type', 'dataType', 'data_type', 'fieldType')
+# 每批的记录数
+BATCH_SIZE = 10000
+# 表示空值的 csv 文本
+NULL_VALUES = frozenset(['', 'null', 'NULL', 'None', 'none', 'nil'])
+TRUE_VALUES = frozenset(['true', 't', 'yes', 'y', '1', 'on'])
+FALSE_VALUES = frozenset(['false', 'f', 'no', 'n', '0', 'off'])
+# 按列输出时各类型的 array 类型码，空值: 整数列改为 'd' 并以 NaN 表示，布尔列保持 list；
+# 超出 int64 的整数列保持 list
+TYPECODES = {INTEGER: 'q', FLOAT: 'd', BOOLEAN: 'b', TIMESTAMP: 'd'}
+NUMPY_DTYPES = {'q': 'int64', 'd': 'float64', 'b': 'bool'}
+
+# 每行的分隔符数
+COMMA_COUNT = methodcaller('count', ',')
+
+# 字段，type 为 None 时根据第一批数据推断
+Field = namedtuple('Field', ['name', 'type'])
+
+
+def text_blocks(texts, lines):
+    """
+    把增量解码的文本合并为以换行结束的块
+    :param texts: str 的迭代器
+    :param lines: 每块至少包含的行数(最后一块除外)
+    :return: 生成器 str
+    """
+    parts = []
+    count = 0
+    for text in texts:
+        parts.append(text)
+        count += text.count('\n')
+        if count >= lines:
+            block = ''.join(parts)
+            end = block.rfind('\n') + 1
+            yield block[:end]
+            parts = [block[end:]]
+            count = 0
+    block = ''.join(parts)
+    if block:
+        yield block
+
+
+def block_lines(blocks):
+    """
+    把文本块拆分为行(保留换行符)，供 csv 模块解析
+    :param blocks: 以换行结束的 str 块的迭代器
+    :return: 生成器 str
+    """
+    for block in blocks:
+        lines = block.split('\n')
+        last = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if last:
+            yield last
+
+
+def _check_digits(value):
+    """
+    int()/float() 接受数字间的下划线(如 1_000)，结果文本中不应视为数值
+    """
+    if isinstance(value, str) and '_' in value:
+        raise ValueError('not a number: %r' % value)
+
+
+def _to_int(value):
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('not an integer: %r' % value)
+        return int(value)
+    _check_digits(value)
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise
+        return int(number)
+
+
+def _to_float(value):
+    _check_digits(value)
+    return float(value)
+
+
+def _to_bool(value):
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError('not a boolean: %r' % value)
+
+
+def _to_timestamp(value):
+    timestamp = to_timestamp(value)
+    if timestamp is None:
+        raise ValueError('not a time: %r' % value)
+    return timestamp
+
+
+def _to_string(value):
+    return value
+
+
+# 逐个转换的函数
+CONVERTERS = {STRING: _to_string, INTEGER: _to_int, FLOAT: _to_float, BOOLEAN: _to_bool,
+              TIMESTAMP: _to_timestamp}
+# csv 文本整列转换时优先尝试的内置函数，失败(如含空值或下划线)时再逐个转换
+FAST_CONVERTERS = {INTEGER: int, FLOAT: float}
+
+
+def field_type(name):
+    """
+    数据格式中的类型名对应的字段类型
+    :param name: 类型名
+    :return: 字段类型，未知时为 STRING，name 为空时返回 None
+    """
+    if not name:
+        return None
+    return TYPE_ALIASES.get(str(name).strip().lower(), STRING)
+
+
+def schema_fields(schema, part='surface'):
+    """
+    从数据格式中获得字段
+    :param schema: Schema 模型、数据格式响应、dict 或字段的列表
+    :param part: surface(列表页) 或 depth(详情页)
+    :return: [Field, ...]
+    """
+    if hasattr(schema, 'status_code'):
+        from zaoshu.models import Schema
+        schema = Schema.from_response(schema, 'schema')
+    if hasattr(schema, 'to_dict'):
+        schema = schema.to_dict()
+    if isinstance(schema, dict):
+        if part not in schema and isinstance(schema.get('data'), dict):
+            schema = schema['data']
+        schema = schema.get(part) or schema.get('fields') or schema.get('columns') or []
+    if isinstance(schema, dict):
+        # {字段名: 类型}
+        schema = [{'name': name, 'type': kind} for name, kind in schema.items()]
+
+    fields = []
+    for item in schema:
+        if isinstance(item, dict):
+            name = next((item[key] for key in NAME_KEYS if item.get(key)), None)
+            kind = next((item[key] for key in TYPE_KEYS if item.get(key)), None)
+            if name is None:
+                raise ValueError('schema field without name: %r' % (item,))
+            fields.append(Field(str(name), field_type(kind)))
+        elif isinstance(item, Field):
+            fields.append(item)
+        else:
+            fields.append(Field(str(item), None))
+    return fields
+
+
+def infer_type(values):
+    """
+    根据 csv 文本推断字段类型
+    :param values: 一列的值
+    :return: INTEGER, FLOAT 或 STRING
+    """
+    samples = [value for value in values if value not in NULL_VALUES]
+    if not samples:
+        return STRING
+    for kind in (INTEGER, FLOAT):
+        try:
+            for value in samples:
+                CONVERTERS[kind](value)
+        except (ValueError, TypeError):
+            continue
+        return kind
+    return STRING
+
+
+def convert_column(values, kind, strict=False, text=True):
+    """
+    转换一列的值
+    :param values: 一列的值
+    :param kind: 字段类型
+    :param strict: 为True时无法转换的值抛出 ValueError，否则转换为 None
+    :param text: 值是否均为 csv 文本
+    :return: list，空值为 None
+    """
+    if kind == STRING:
+        return values if isinstance(values, list) else list(values)
+    fast = FAST_CONVERTERS.get(kind) if text else None
+    if fast is not None:
+        try:
+            if '_' not in ''.join(values):
+                return list(map(fast, values))
+        except (ValueError, TypeError):
+            pass
+    convert = CONVERTERS[kind]
+    result = []
+    append = result.append
+    for value in values:
+        if value is None or text and value in NULL_VALUES:
+            append(None)
+            continue
+        try:
+            append(convert(value))
+        except (ValueError, TypeError, OverflowError):
+            if strict:
+                raise ValueError('decode Error: %r is not %s' % (value, kind))
+            append(None)
+    return result
+
+
+class ColumnBuilder(object):
+    """
+    按批累积一列的值，数值列保存在 array 中
+    """
+
+    __slots__ = ('kind', 'values')
+
+    def __init__(self, kind):
+        self.kind = kind
+        typecode = TYPECODES.get(kind)
+        self.values = array(typecode) if typecode else []
+
+    def extend(self, values):
+        """
+        追加一批已转换的值(空值为 None)
+        :param values: list
+        :return: None
+        """
+        if not isinstance(self.values, array):
+            self.values.extend(values)
+            return
+        if self.kind == INTEGER:
+            try:
+                numbers = array('q', values if None not in values
+                                else [value for value in values if value is not None])
+            except OverflowError:
+                # 超出 int64 的整数列改为 list 保存
+                self.values = self._objects(self.values)
+                self.values.extend(values)
+                return
+            if self.values.typecode == 'q' and len(numbers) == len(values):
+                self.values.extend(numbers)
+                return
+        typecode = self.values.typecode
+        if None in values:
+            if typecode == 'b':
+                # 布尔列含空值时保留 None
+                self.values = [bool(value) for value in self.values]
+                self.values.extend(values)
+                return
+            if typecode == 'q':
+                self.values = array('d', self.values)
+            nan = float('nan')
+            values = [nan if value is None else value for value in values]
+        elif typecode == 'b':
+            values = [1 if value else 0 for value in values]
+        self.values.extend(array(self.values.typecode, values))
+
+    def merge(self, values):
+        """
+        追加另一个同类型 ColumnBuilder 的值
+        :param values: 另一个 ColumnBuilder 的 values(array 或 list)
+        :return: None
+        """
+        current = self.values
+        if isinstance(current, array) and isinstance(values, array):
+            if current.typecode != values.typecode:
+                # 整数列与含空值的整数列('d')
+                if current.typecode == 'q':
+                    self.values = current = array('d', current)
+                else:
+                    values = array('d', values)
+            current.extend(values)
+            return
+        # 布尔列与含空值的布尔列(list)，整数列与超出 int64 的整数列(list)
+        if isinstance(current, array):
+            self.values = current = self._objects(current)
+        elif isinstance(values, array):
+            values = self._objects(values)
+        current.extend(values)
+
+    @staticmethod
+    def _objects(values):
+        """
+        把 array 转换为 list：布尔列为 bool，整数列中表示空值的 NaN 为 None
+        """
+        if values.typecode == 'b':
+            return [bool(value) for value in values]
+        if values.typecode == 'd':
+            return [None if value != value else int(value) for value in values]
+        return list(values)
+
+    def result(self, numpy=None):
+        """
+        输出整列
+        :param numpy: numpy 模块，None为输出 array/list
+        :return: numpy.ndarray、array.array 或 list
+        """
+        values = self.values
+        if numpy is None:
+            return values
+        if isinstance(values, array):
+            dtype = NUMPY_DTYPES[values.typecode]
+            if not values:
+                return numpy.zeros(0, dtype=dtype)
+            # 复制为可写的数组
+            return numpy.frombuffer(values, dtype='int8' if dtype == 'bool' else dtype) \
+                .astype(dtype)
+        column = numpy.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+
+class RowDecoder(object):
+    """
+    由数据格式生成的解码器，可复用于同一实例的多个任务
+    """
+
+    def __init__(self, fields, batch_size=BATCH_SIZE, strict=False, part='surface'):
+        """
+        构造函数
+        :param fields: [Field, ...]，为空时使用 csv 表头(或 json 第一条记录)的全部字段并推断类型
+        :param batch_size: 每批的记录数
+        :param strict: 为True时无法转换的值抛出 ValueError，否则解码为 None
+        :param part: 字段所属的页面 surface(列表页) 或 depth(详情页)，zip 结果据此选择文件
+        """
+        self.fields = [field if isinstance(field, Field) else Field(*field) for field in fields]
+        self.batch_size = batch_size
+        self.strict = strict
+        self.part = part
+
+    @classmethod
+    def from_schema(cls, schema, part='surface', types=None, **options):
+        """
+        由数据格式创建解码器
+        :param schema: Schema 模型、数据格式响应、dict 或字段的列表
+        :param part: surface(列表页) 或 depth(详情页)
+        :param types: 覆盖数据格式的字段类型 {字段名: 类型}
+        :param options: 见构造函数
+        :return: RowDecoder
+        """
+        fields = schema_fields(schema, part)
+        if types:
+            fields = [Field(field.name, field_type(types[field.name]))
+                      if field.name in types else field for field in fields]
+        return cls(fields, part=part, **options)
+
+    @property
+    def names(self):
+        """
+        字段名，即解码后每行的值的顺序
+        :return: [str, ...]
+        """
+        return [field.name for field in self.fields]
+
+    def _csv_batches(self, chunks):
+        """
+        按批产出 csv 各字段的原始文本列
+        不含引号的文本块整块按分隔符切分后隔列切片，不逐行解析；含引号时交给 csv 模块解析剩余内容
+        """
+        blocks = text_blocks(codecs.iterdecode(chunks, 'utf-8-sig'), self.batch_size)
+        first = next(blocks, '')
+        header_line, _, first = first.partition('\n')
+        if not header_line.strip():
+            return
+        header = next(csv.reader([header_line]))
+        if not self.fields:
+            self.fields = [Field(name, None) for name in header]
+        positions = dict((name, index) for index, name in enumerate(header))
+        indexes = [positions.get(field.name) for field in self.fields]
+        width = len(header)
+
+        blocks = chain([first], blocks)
+        for block in blocks:
+            if '"' in block:
+                # 引号内可能有分隔符或换行，剩余内容均由 csv 模块解析
+                reader = csv.reader(block_lines(chain([block], blocks)))
+                while True:
+                    batch = list(islice(reader, self.batch_size))
+                    if not batch:
+                        return
+                    yield self._select(batch, indexes, width)
+            lines = block.replace('\r\n', '\n').split('\n')
+            if lines[-1] == '':
+                lines.pop()
+            if not lines:
+                continue
+            if set(map(COMMA_COUNT, lines)) != {width - 1}:
+                # 列数不一致或有空行，逐行解析
+                yield self._select(list(csv.reader(lines)), indexes, width)
+                continue
+            values = ','.join(lines).split(',')
+            empty = ('',) * len(lines)
+            yield [values[index::width] if index is not None else empty for index in indexes]
+
+    @staticmethod
+    def _select(batch, indexes, width):
+        """
+        由逐行解析的结果取出各字段的列
+        """
+        batch = [row for row in batch if row]
+        if set(map(len, batch)) != {width}:
+            # 列数不一致的行补齐或截断
+            batch = [(row + [''] * width)[:width] for row in batch]
+        columns = list(zip(*batch)) or [()] * width
+        empty = ('',) * len(batch)
+        return [columns[index] if index is not None else empty for index in indexes]
+
+    def _json_batches(self, chunks):
+        """
+        按批产出 json 各字段的值
+        """
+        records = iter_json(chunks)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                return
+            if not self.fields:
+                self.fields = [Field(name, None) for name in batch[0]]
+            yield [[record.get(field.name) if isinstance(record, dict) else None
+                    for record in batch] for field in self.fields]
+
+    def iter_column_batches(self, chunks, file_type='csv'):
+        """
+        按批解码，产出各字段转换后的列
+        :param chunks: 结果文件(csv/json)内容的 bytes 块迭代器
+        :param file_type: csv, json
+        :return: 生成器 [list, ...]，与 names 顺序一致，空值为 None
+        """
+        if file_type == 'csv':
+            batches, text = self._csv_batches(chunks), True
+        elif file_type == 'json':
+            batches, text = self._json_batches(chunks), False
+        else:
+            raise ValueError('unsupported file type: %s' % file_type)
+
+        kinds = None
+        for columns in batches:
+            if kinds is None:
+                # 未指定类型的字段根据第一批数据推断
+                kinds = [field.type or (infer_type(column) if text else
+                                        _infer_json_type(column))
+                         for field, column in zip(self.fields, columns)]
+                self.fields = [Field(field.name, kind) for field, kind in zip(self.fields, kinds)]
+            yield [convert_column(column, kind, self.strict, text)
+                   for column, kind in zip(columns, kinds)]
+
+    def iter_batches(self, chunks, file_type='csv'):
+        """
+        按批解码为带类型的行
+        :param chunks: 结果文件(csv/json)内容的 bytes 块迭代器
+        :param file_type: csv, json
+        :return: 生成器 [tuple, ...]，每行的值与 names 顺序一致
+        """
+        for columns in self.iter_column_batches(chunks, file_type):
+            yield list(zip(*columns))
+
+    def columns(self, chunks, file_type='csv', numpy=None):
+        """
+        解码全部记录并按列输出
+        整数、浮点数、时间(时间戳，秒)列为 int64/float64 数组，含空值的整数列为 float64(空值为 NaN)，
+        布尔列为 bool 数组，字符串列为 object 数组(array 模式下为 list)
+        :param chunks: 结果文件(csv/json)内容的 bytes 块迭代器
+        :param file_type: csv, json
+        :param numpy: None 在已安装 NumPy 时输出 NumPy 数组，False 输出 array.array，True 必须使用 NumPy
+        :return: {字段名: 列}
+        """
+        module = _numpy(numpy)
+        builders = None
+        for columns in self.iter_column_batches(chunks, file_type):
+            if builders is None:
+                builders = [ColumnBuilder(field.type) for field in self.fields]
+            for builder, column in zip(builders, columns):
+                builder.extend(column)
+        if builders is None:
+            builders = [ColumnBuilder(field.type or STRING) for field in self.fields]
+        return dict((field.name, builder.result(module))
+                    for field, builder in zip(self.fields, builders))
+
+
+def _infer_json_type(values):
+    """
+    根据 json 值推断字段类型
+    """
+    kinds = set(type(value) for value in values if value is not None)
+    if kinds == {bool}:
+        return BOOLEAN
+    if kinds == {int}:
+        return INTEGER
+    if kinds and kinds <= {int, float}:
+        return FLOAT
+    return STRING
+
+
+def _numpy(numpy):
+    """
+    按参数获得 numpy 模块
+    """
+    if numpy is False:
+        return None
+    try:
+        import numpy as module
+    except ImportError:
+        if numpy:
+            raise
+        return None
+    return module
@@ -0,0 +1,200 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+按数据格式解码运行结果的单元测试
+"""
+import csv
+import io
+import json
+import math
+import unittest
+from array import array
+
+from zaoshu import ZaoshuSdk
+from zaoshu.decoder import RowDecoder, Field, schema_fields
+from zaoshu.decoder import STRING, INTEGER, FLOAT
+from zaoshu.mock import MockServer, csv_result
+from zaoshu.transport import MemoryTransport
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SCHEMA = {'data': {'surface': [{'name': 'id', 'type': 'integer'},
+                               {'name': 'title', 'type': 'string'},
+                               {'name': 'price', 'type': 'double'},
+                               {'name': 'hot', 'type': 'bool'},
+                               {'name': 'created', 'type': 'datetime'}],
+                   'depth': []}}
+
+
+def chunked(data, size=7):
+    """按固定大小切分 bytes"""
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class TestSchema(unittest.TestCase):
+    """
+    数据格式解析单元测试
+    """
+
+    def test_formats(self):
+        """测试字段列表的各种格式"""
+        self.assertEqual(schema_fields(SCHEMA)[2], Field('price', FLOAT))
+        self.assertEqual(schema_fields({'surface': ['id', 'title']}),
+                         [Field('id', None), Field('title', None)])
+        self.assertEqual(schema_fields({'fields': {'n': 'long', 'u': 'url'}}),
+                         [Field('n', INTEGER), Field('u', STRING)])
+        self.assertEqual(schema_fields({'depth': [{'key': 'x'}]}, part='depth'),
+                         [Field('x', None)])
+        with self.assertRaises(ValueError):
+            schema_fields([{'type': 'int'}])
+
+
+class TestRowDecoder(unittest.TestCase):
+    """
+    解码器 RowDecoder 单元测试
+    """
+
+    CSV = (b'\xef\xbb\xbfid,title,price,hot,created\r\n'
+           b'1,a,1.5,true,2020-01-01T00:00:00Z\r\n'
+           b'2,,,no,1577836800000\r\n'
+           b'x,c,3,1,\r\n')
+
+    def test_csv_rows(self):
+        """测试 csv 按批解码为带类型的行，空值及无法转换的值为 None"""
+        decoder = RowDecoder.from_schema(SCHEMA, batch_size=2)
+        batches = list(decoder.iter_batches(chunked(self.CSV)))
+        rows = [row for batch in batches for row in batch]
+        self.assertEqual(rows, [(1, 'a', 1.5, True, 1577836800.0),
+                                (2, '', None, False, 1577836800.0),
+                                (None, 'c', 3.0, True, None)])
+        self.assertEqual(decoder.names, ['id', 'title', 'price', 'hot', 'created'])
+        with self.assertRaises(ValueError):
+            list(RowDecoder.from_schema(SCHEMA, strict=True).iter_batches([self.CSV]))
+
+    def test_quoted(self):
+        """测试含引号、分隔符及换行的字段与 csv 模块的解析结果一致"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['id', 'title'])
+        expected = []
+        for index in range(50):
+            title = 'plain %d' % index if index < 20 else 'q "%d", \n next' % index
+            writer.writerow([index, title])
+            expected.append((index, title))
+        data = output.getvalue().encode('utf-8')
+        decoder = RowDecoder([('id', INTEGER), ('title', STRING)], batch_size=8)
+        rows = [row for batch in decoder.iter_batches(chunked(data, 13)) for row in batch]
+        self.assertEqual(rows, expected)
+
+    def test_ragged(self):
+        """测试列数不一致的行及缺少的字段"""
+        data = b'id,title\n1,a\n2\n\n3,c,extra\n'
+        decoder = RowDecoder([('id', INTEGER), ('title', STRING), ('missing', FLOAT)])
+        rows = [row for batch in decoder.iter_batches([data]) for row in batch]
+        self.assertEqual(rows, [(1, 'a', None), (2, '', None), (3, 'c', None)])
+
+    def test_infer(self):
+        """测试没有类型的字段根据数据推断"""
+        decoder = RowDecoder([])
+        columns = decoder.columns([csv_result(20)], numpy=False)
+        self.assertEqual(decoder.fields[0], Field('id', INTEGER))
+        self.assertEqual(columns['id'], array('q', range(20)))
+        self.assertEqual(columns['price'].typecode, 'd')
+        self.assertEqual(columns['title'][3], 'item 3')
+
+    def test_json(self):
+        """测试 json 结果"""
+        records = [{'id': 1, 'title': 't', 'price': '2.5', 'hot': True, 'created': 0},
+                   {'id': 2.0, 'price': 3, 'hot': None},
+                   {'id': 2.5, 'title': None}]
+        decoder = RowDecoder.from_schema(SCHEMA)
+        rows = list(decoder.iter_batches(chunked(json.dumps(records).encode('utf-8')), 'json'))
+        self.assertEqual(rows[0], [(1, 't', 2.5, True, 0.0), (2, None, 3.0, None, None),
+                                   (None, None, None, None, None)])
+
+    def test_columns(self):
+        """测试按列输出 array，含空值的整数列为 float 并以 NaN 表示"""
+        columns = RowDecoder.from_schema(SCHEMA, batch_size=1).columns(chunked(self.CSV),
+                                                                       numpy=False)
+        self.assertEqual(columns['price'].typecode, 'd')
+        self.assertTrue(math.isnan(columns['price'][1]))
+        self.assertEqual(columns['id'].typecode, 'd')
+        self.assertEqual(columns['hot'], array('b', [1, 0, 1]))
+        self.assertEqual(columns['title'], ['a', '', 'c'])
+        self.assertEqual(RowDecoder([('a', INTEGER)]).columns([b''], numpy=False),
+                         {'a': array('q')})
+
+    def test_int64_overflow(self):
+        """测试超出 int64 的整数列改为 list 保存，不丢失精度"""
+        data = b'id,n\n1,1\n2,99999999999999999999\n3,\n'
+        columns = RowDecoder([], batch_size=1).columns([data], numpy=False)
+        self.assertEqual(columns['id'], array('q', [1, 2, 3]))
+        self.assertEqual(columns['n'], [1, 99999999999999999999, None])
+        columns = RowDecoder([('n', INTEGER)]).columns([data], numpy=False)
+        self.assertEqual(columns['n'], [1, 99999999999999999999, None])
+
+    def test_underscore(self):
+        """测试含下划线的文本不被当作数值"""
+        data = b'id,price\n1_000,1_0.5\n2,3\n'
+        decoder = RowDecoder([('id', INTEGER), ('price', FLOAT)])
+        rows = [row for batch in decoder.iter_batches([data]) for row in batch]
+        self.assertEqual(rows, [(None, None), (2, 3.0)])
+        decoder = RowDecoder([])
+        self.assertEqual(decoder.columns([data], numpy=False)['id'], ['1_000', '2'])
+        self.assertEqual(decoder.fields[0], Field('id', STRING))
+
+    @unittest.skipIf(numpy is None, 'numpy 未安装')
+    def test_numpy(self):
+        """测试按列输出 NumPy 数组"""
+        columns = RowDecoder.from_schema(SCHEMA).columns([self.CSV], numpy=True)
+        self.assertEqual(str(columns['hot'].dtype), 'bool')
+        self.assertEqual(columns['title'].dtype, object)
+        columns['price'][0] = 0
+
+    @unittest.skipIf(numpy is not None, 'numpy 已安装')
+    def test_numpy_missing(self):
+        """测试要求 NumPy 但未安装时抛出 ImportError"""
+        with self.assertRaises(ImportError):
+            RowDecoder.from_schema(SCHEMA).columns([self.CSV], numpy=True)
+
+
+class TestInstanceDecode(unittest.TestCase):
+    """
+    Instance 按数据格式下载解码单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(result_rows=25)
+        self.addCleanup(self.server.stop)
+        self.sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                             transport=MemoryTransport(self.server.handle))
+
+    def test_load_columns(self):
+        """测试由实例的数据格式解码 csv、json 及 zip 结果"""
+        for file_type in ('csv', 'json', 'zip'):
+            columns = self.sdk.instance.load_columns('instance-0', 'task-0', file_type,
+                                                     numpy=False)
+            self.assertEqual(columns['id'], array('q', range(25)))
+            self.assertEqual(columns['url'][-1], 'https://example.com/item/24')
+
+    def test_iter_typed_rows(self):
+        """测试按批产出带类型的行"""
+        decoder = self.sdk.instance.decoder('instance-0', types={'price': 'float'},
+                                            batch_size=10)
+        rows = [row for batch in self.sdk.instance.iter_typed_rows('instance-0', 'task-0',
+                                                                    decoder=decoder)
+                for row in batch]
+        self.assertEqual(rows[12], (12, 'item 12', 12.12, 'https://example.com/item/12'))
+        self.assertEqual(decoder.fields[2], Field('price', FLOAT))
+        with self.assertRaises(Exception):
+            list(self.sdk.instance.iter_typed_rows(
+                'instance-0', 'task-0', decoder=RowDecoder([], part='depth')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,407 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+download 模块负责运行结果文件的下载：文件名解析、流式写入、解码以及分段并行下载。
+分段下载及断点续传不接受压缩(Accept-Encoding: identity)，Range 的字节位置对应文件本身
+"""
+import os
+import re
+from io import BytesIO
+
+from zaoshu.compress import IDENTITY
+
+# 下载结果文件时每次读取的字节数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 分段下载时每段的字节数
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+
+# 断点续传时每写入多少字节更新一次检查点
+CHECKPOINT_INTERVAL = 4 * 1024 * 1024
+# 断点续传的未完成文件及检查点文件后缀
+PARTIAL_SUFFIX = '.part'
+CHECKPOINT_SUFFIX = '.part.json'
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+def parse_file_name(content_disposition):
+    """
+    从响应头 content-disposition 中解析文件名
+    :param content_disposition: 响应头 content-disposition
+    :return: (以'/'开头的文件名, 后缀)
+    """
+    file_name = '/' + str(content_disposition.replace("attachment; filename*=UTF-8''", ''))
+    suffix = '.' + file_name.split('.')[-1]
+    return file_name.replace(suffix, ''), suffix
+
+
+def data_file_path(save_path, file_name, suffix):
+    """
+    获得下载文件的保存路径，目录不存在时创建
+    :param save_path: 保存目录
+    :param file_name: 以'/'开头的文件名
+    :param suffix: 后缀
+    :return: 保存文件的路径
+    """
+    default_dir_path = '.'+save_path+'/datafile'
+    # 判断路径状态
+    if not os.path.isdir(default_dir_path):
+        os.makedirs(default_dir_path)
+    return default_dir_path+file_name+suffix
+
+
+def write_chunks(response, fileobj, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    将流式响应内容按块写入文件对象
+    :param response: 以 stream=True 发送请求得到的 requests.Response
+    :param fileobj: 可写的文件对象
+    :param chunk_size: 每次读取的字节数
+    :return: 写入的字节数
+    """
+    size = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        fileobj.write(chunk)
+        size += len(chunk)
+    return size
+
+
+def decode_run_data(content, suffix):
+    """
+    解码下载的运行结果
+    :param content: 下载的文件内容 bytes
+    :param suffix: 后缀
+    :return: 文件内容的元组，zip文件为 (surface, depth)
+    """
+    if suffix in '.zip':
+        # zip 文件较少，用到时才导入 zipfile
+        import zipfile
+        surface = b''
+        depth = b''
+        decom_bytes = zipfile.ZipFile(file=BytesIO(content))
+        # 获取文件名
+        if len(decom_bytes.namelist()) == 2:
+            surface = decom_bytes.read(decom_bytes.namelist()[0])
+            depth = decom_bytes.read(decom_bytes.namelist()[-1])
+
+        return surface.decode(), depth.decode()
+    else:
+        return content.decode(),
+
+
+def preallocate(file, size):
+    """
+    预分配文件空间
+    :param file: 以写方式打开的文件
+    :param size: 文件大小
+    :return: None
+    """
+    file.truncate(size)
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+        except OSError:
+            # 部分文件系统不支持，truncate 已经设置了文件大小
+            pass
+
+
+def split_ranges(total, part_size=DOWNLOAD_PART_SIZE):
+    """
+    将文件按字节数切分为多个区间
+    :param total: 文件大小
+    :param part_size: 每段的字节数
+    :return: [(start, end), ...]，end 包含在区间内
+    """
+    return [(start, min(start + part_size, total) - 1) for start in range(0, total, part_size)]
+
+
+def content_range(response):
+    """
+    解析响应头 Content-Range
+    :param response: requests.Response
+    :return: (start, end, total)，不是分段响应时返回 None
+    """
+    match = CONTENT_RANGE.match(response.headers.get('content-range', ''))
+    if response.status_code != 206 or not match:
+        return None
+    return tuple(int(value) for value in match.groups())
+
+
+def range_validator(response):
+    """
+    获得用于 If-Range 的校验值，弱 ETag 不能用于 If-Range
+    :param response: requests.Response
+    :return: ETag/Last-Modified，没有时返回 None
+    """
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('last-modified')
+
+
+def download_range(request, url, params, file_path, start, end, validator=None,
+                   chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    下载文件的一段并写入文件的对应位置，每段请求单独签名
+    :param request: ZaoshuRequests
+    :param url: 下载url
+    :param params: 请求参数
+    :param file_path: 已预分配的文件路径
+    :param start: 开始位置
+    :param end: 结束位置(包含)
+    :param validator: If-Range 校验值，文件变化时服务器会返回整个文件
+    :param chunk_size: 每次读取的字节数
+    :return: 写入的字节数
+    """
+    headers = {'Range': 'bytes=%d-%d' % (start, end), 'Accept-Encoding': IDENTITY}
+    if validator:
+        headers['If-Range'] = validator
+    response = request.get(url, params=params, headers=headers, stream=True)
+    try:
+        received = content_range(response)
+        if received is None or received[0] != start:
+            raise Exception("range download Error: %d" % response.status_code)
+        with open(file_path, 'r+b') as file:
+            file.seek(start)
+            size = write_chunks(response, file, chunk_size)
+    finally:
+        response.close()
+    if size != end - start + 1:
+        raise Exception("range download incomplete: bytes=%d-%d" % (start, end))
+    return size
+
+
+def download_ranged(request, url, params, save_path, workers=4, part_size=DOWNLOAD_PART_SIZE,
+                    chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    分段并行下载：先获取文件大小，再通过多个连接并行下载各段并直接写入预分配的 .part 文件，
+    全部完成后才替换为结果文件，失败时删除 .part 文件；服务器忽略 Range 时退回单连接下载
+    :param request: ZaoshuRequests
+    :param url: 下载url
+    :param params: 请求参数
+    :param save_path: 保存目录
+    :param workers: 并行下载的连接数
+    :param part_size: 每段的字节数
+    :param chunk_size: 每次读取的字节数
+    :return: 保存文件的路径
+    """
+    response = request.get(url, params=params,
+                           headers={'Range': 'bytes=0-0', 'Accept-Encoding': IDENTITY}, stream=True)
+    try:
+        file_name, suffix = parse_file_name(response.headers['content-disposition'])
+        save_file_path = data_file_path(save_path, file_name, suffix)
+        partial_path = save_file_path + PARTIAL_SUFFIX
+        received = content_range(response)
+        if received is None:
+            if response.status_code != 200:
+                raise Exception("download Error: %d" % response.status_code)
+            # 服务器不支持 Range，退回单连接下载
+            try:
+                with open(partial_path, 'wb') as file:
+                    write_chunks(response, file, chunk_size)
+            except BaseException:
+                _remove(partial_path)
+                raise
+            os.replace(partial_path, save_file_path)
+            return os.path.abspath(save_file_path)
+        total = received[2]
+        validator = range_validator(response)
+    finally:
+        response.close()
+
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        with open(partial_path, 'wb') as file:
+            preallocate(file, total)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(download_range, request, url, params, partial_path,
+                                       start, end, validator, chunk_size)
+                       for start, end in split_ranges(total, part_size)]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    except BaseException:
+        # 未完成的文件含有未写入的空洞，不能留在结果文件名下
+        _remove(partial_path)
+        raise
+    os.replace(partial_path, save_file_path)
+    return os.path.abspath(save_file_path)
+
+
+def _remove(file_path):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    读取断点续传检查点
+    :param checkpoint_path: 检查点文件路径
+    :return: dict，不存在或已损坏时返回 None
+    """
+    try:
+        with open(checkpoint_path) as file:
+            import json
+            return json.load(file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """
+    原子地写入断点续传检查点
+    :param checkpoint_path: 检查点文件路径
+    :param checkpoint: dict
+    :return: None
+    """
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        import json
+        json.dump(checkpoint, file)
+    os.replace(temp_path, checkpoint_path)
+
+
+def verify_download(file_path, suffix, length=None):
+    """
+    校验下载完成的文件：大小与服务器给出的一致，zip文件的各成员CRC正确
+    :param file_path: 文件路径
+    :param suffix: 后缀
+    :param length: 文件大小，未知时为 None
+    :return: bool
+    """
+    if length is not None and os.path.getsize(file_path) != length:
+        return False
+    if suffix == '.zip':
+        import zipfile
+        try:
+            with zipfile.ZipFile(file_path) as zip_file:
+                return zip_file.testzip() is None
+        except zipfile.BadZipfile:
+            return False
+    return True
+
+
+def _resume_once(request, url, params, partial_path, checkpoint_path, checkpoint, chunk_size):
+    """
+    发送一次(续传)请求并将内容追加到未完成文件，期间定期更新检查点
+    :return: 更新后的检查点
+    """
+    # 不压缩，检查点中的字节位置及大小对应文件本身
+    headers = {'Accept-Encoding': IDENTITY}
+    if checkpoint:
+        headers['Range'] = 'bytes=%d-' % checkpoint['offset']
+        if checkpoint.get('validator'):
+            headers['If-Range'] = checkpoint['validator']
+
+    response = request.get(url, params=params, headers=headers, stream=True)
+    try:
+        received = content_range(response)
+        if checkpoint and received and received[0] == checkpoint['offset'] and \
+                checkpoint['length'] in (None, received[2]):
+            # 首次响应没有 Content-Length 时以 Content-Range 中的文件大小为准
+            checkpoint['length'] = received[2]
+            offset = checkpoint['offset']
+        elif response.status_code == 200:
+            # 首次下载，或文件已变化/服务器不支持 Range，从头开始
+            file_name, suffix = parse_file_name(response.headers['content-disposition'])
+            length = response.headers.get('content-length')
+            checkpoint = {
+                'url': url,
+                'params': params,
+                'file_name': file_name,
+                'suffix': suffix,
+                'validator': range_validator(response),
+                'etag': response.headers.get('etag'),
+                'last_modified': response.headers.get('last-modified'),
+                'length': int(length) if length is not None else None,
+                'offset': 0,
+            }
+            offset = 0
+        else:
+            raise Exception("download Error: %d" % response.status_code)
+
+        with open(partial_path, 'r+b' if offset else 'wb') as file:
+            file.seek(offset)
+            file.truncate()
+            saved = offset
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+                    offset += len(chunk)
+                    if offset - saved >= CHECKPOINT_INTERVAL:
+                        file.flush()
+                        checkpoint['offset'] = saved = offset
+                        save_checkpoint(checkpoint_path, checkpoint)
+                if checkpoint['length'] is None:
+                    # 没有 Content-Length 时，读取完毕即为文件大小
+                    checkpoint['length'] = offset
+            finally:
+                file.flush()
+                checkpoint['offset'] = offset
+                save_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        response.close()
+    if offset < checkpoint['length']:
+        # 连接提前关闭而传输层没有报错，按连接中断处理，之后从检查点续传
+        error = (request.transport.read_errors or (IOError,))[0]
+        raise error("download interrupted: %d of %d bytes" % (offset, checkpoint['length']))
+    return checkpoint
+
+
+def download_resumable(request, url, params, save_path, name, retries=3,
+                       chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    可断点续传的下载：内容先写入未完成文件，并在检查点文件中记录已下载的位置及校验值
+    (ETag/Last-Modified/文件大小)。中断后再次调用会从记录的位置继续下载，
+    完成后校验文件大小(zip文件同时校验CRC)，再重命名为最终的文件名
+    :param request: ZaoshuRequests
+    :param url: 下载url
+    :param params: 请求参数
+    :param save_path: 保存目录
+    :param name: 未完成文件名，同一个下载任务需保持不变
+    :param retries: 连接中断时在本次调用中自动续传的次数
+    :param chunk_size: 每次读取的字节数
+    :return: 保存文件的路径
+    """
+    partial_path = data_file_path(save_path, '/' + name, PARTIAL_SUFFIX)
+    checkpoint_path = partial_path[:-len(PARTIAL_SUFFIX)] + CHECKPOINT_SUFFIX
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint and (checkpoint.get('url') != url or checkpoint.get('params') != params or
+                       not os.path.exists(partial_path)):
+        checkpoint = None
+    if checkpoint:
+        # 检查点之后的内容可能没有完整写入
+        checkpoint['offset'] = min(checkpoint['offset'], os.path.getsize(partial_path))
+
+    attempt = 0
+    while True:
+        if checkpoint and checkpoint['offset'] == checkpoint['length']:
+            # 上次已下载完毕但未完成校验
+            break
+        try:
+            checkpoint = _resume_once(request, url, params, partial_path, checkpoint_path,
+                                      checkpoint, chunk_size)
+        except request.transport.read_errors:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            checkpoint = load_checkpoint(checkpoint_path)
+            continue
+        break
+
+    if not verify_download(partial_path, checkpoint['suffix'], checkpoint['length']):
+        os.remove(partial_path)
+        os.remove(checkpoint_path)
+        raise Exception("download verify Error")
+
+    save_file_path = data_file_path(save_path, checkpoint['file_name'], checkpoint['suffix'])
+    os.replace(partial_path, save_file_path)
+    os.remove(checkpoint_path)
+    return os.path.abspath(save_file_path)
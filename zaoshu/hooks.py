@@ -0,0 +1,118 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+hooks 模块定义 ZaoshuRequests 的钩子事件，以及将请求 url 还原为接口URL模板的 EndpointResolver
+"""
+import re
+import threading
+from collections import namedtuple
+
+# 签名前，attempt 为第几次发送(从0开始)
+SignEvent = namedtuple('SignEvent', ['method', 'endpoint', 'url', 'attempt'])
+# 收到响应头或请求出错后，出错时 status_code 为 None、error 为异常
+# elapsed: 发送到收到响应头的秒数，sign_time: 签名耗时(秒)
+# sent_bytes: 请求内容字节数，received_bytes: 响应内容字节数(流式请求为0，按块另行通知)
+SendEvent = namedtuple('SendEvent', ['method', 'endpoint', 'url', 'status_code', 'error',
+                                     'elapsed', 'sign_time', 'sent_bytes', 'received_bytes',
+                                     'attempt'])
+# 重试前，attempt 为即将进行的第几次重试，delay 为重试前等待的秒数
+RetryEvent = namedtuple('RetryEvent', ['method', 'endpoint', 'url', 'attempt', 'delay',
+                                       'status_code', 'error'])
+# 流式读取响应内容时每读取一块
+ChunkEvent = namedtuple('ChunkEvent', ['method', 'endpoint', 'url', 'size'])
+
+# 钩子事件名
+BEFORE_SIGN = 'before_sign'
+AFTER_SEND = 'after_send'
+ON_RETRY = 'on_retry'
+ON_DOWNLOAD_CHUNK = 'on_download_chunk'
+EVENTS = (BEFORE_SIGN, AFTER_SEND, ON_RETRY, ON_DOWNLOAD_CHUNK)
+
+
+def emit(handlers, event):
+    """
+    调用钩子函数，钩子出错不影响请求
+    :param handlers: 钩子函数列表
+    :param event: 事件
+    :return: None
+    """
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception:
+            # 钩子出错的情况很少，此时才导入 logging
+            import logging
+            logging.getLogger(__name__).exception('hook error')
+
+
+def wrap_iter_content(response, handlers, method, endpoint, url):
+    """
+    包装流式响应的 iter_content，每读取一块调用 on_download_chunk 钩子
+    :param response: 以 stream=True 发送请求得到的 requests.Response
+    :param handlers: 钩子函数列表
+    :return: None
+    """
+    iter_content = response.iter_content
+
+    def wrapped(*args, **kwargs):
+        for chunk in iter_content(*args, **kwargs):
+            emit(handlers, ChunkEvent(method, endpoint, url, len(chunk)))
+            yield chunk
+
+    response.iter_content = wrapped
+
+
+class EndpointResolver(object):
+    """
+    将请求 url 还原为注册过的接口URL模板，如 .../instance/abc 还原为 .../instance/:instance_id
+    """
+
+    PARAMETER = re.compile(r':[A-Za-z_]+')
+
+    def __init__(self):
+        self._patterns = []
+        self._templates = set()
+        self._lock = threading.Lock()
+
+    def register(self, templates):
+        """
+        注册接口URL模板
+        :param templates: URL模板的可迭代对象
+        :return: None
+        """
+        with self._lock:
+            patterns = list(self._patterns)
+            for template in templates:
+                if template in self._templates:
+                    continue
+                self._templates.add(template)
+                patterns.append((template.count('/'), re.compile(self._regex(template)),
+                                 template))
+            # 层级深的优先匹配
+            patterns.sort(key=lambda pattern: -pattern[0])
+            self._patterns = patterns
+
+    def _regex(self, template):
+        """
+        URL模板对应的正则表达式
+        """
+        position = 0
+        parts = []
+        for match in self.PARAMETER.finditer(template):
+            parts.append(re.escape(template[position:match.start()]))
+            parts.append('[^/?]+')
+            position = match.end()
+        parts.append(re.escape(template[position:]))
+        return ''.join(parts)
+
+    def resolve(self, url):
+        """
+        获得 url 对应的URL模板
+        :param url: 请求url(不含查询参数)
+        :return: URL模板，未注册时返回 None
+        """
+        for _, pattern, template in self._patterns:
+            if pattern.fullmatch(url):
+                return template
+        return None
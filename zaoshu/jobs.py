@@ -0,0 +1,442 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+jobs 模块提供批量运行实例并收集结果的编排 BatchJob：运行 → 等待 → 下载/处理 各阶段有独立的并发数，
+同时进行的实例数有上限，结果未被取走时各阶段依次停止推进(背压)；
+每个实例的进度记录在本地 SQLite 中，进程中断后再次运行从中断的阶段继续，已新建的任务不会重复运行
+"""
+import json
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import time, monotonic
+
+from zaoshu.batch import fan_out
+from zaoshu.codec import decode_json
+from zaoshu.pages import item_time
+from zaoshu.wait import POLL_INITIAL, POLL_MAXIMUM, Backoff, is_task_finished, task_status
+from zaoshu.wait import check_poll, run_task_id
+
+# 实例的状态
+STATE_PENDING = 'pending'
+STATE_SUBMITTING = 'submitting'
+STATE_RUNNING = 'running'
+STATE_FINISHED = 'finished'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+# 任务运行失败的状态，再次运行时重新运行实例
+TASK_FAILED_STATUS = ('failed', 'failure', 'error', 'stopped', 'cancelled', 'canceled',
+                      'timeout')
+# 运行实例的请求结果未知时，再次运行认领请求前该秒数之后新建的任务，允许本机与服务器的时间偏差
+ADOPT_SKEW = 60
+
+# 一个实例的最终结果，state 为 done 或 failed
+JobResult = namedtuple('JobResult', ['instance_id', 'task_id', 'state', 'result', 'error'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    instance_id TEXT PRIMARY KEY,
+    body TEXT,
+    state TEXT NOT NULL,
+    task_id TEXT,
+    status TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    submitted_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+'''
+
+
+class BatchJob(object):
+    """
+    批量运行实例并收集结果
+    """
+
+    def __init__(self, instance, db_path, handler=None, file_type='csv', save_path=None,
+                 run_workers=4, wait_workers=10, handle_workers=4, max_active=100,
+                 timeout=None, initial=POLL_INITIAL, maximum=POLL_MAXIMUM,
+                 finished=is_task_finished):
+        """
+        构造函数
+        :param instance: Instance
+        :param db_path: SQLite 状态文件路径
+        :param handler: 处理结束的任务的函数 handler(instance_id, task_id, task)，返回值记录在状态中，
+                        task 为任务详情 dict，如下载后用 ParallelParser 解析；
+                        为None时以断点续传方式下载结果文件到 save_path
+        :param file_type: 下载的文件类型
+        :param save_path: 保存目录，handler 为None时使用
+        :param run_workers: 同时运行实例的请求数
+        :param wait_workers: 同时查询任务详情的请求数
+        :param handle_workers: 同时处理(下载)的任务数
+        :param max_active: 已开始运行、尚未完成处理的实例数上限
+        :param timeout: 每个任务最长等待时间(秒)，超时记为失败，再次运行时继续等待
+        :param initial: 第一次查询任务详情前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        """
+        if handler is None and not save_path:
+            raise Exception("save_path Error")
+        self.instance = instance
+        self.db_path = db_path
+        self.handler = handler or self._download
+        self.file_type = file_type
+        self.save_path = save_path
+        self.run_workers = run_workers
+        self.wait_workers = wait_workers
+        self.handle_workers = handle_workers
+        self.max_active = max_active
+        self.timeout = timeout
+        self.initial = initial
+        self.maximum = maximum
+        self.finished = finished
+
+        # 各阶段的线程共用一个连接
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        关闭状态文件
+        :return: None
+        """
+        with self._db_lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _execute(self, sql, parameters=()):
+        with self._db_lock:
+            with self._db:
+                return self._db.execute(sql, parameters).fetchall()
+
+    def _update(self, instance_id, **columns):
+        columns['updated_at'] = time()
+        self._execute('UPDATE jobs SET %s WHERE instance_id = ?'
+                      % ', '.join('%s = ?' % name for name in columns),
+                      list(columns.values()) + [instance_id])
+
+    def _download(self, instance_id, task_id, task):
+        """
+        默认的处理函数：断点续传下载结果文件
+        :return: 保存文件的路径
+        """
+        return self.instance.download_run_data(instance_id, task_id, file_type=self.file_type,
+                                               save_file=True, save_path=self.save_path,
+                                               resume=True)
+
+    def add(self, instances):
+        """
+        添加要运行的实例，已添加的实例保持原状态
+        :param instances: {实例ID: 运行参数}、(实例ID, 运行参数) 或实例ID的可迭代对象
+        :return: 新添加的实例数
+        """
+        if isinstance(instances, dict):
+            instances = instances.items()
+        now = time()
+        rows = []
+        for item in instances:
+            instance_id, body = (item, None) if isinstance(item, str) else item
+            if body is not None and not isinstance(body, str):
+                body = json.dumps(body)
+            rows.append((str(instance_id), body, STATE_PENDING, now))
+        with self._db_lock:
+            with self._db:
+                before = self._db.total_changes
+                self._db.executemany('INSERT OR IGNORE INTO jobs (instance_id, body, state, '
+                                     'updated_at) VALUES (?, ?, ?, ?)', rows)
+                return self._db.total_changes - before
+
+    def state(self, instance_id):
+        """
+        获得实例的状态
+        :param instance_id: 实例ID
+        :return: dict，未添加时返回 None
+        """
+        with self._db_lock:
+            cursor = self._db.execute('SELECT * FROM jobs WHERE instance_id = ?', (instance_id,))
+            names = [column[0] for column in cursor.description]
+            row = cursor.fetchone()
+        return dict(zip(names, row)) if row is not None else None
+
+    def counts(self):
+        """
+        各状态的实例数
+        :return: {状态: 实例数}
+        """
+        return dict(self._execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'))
+
+    def run(self, instances=None):
+        """
+        运行所有未完成的实例(包括上次失败的)，按完成的顺序产出结果
+        结果未被取走时不再开始新的实例；提前停止迭代时进行中的实例保持当前状态，下次运行继续
+        :param instances: 先添加的实例，见 add
+        :return: 生成器 JobResult
+        """
+        if instances is not None:
+            self.add(instances)
+        rows = self._execute('SELECT instance_id, body, state, task_id, status, submitted_at '
+                             'FROM jobs WHERE state != ? ORDER BY rowid', (STATE_DONE,))
+        if not rows:
+            return
+        pipeline = _Pipeline(self, rows)
+        try:
+            for _ in range(len(rows)):
+                yield pipeline.next()
+        finally:
+            pipeline.stop()
+
+    @staticmethod
+    def _stage(task_id, status):
+        """
+        从哪个阶段继续: run, wait 或 handle；任务结束后才记录任务状态
+        """
+        if task_id is None or status in TASK_FAILED_STATUS:
+            return 'run'
+        return 'wait' if status is None else 'handle'
+
+    def _adopt(self, instance_id, submitted_at):
+        """
+        上次中断于运行实例的请求时，查找该请求可能新建的任务：
+        取创建时间不早于请求前 ADOPT_SKEW 秒的最新任务，与任务列表的顺序无关
+        :return: 任务ID，没有或任务没有时间字段(无法判断是否由该请求新建)时返回 None
+        """
+        adopted = None
+        for task in self.instance.iter_tasks(instance_id, since=submitted_at - ADOPT_SKEW,
+                                             prefetch=False):
+            created = item_time(task)
+            if created is None:
+                return None
+            if adopted is None or created > adopted[0]:
+                adopted = (created, str(task['id']))
+        return adopted[1] if adopted is not None else None
+
+
+class _Pipeline(object):
+    """
+    一次运行的各阶段线程：feeder 按并发上限分发实例，运行及处理在线程池中进行，
+    一个轮询线程等待所有任务结束
+    """
+
+    def __init__(self, job, rows):
+        self.job = job
+        self.results = queue.Queue(maxsize=max(1, job.handle_workers))
+        self._stopped = threading.Event()
+        self._slots = threading.Semaphore(job.max_active)
+        self._inbox = queue.Queue()
+        self._runners = ThreadPoolExecutor(job.run_workers)
+        self._handlers = ThreadPoolExecutor(job.handle_workers)
+        # 已提交、尚未完成的 Future，停止时取消未开始的
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+        # 阶段中未预期的异常，由 next 抛给调用方
+        self._error = None
+        self._threads = [threading.Thread(target=self._guard, args=(self._feed, rows)),
+                         threading.Thread(target=self._guard, args=(self._wait,))]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def next(self):
+        """
+        取出下一个结果，某个阶段异常退出时抛出该异常，不会一直等待
+        :return: JobResult
+        """
+        while True:
+            try:
+                return self.results.get(timeout=0.1)
+            except queue.Empty:
+                if self._error is not None:
+                    raise self._error
+
+    def stop(self):
+        """
+        停止所有阶段，取消未开始的运行及处理，等待进行中的请求结束
+        """
+        self._stopped.set()
+        # 先等待分发线程结束，之后不再提交新的运行及处理
+        for thread in self._threads:
+            thread.join()
+        with self._futures_lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        self._runners.shutdown()
+        self._handlers.shutdown()
+        # 已完成但未被取走的结果，下次运行重新处理
+        while True:
+            try:
+                self._undelivered(self.results.get_nowait())
+            except queue.Empty:
+                break
+
+    def _undelivered(self, result):
+        if result.state == STATE_DONE:
+            self.job._update(result.instance_id, state=STATE_FINISHED)
+
+    def _guard(self, target, *args):
+        """
+        运行一个阶段，未预期的异常记录下来交给调用方
+        """
+        try:
+            target(*args)
+        except Exception as error:
+            self._error = error
+            self._stopped.set()
+
+    def _submit(self, executor, target, *args):
+        """
+        提交到线程池，记录 Future 以便停止时取消
+        """
+        future = executor.submit(self._guard, target, *args)
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future):
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    def _feed(self, rows):
+        for instance_id, body, state, task_id, status, submitted_at in rows:
+            while not self._slots.acquire(timeout=0.1):
+                if self._stopped.is_set():
+                    return
+            if self._stopped.is_set():
+                return
+            stage = self.job._stage(task_id, status)
+            if stage == 'run':
+                # 运行实例的请求结果未知(中断或连接出错)时先认领可能已新建的任务
+                adopt = submitted_at if task_id is None else None
+                self._submit(self._runners, self._run, instance_id, body, adopt)
+            elif stage == 'wait':
+                self._inbox.put((instance_id, task_id))
+            else:
+                self._submit(self._handlers, self._handle, instance_id, task_id, None)
+
+    def _finish(self, result):
+        """
+        记录实例的最终结果并交给调用方，调用方未取走时阻塞(背压)
+        """
+        job = self.job
+        if result.state == STATE_DONE:
+            job._update(result.instance_id, state=STATE_DONE, error=None,
+                        result=json.dumps(result.result, default=str))
+        else:
+            job._update(result.instance_id, state=STATE_FAILED, error=repr(result.error))
+        self._slots.release()
+        while not self._stopped.is_set():
+            try:
+                self.results.put(result, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        self._undelivered(result)
+
+    def _run(self, instance_id, body, adopt):
+        job = self.job
+        try:
+            task_id = job._adopt(instance_id, adopt) if adopt is not None else None
+            if task_id is None:
+                # 先记录为运行中，请求结果未知时下次运行据此认领任务
+                job._execute('UPDATE jobs SET state = ?, task_id = NULL, status = NULL, '
+                             'submitted_at = ?, attempts = attempts + 1, updated_at = ? '
+                             'WHERE instance_id = ?',
+                             (STATE_SUBMITTING, time(), time(), instance_id))
+                response = job.instance.run(instance_id, body=body)
+                if response.status_code != 200:
+                    job._update(instance_id, submitted_at=None)
+                    raise Exception("run Error: %d %s" % (response.status_code, response.text))
+                task_id = str(run_task_id(response))
+            job._update(instance_id, state=STATE_RUNNING, task_id=task_id, status=None)
+        except Exception as error:
+            self._finish(JobResult(instance_id, None, STATE_FAILED, None, error))
+            return
+        self._inbox.put((instance_id, task_id))
+
+    def _wait(self):
+        """
+        在一个轮询循环中等待所有任务结束，每个任务独立退避，到期的任务并发查询
+        """
+        job = self.job
+        waiting = {}
+        # 整个运行过程共用一个查询线程池，不在每轮查询时重新创建线程
+        with ThreadPoolExecutor(job.wait_workers) as pollers:
+            while not self._stopped.is_set():
+                wake = min([state[0] for state in waiting.values()] or [monotonic() + 0.1])
+                try:
+                    key = self._inbox.get(timeout=max(0, min(wake - monotonic(), 0.1)))
+                    backoff = Backoff(job.initial, job.maximum)
+                    deadline = None if job.timeout is None else monotonic() + job.timeout
+                    waiting[key] = [monotonic() + backoff.next(), backoff, deadline]
+                    continue
+                except queue.Empty:
+                    pass
+
+                now = monotonic()
+                due = [key for key, state in waiting.items() if state[0] <= now]
+                if not due:
+                    continue
+                for result in fan_out(lambda key: job.instance.task(*key), due,
+                                      job.wait_workers, executor=pollers):
+                    instance_id, task_id = result.key
+                    state = waiting[result.key]
+                    if result.error is None and job.finished(result.response):
+                        del waiting[result.key]
+                        self._finished(instance_id, task_id, result.response)
+                        continue
+                    try:
+                        if result.error is None:
+                            check_poll(result.key, result.response)
+                    except Exception as error:
+                        # 任务不存在等 4xx 响应，继续轮询也不会结束
+                        del waiting[result.key]
+                        self._finish(JobResult(instance_id, task_id, STATE_FAILED, None, error))
+                        continue
+                    if state[2] is not None and monotonic() >= state[2]:
+                        del waiting[result.key]
+                        self._finish(JobResult(instance_id, task_id, STATE_FAILED, None,
+                                               TimeoutError('task not finished: %s' % task_id)))
+                    else:
+                        # 查询出错按未结束处理，继续退避
+                        state[0] = monotonic() + state[1].next()
+
+    def _finished(self, instance_id, task_id, response):
+        """
+        任务结束：失败的任务记为失败，否则交给处理阶段
+        """
+        status = task_status(response)
+        self.job._update(instance_id, state=STATE_FINISHED, status=status)
+        if status in TASK_FAILED_STATUS:
+            self._finish(JobResult(instance_id, task_id, STATE_FAILED, None,
+                                   Exception("task Error: %s %s" % (task_id, status))))
+            return
+        try:
+            self._submit(self._handlers, self._handle, instance_id, task_id,
+                         decode_json(response).get('data'))
+        except RuntimeError:
+            # 已停止，下次运行从处理阶段继续
+            pass
+
+    def _handle(self, instance_id, task_id, task):
+        job = self.job
+        try:
+            if task is None:
+                task = decode_json(job.instance.task(instance_id, task_id)).get('data')
+            result = job.handler(instance_id, task_id, task)
+        except Exception as error:
+            self._finish(JobResult(instance_id, task_id, STATE_FAILED, None, error))
+            return
+        self._finish(JobResult(instance_id, task_id, STATE_DONE, result, None))
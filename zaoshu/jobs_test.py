@@ -0,0 +1,176 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+批量运行编排的单元测试
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from time import time
+
+from zaoshu import ZaoshuSdk
+from zaoshu.jobs import BatchJob, STATE_DONE, STATE_FAILED, STATE_SUBMITTING
+from zaoshu.mock import MockServer, csv_result
+from zaoshu.transport import MemoryTransport
+
+
+class TestBatchJob(unittest.TestCase):
+    """
+    BatchJob 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(instances=12, tasks=1, task_duration=0.1, result_rows=20)
+        self.addCleanup(self.server.stop)
+        self.sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                             transport=MemoryTransport(self.server.handle))
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.db_path = os.path.join(self.directory, 'job.db')
+        self.instances = dict(('instance-%d' % index, {'page': index}) for index in range(12))
+
+    def job(self, handler, **options):
+        """创建 BatchJob"""
+        job = BatchJob(self.sdk.instance, self.db_path, handler=handler, initial=0.02,
+                       maximum=0.05, **options)
+        self.addCleanup(job.close)
+        return job
+
+    def task_counts(self):
+        """各实例的任务数"""
+        return [len(self.server._tasks['instance-%d' % index]) for index in range(12)]
+
+    def test_run(self):
+        """测试各实例运行一次，同时进行的实例数不超过上限"""
+        lock = threading.Lock()
+        active = [0, 0]
+        run = self.sdk.instance.run
+
+        def counted_run(instance_id, body=None):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            return run(instance_id, body=body)
+
+        def handler(instance_id, task_id, task):
+            with lock:
+                active[0] -= 1
+            return task['status']
+
+        self.sdk.instance.run = counted_run
+        job = self.job(handler, max_active=3)
+        results = list(job.run(self.instances))
+        self.assertEqual(sorted(result.instance_id for result in results), sorted(self.instances))
+        self.assertTrue(all(result.state == STATE_DONE and result.result == 'success'
+                            for result in results))
+        self.assertLessEqual(active[1], 3)
+        self.assertEqual(self.task_counts(), [2] * 12)
+        self.assertEqual(job.counts(), {STATE_DONE: 12})
+        self.assertEqual(list(job.run()), [])
+
+    def test_resume(self):
+        """测试提前停止后再次运行只继续未完成的实例，已新建的任务不重复运行"""
+        job = self.job(lambda instance_id, task_id, task: task_id, max_active=4)
+        results = job.run(self.instances)
+        first = [next(results), next(results)]
+        results.close()
+        job.close()
+
+        job = self.job(lambda instance_id, task_id, task: task_id)
+        rest = list(job.run())
+        self.assertEqual(sorted(result.instance_id for result in first + rest),
+                         sorted(self.instances))
+        self.assertEqual(self.task_counts(), [2] * 12)
+
+    def test_adopt(self):
+        """测试运行实例的请求结果未知时认领已新建的任务"""
+        job = self.job(lambda instance_id, task_id, task: task_id)
+        job.add(['instance-0'])
+        submitted_at = time()
+        job._update('instance-0', state=STATE_SUBMITTING, submitted_at=submitted_at)
+        # 已有的任务早于请求
+        self.server._tasks['instance-0'][0]['created_at'] -= 3600
+        task_id = self.sdk.instance.run('instance-0').json()['data']['id']
+
+        # 与任务列表的顺序无关
+        iter_tasks = self.sdk.instance.iter_tasks
+        self.sdk.instance.iter_tasks = lambda *args, **filters: reversed(
+            list(iter_tasks(*args, **filters)))
+        self.assertEqual(job._adopt('instance-0', submitted_at), task_id)
+        del self.sdk.instance.iter_tasks
+
+        results = list(job.run())
+        self.assertEqual(results[0].task_id, task_id)
+        self.assertEqual(self.task_counts()[0], 2)
+
+    def test_adopt_without_time(self):
+        """测试任务没有时间字段时不认领，重新运行实例"""
+        job = self.job(lambda instance_id, task_id, task: task_id)
+        job.add(['instance-0'])
+        job._update('instance-0', state=STATE_SUBMITTING, submitted_at=time())
+        task_id = self.sdk.instance.run('instance-0').json()['data']['id']
+        for task in self.server._tasks['instance-0']:
+            del task['created_at']
+        results = list(job.run())
+        self.assertNotEqual(results[0].task_id, task_id)
+        self.assertEqual(self.task_counts()[0], 3)
+
+    def test_task_missing(self):
+        """测试任务不存在(4xx)时记为失败，不会一直等待"""
+        task = self.sdk.instance.task
+        self.sdk.instance.task = lambda instance_id, task_id: task(
+            instance_id, 'deleted' if instance_id == 'instance-1' else task_id)
+        job = self.job(lambda instance_id, task_id, task: task_id)
+        results = dict((result.instance_id, result) for result in job.run(self.instances))
+        self.assertEqual(results['instance-1'].state, STATE_FAILED)
+        self.assertIn('404', str(results['instance-1'].error))
+        self.assertEqual(job.counts(), {STATE_DONE: 11, STATE_FAILED: 1})
+
+    def test_stage_error(self):
+        """测试阶段线程异常退出时 run 抛出异常，不会一直等待"""
+        def finished(response):
+            raise ValueError('broken stage')
+
+        job = self.job(lambda instance_id, task_id, task: task_id, finished=finished)
+        with self.assertRaises(ValueError):
+            list(job.run(self.instances))
+
+    def test_failed(self):
+        """测试处理失败的实例下次运行时重试处理，不重新运行实例"""
+        def handler(instance_id, task_id, task):
+            if instance_id == 'instance-1':
+                raise ValueError('failed')
+            return task_id
+
+        job = self.job(handler)
+        results = dict((result.instance_id, result) for result in job.run(self.instances))
+        self.assertEqual(results['instance-1'].state, STATE_FAILED)
+        self.assertIn('ValueError', job.state('instance-1')['error'])
+
+        job.handler = lambda instance_id, task_id, task: task_id
+        results = list(job.run())
+        self.assertEqual([(result.instance_id, result.state) for result in results],
+                         [('instance-1', STATE_DONE)])
+        self.assertEqual(self.task_counts(), [2] * 12)
+
+    def test_download(self):
+        """测试默认下载结果文件"""
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        job = BatchJob(self.sdk.instance, self.db_path, save_path='/data', initial=0.02)
+        self.addCleanup(job.close)
+        results = list(job.run(['instance-0', 'instance-1']))
+        for result in results:
+            with open(result.result, 'rb') as file:
+                self.assertEqual(file.read(), csv_result(20))
+        with self.assertRaises(Exception):
+            BatchJob(self.sdk.instance, self.db_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
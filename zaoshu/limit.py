@@ -0,0 +1,230 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+limit 模块提供客户端限流 RateLimiter：令牌桶限制请求速率，AIMD 自适应并发控制在
+429/5xx 时减半并发、成功后逐步恢复，Retry-After 期间暂停所有请求，可在多个线程及
+使用同一 api key 的多个 ZaoshuSdk 间共用
+"""
+import threading
+from email.utils import parsedate_tz, mktime_tz
+from time import monotonic, sleep, time
+
+# 表示服务器过载、需要降低并发的状态码
+THROTTLE_STATUS = (429, 500, 502, 503, 504)
+
+
+def retry_after(response):
+    """
+    解析响应头 Retry-After
+    :param response: requests.Response
+    :return: 需要等待的秒数，没有时返回 None
+    """
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time())
+
+
+class TokenBucket(object):
+    """
+    令牌桶，线程安全
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        构造函数
+        :param rate: 每秒产生的令牌数
+        :param burst: 桶的容量，默认为 rate(至少为1)
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        取走一个令牌，令牌不足时预支，之后的请求依次排队
+        :return: 取得令牌前需要等待的秒数
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self):
+        """
+        取得一个令牌，不足时阻塞等待
+        :return: 等待的秒数
+        """
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency(object):
+    """
+    AIMD 自适应并发控制：每个成功的请求使并发上限增加 increase/上限(约每轮增加 increase)，
+    过载时乘以 decrease；同一轮中的多个过载只减少一次，避免并发被连续压到最低
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=64, increase=1.0, decrease=0.5):
+        """
+        构造函数
+        :param initial: 初始并发上限
+        :param minimum: 最小并发上限
+        :param maximum: 最大并发上限
+        :param increase: 每轮增加的并发数
+        :param decrease: 过载时的缩减比例
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._active = 0
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        当前的并发上限
+        :return: int
+        """
+        return int(self._limit)
+
+    @property
+    def active(self):
+        """
+        正在进行的请求数
+        """
+        return self._active
+
+    def acquire(self):
+        """
+        等待并发名额
+        :return: 名额所属的轮次，release 时传回
+        """
+        with self._condition:
+            while self._active >= int(self._limit):
+                self._condition.wait()
+            self._active += 1
+            return self._epoch
+
+    def release(self, epoch, throttled=False):
+        """
+        归还并发名额并调整并发上限
+        :param epoch: acquire 返回的轮次
+        :param throttled: 请求是否遇到过载，None为请求未发送、不调整上限
+        :return: None
+        """
+        with self._condition:
+            self._active -= 1
+            if throttled is None:
+                pass
+            elif throttled:
+                if epoch == self._epoch:
+                    self._limit = max(float(self.minimum), self._limit * self.decrease)
+                    self._epoch += 1
+            else:
+                self._limit = min(float(self.maximum),
+                                  self._limit + self.increase / self._limit)
+            self._condition.notify_all()
+
+
+class RateLimiter(object):
+    """
+    客户端限流，组合令牌桶及自适应并发控制
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rate=None, burst=None, concurrency=8, min_concurrency=1,
+                 max_concurrency=64, throttle_status=THROTTLE_STATUS):
+        """
+        构造函数
+        :param rate: 每秒最多发送的请求数，None为不限制速率
+        :param burst: 允许的突发请求数，默认为 rate
+        :param concurrency: 初始并发上限
+        :param min_concurrency: 最小并发上限
+        :param max_concurrency: 最大并发上限
+        :param throttle_status: 表示过载的状态码
+        """
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AdaptiveConcurrency(concurrency, min_concurrency, max_concurrency)
+        self.throttle_status = tuple(throttle_status)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """
+        在指定时间内暂停发送请求，用于 Retry-After
+        :param seconds: 秒
+        :return: None
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    @classmethod
+    def shared(cls, api_key, **options):
+        """
+        获得某个 api key 共用的限流器，第一次调用时以 options 创建
+        :param api_key: api key
+        :param options: 见 RateLimiter 构造函数
+        :return: RateLimiter
+        """
+        with cls._shared_lock:
+            limiter = cls._shared.get(api_key)
+            if limiter is None:
+                limiter = cls._shared[api_key] = cls(**options)
+            return limiter
+
+    def acquire(self):
+        """
+        发送请求前调用，等待并发名额及令牌
+        :return: 凭证，请求结束后传给 release
+        """
+        epoch = self.concurrency.acquire()
+        try:
+            wait = self._paused_until - monotonic()
+            if wait > 0:
+                sleep(wait)
+            if self.bucket is not None:
+                self.bucket.acquire()
+        except BaseException:
+            self.concurrency.release(epoch, None)
+            raise
+        return epoch
+
+    def release(self, token, response=None, error=None):
+        """
+        请求结束后调用
+        :param token: acquire 返回的凭证
+        :param response: 响应，请求出错时为 None
+        :param error: 请求的异常，response 与 error 均为 None 时不调整并发上限
+        :return: 服务器要求等待的秒数(Retry-After)，没有时返回 None
+        """
+        delay = None
+        throttled = error is not None
+        if response is None and error is None:
+            # 请求未完成(如被中断)，不调整并发上限
+            throttled = None
+        elif response is not None and response.status_code in self.throttle_status:
+            throttled = True
+            delay = retry_after(response)
+            if delay:
+                self.pause(delay)
+        self.concurrency.release(token, throttled)
+        return delay
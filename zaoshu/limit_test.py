@@ -0,0 +1,107 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+客户端限流的单元测试
+"""
+import threading
+import unittest
+from time import monotonic, sleep
+
+from zaoshu import ZaoshuRequests
+from zaoshu.batch import fan_out
+from zaoshu.limit import TokenBucket, AdaptiveConcurrency, RateLimiter
+from zaoshu.zaoshu_test import LocalServer
+
+
+class TestTokenBucket(unittest.TestCase):
+    """
+    令牌桶 TokenBucket 单元测试
+    """
+
+    def test_rate(self):
+        """测试令牌用尽后按速率发放"""
+        bucket = TokenBucket(50, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        waits = [bucket.reserve() for _ in range(3)]
+        self.assertAlmostEqual(waits[0], 0.02, delta=0.005)
+        self.assertAlmostEqual(waits[2], 0.06, delta=0.005)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    """
+    自适应并发控制 AdaptiveConcurrency 单元测试
+    """
+
+    def test_aimd(self):
+        """测试过载时减半、同一轮只减少一次、成功后逐步恢复"""
+        concurrency = AdaptiveConcurrency(initial=8, minimum=1, maximum=10)
+        epochs = [concurrency.acquire() for _ in range(8)]
+        self.assertEqual(concurrency.active, 8)
+        for epoch in epochs[:3]:
+            concurrency.release(epoch, True)
+        self.assertEqual(concurrency.limit, 4)
+
+        for epoch in epochs[3:]:
+            concurrency.release(epoch, False)
+        self.assertEqual(concurrency.limit, 5)
+        for _ in range(100):
+            concurrency.release(concurrency.acquire(), False)
+        self.assertEqual(concurrency.limit, 10)
+
+        epoch = concurrency.acquire()
+        concurrency.release(epoch, None)
+        self.assertEqual(concurrency.limit, 10)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    客户端限流 RateLimiter 与 ZaoshuRequests 集成的单元测试
+    """
+
+    def test_shared(self):
+        """测试同一 api key 共用限流器"""
+        limiter = RateLimiter.shared('shared-key', rate=10)
+        self.assertIs(RateLimiter.shared('shared-key'), limiter)
+        self.assertIsNot(RateLimiter.shared('other-key'), limiter)
+
+    def test_retry_after(self):
+        """测试 429 时遵守 Retry-After 重试，包括 POST"""
+        limiter = RateLimiter(concurrency=4)
+        with LocalServer([(429, {'Retry-After': '0.3'}, b''), (200, {}, b'ok')]) as server:
+            with ZaoshuRequests('key', 'secret', rate_limiter=limiter,
+                                backoff_factor=0.01) as request:
+                start = monotonic()
+                response = request.post(server.url, body='{}')
+                self.assertEqual(response.status_code, 200)
+                self.assertGreaterEqual(monotonic() - start, 0.3)
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(limiter.concurrency.limit, 2)
+        self.assertEqual(limiter.concurrency.active, 0)
+
+    def test_concurrency(self):
+        """测试同时进行的请求不超过并发上限"""
+        state = {'active': 0, 'peak': 0}
+        lock = threading.Lock()
+
+        def respond(handler):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            sleep(0.02)
+            with lock:
+                state['active'] -= 1
+            return 200, {}, b'ok'
+
+        limiter = RateLimiter(concurrency=3, max_concurrency=3)
+        with LocalServer([(200, None, respond)]) as server:
+            with ZaoshuRequests('key', 'secret', rate_limiter=limiter,
+                                pool_maxsize=10) as request:
+                results = list(fan_out(lambda _: request.get(server.url), range(20), 10))
+        self.assertTrue(all(result.response.status_code == 200 for result in results))
+        self.assertLessEqual(state['peak'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
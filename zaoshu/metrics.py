@@ -0,0 +1,251 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+metrics 模块提供基于 ZaoshuRequests 钩子的指标收集 Metrics：按接口URL模板统计
+延迟直方图、传输字节数、错误数、重试数及签名耗时，可导出为 Prometheus 文本或 dict
+"""
+import threading
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+from zaoshu.hooks import AFTER_SEND, ON_RETRY, ON_DOWNLOAD_CHUNK
+
+# 延迟直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 没有URL模板时使用的接口名
+UNKNOWN_ENDPOINT = 'unknown'
+# Prometheus 指标名前缀
+PREFIX = 'zaoshu_'
+
+
+def endpoint_label(endpoint):
+    """
+    URL模板的路径，如 /v2/instance/:instance_id/task/:task_id
+    :param endpoint: URL模板
+    :return: str
+    """
+    if not endpoint:
+        return UNKNOWN_ENDPOINT
+    return urlsplit(endpoint).path or endpoint
+
+
+class Histogram(object):
+    """
+    累计直方图
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        记录一个值
+        :param value: 值
+        :return: None
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        各桶的累计数
+        :return: [(上限, 累计数), ...]，最后一个上限为 '+Inf'
+        """
+        result = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class EndpointStats(object):
+    """
+    单个接口(请求类型 + URL模板)的统计
+    """
+
+    __slots__ = ('latency', 'status', 'errors', 'retries', 'sent_bytes', 'received_bytes',
+                 'sign_count', 'sign_seconds')
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.status = {}
+        self.errors = {}
+        self.retries = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self.sign_count = 0
+        self.sign_seconds = 0.0
+
+
+class Metrics(object):
+    """
+    指标收集，线程安全；install 后才会在请求中统计，未安装时没有任何开销
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        构造函数
+        :param buckets: 延迟直方图的桶上限(秒)
+        """
+        self.buckets = tuple(buckets)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def install(self, request):
+        """
+        在 ZaoshuRequests 上注册钩子
+        :param request: ZaoshuRequests
+        :return: self
+        """
+        request.add_hook(AFTER_SEND, self.after_send)
+        request.add_hook(ON_RETRY, self.on_retry)
+        request.add_hook(ON_DOWNLOAD_CHUNK, self.on_download_chunk)
+        return self
+
+    def uninstall(self, request):
+        """
+        移除注册的钩子
+        :param request: ZaoshuRequests
+        :return: None
+        """
+        request.remove_hook(AFTER_SEND, self.after_send)
+        request.remove_hook(ON_RETRY, self.on_retry)
+        request.remove_hook(ON_DOWNLOAD_CHUNK, self.on_download_chunk)
+
+    def _get(self, method, endpoint):
+        key = (method, endpoint_label(endpoint))
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = EndpointStats(self.buckets)
+        return stats
+
+    def after_send(self, event):
+        """
+        after_send 钩子
+        :param event: SendEvent
+        """
+        with self._lock:
+            stats = self._get(event.method, event.endpoint)
+            stats.latency.observe(event.elapsed)
+            stats.sign_count += 1
+            stats.sign_seconds += event.sign_time
+            stats.sent_bytes += event.sent_bytes
+            stats.received_bytes += event.received_bytes
+            if event.error is not None:
+                kind = type(event.error).__name__
+                stats.errors[kind] = stats.errors.get(kind, 0) + 1
+            else:
+                stats.status[event.status_code] = stats.status.get(event.status_code, 0) + 1
+
+    def on_retry(self, event):
+        """
+        on_retry 钩子
+        :param event: RetryEvent
+        """
+        with self._lock:
+            self._get(event.method, event.endpoint).retries += 1
+
+    def on_download_chunk(self, event):
+        """
+        on_download_chunk 钩子
+        :param event: ChunkEvent
+        """
+        with self._lock:
+            self._get(event.method, event.endpoint).received_bytes += event.size
+
+    def reset(self):
+        """
+        清空统计
+        """
+        with self._lock:
+            self._stats = {}
+
+    def snapshot(self):
+        """
+        导出为 dict
+        :return: {(请求类型, URL模板路径): {...}}
+        """
+        with self._lock:
+            return dict((key, {
+                'requests': stats.latency.count,
+                'latency_sum': stats.latency.sum,
+                'latency_buckets': stats.latency.cumulative(),
+                'status': dict(stats.status),
+                'errors': dict(stats.errors),
+                'retries': stats.retries,
+                'sent_bytes': stats.sent_bytes,
+                'received_bytes': stats.received_bytes,
+                'sign_count': stats.sign_count,
+                'sign_seconds': stats.sign_seconds,
+            }) for key, stats in self._stats.items())
+
+    def prometheus(self):
+        """
+        导出为 Prometheus 文本格式
+        :return: str
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append('# HELP %s%s %s' % (PREFIX, name, help_text))
+            lines.append('# TYPE %s%s %s' % (PREFIX, name, kind))
+            for suffix, labels, value in samples:
+                label_text = ','.join('%s="%s"' % (key, _escape(label))
+                                      for key, label in labels)
+                lines.append('%s%s%s{%s} %s' % (PREFIX, name, suffix, label_text,
+                                                _number(value)))
+
+        def labels(key, *extra):
+            return (('method', key[0]), ('endpoint', key[1])) + extra
+
+        keys = sorted(snapshot)
+        samples = []
+        for key in keys:
+            stats = snapshot[key]
+            for bound, count in stats['latency_buckets']:
+                samples.append(('_bucket', labels(key, ('le', _number(bound))), count))
+            samples.append(('_sum', labels(key), stats['latency_sum']))
+            samples.append(('_count', labels(key), stats['requests']))
+        metric('request_duration_seconds', 'histogram',
+               'Time from sending a request to receiving the response headers.', samples)
+        metric('responses_total', 'counter', 'Responses by status code.',
+               [('', labels(key, ('status', str(status))), count) for key in keys
+                for status, count in sorted(snapshot[key]['status'].items())])
+        metric('errors_total', 'counter', 'Requests failed without a response.',
+               [('', labels(key, ('error', kind)), count) for key in keys
+                for kind, count in sorted(snapshot[key]['errors'].items())])
+        metric('retries_total', 'counter', 'Retried requests.',
+               [('', labels(key), snapshot[key]['retries']) for key in keys])
+        metric('sent_bytes_total', 'counter', 'Request body bytes sent.',
+               [('', labels(key), snapshot[key]['sent_bytes']) for key in keys])
+        metric('received_bytes_total', 'counter', 'Response body bytes received.',
+               [('', labels(key), snapshot[key]['received_bytes']) for key in keys])
+        metric('sign_seconds', 'summary', 'Time spent signing requests.',
+               [(suffix, labels(key), snapshot[key][field]) for key in keys
+                for suffix, field in (('_sum', 'sign_seconds'), ('_count', 'sign_count'))])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    """
+    转义 Prometheus 标签值
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    """
+    格式化 Prometheus 数值
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
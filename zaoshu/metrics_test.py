@@ -0,0 +1,107 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+请求钩子及指标收集的单元测试
+"""
+import unittest
+from io import BytesIO
+
+from zaoshu import Instance
+from zaoshu import ZaoshuRequests
+from zaoshu.hooks import EndpointResolver
+from zaoshu.metrics import Metrics
+from zaoshu.zaoshu_test import LocalServer
+
+
+class TestHooks(unittest.TestCase):
+    """
+    ZaoshuRequests 钩子单元测试
+    """
+
+    def test_events(self):
+        """测试各钩子事件"""
+        events = []
+        headers = {'content-disposition': "attachment; filename*=UTF-8''result.csv"}
+        responses = [(503, {}, b''), (200, headers, b'a\n' * 1000)]
+        with LocalServer(responses) as server:
+            with ZaoshuRequests('key', 'secret', backoff_factor=0.01) as request:
+                for event in ('before_sign', 'after_send', 'on_retry', 'on_download_chunk'):
+                    request.add_hook(event, lambda data, event=event: events.append((event, data)))
+                instance = Instance(server.url, request)
+                instance.download_run_data('i1', 't1', fileobj=BytesIO(), chunk_size=500)
+
+        names = [name for name, _ in events]
+        self.assertEqual(names, ['before_sign', 'after_send', 'on_retry', 'before_sign',
+                                 'after_send', 'on_download_chunk', 'on_download_chunk',
+                                 'on_download_chunk', 'on_download_chunk'])
+        self.assertEqual(events[1][1].status_code, 503)
+        self.assertEqual(events[1][1].endpoint, instance.download_url)
+        self.assertEqual(events[2][1].attempt, 1)
+        self.assertEqual(sum(data.size for name, data in events if name == 'on_download_chunk'),
+                         2000)
+
+    def test_hook_error(self):
+        """测试钩子出错不影响请求，移除后不再调用"""
+        def broken(event):
+            raise ValueError('broken hook')
+
+        with LocalServer([(200, {}, b'ok')]) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                request.add_hook('after_send', broken)
+                self.assertEqual(request.get(server.url).status_code, 200)
+                request.remove_hook('after_send', broken)
+                self.assertEqual(request._hooks, {})
+                self.assertRaises(ValueError, request.add_hook, 'after_receive', broken)
+
+    def test_resolver(self):
+        """测试还原URL模板"""
+        resolver = EndpointResolver()
+        resolver.register(['http://h/v2/instances', 'http://h/v2/instance/:instance_id',
+                           'http://h/v2/instance/:instance_id/task/:task_id'])
+        self.assertEqual(resolver.resolve('http://h/v2/instance/a.b'),
+                         'http://h/v2/instance/:instance_id')
+        self.assertEqual(resolver.resolve('http://h/v2/instance/a/task/b'),
+                         'http://h/v2/instance/:instance_id/task/:task_id')
+        self.assertIsNone(resolver.resolve('http://h/v2/instance/a/tasks'))
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    指标收集 Metrics 单元测试
+    """
+
+    def test_collect(self):
+        """测试按URL模板统计并导出"""
+        metrics = Metrics()
+        with LocalServer([(200, {}, b'{"data": {}}')]) as server:
+            with ZaoshuRequests('key', 'secret', max_retries=0) as request:
+                metrics.install(request)
+                instance = Instance(server.url, request)
+                instance.task('i1', 't1')
+                instance.task('i1', 't2')
+                instance.run('i1', body={'a': 1})
+                metrics.uninstall(request)
+                instance.item('i1')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(sorted(snapshot), [('GET', '/instance/:instance_id/task/:task_id'),
+                                            ('POST', '/instance/:instance_id')])
+        task = snapshot[('GET', '/instance/:instance_id/task/:task_id')]
+        self.assertEqual(task['requests'], 2)
+        self.assertEqual(task['status'], {200: 2})
+        self.assertEqual(task['received_bytes'], 24)
+        self.assertEqual(task['latency_buckets'][-1], ('+Inf', 2))
+        self.assertGreater(task['sign_seconds'], 0)
+        self.assertEqual(snapshot[('POST', '/instance/:instance_id')]['sent_bytes'], 8)
+
+        text = metrics.prometheus()
+        self.assertIn('# TYPE zaoshu_request_duration_seconds histogram', text)
+        self.assertIn('zaoshu_responses_total{method="GET",endpoint="/instance/:instance_id/'
+                      'task/:task_id",status="200"} 2', text)
+        self.assertIn('zaoshu_request_duration_seconds_bucket{method="POST",'
+                      'endpoint="/instance/:instance_id",le="+Inf"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
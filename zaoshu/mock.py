@@ -0,0 +1,411 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+mock 模块提供本地模拟的造数 OpenAPI 服务 MockServer，校验 Authorization 签名，
+实现实例、任务、结果文件及用户接口，可设置延迟、错误率及结果文件大小，用于离线测试及性能测试；
+客户端接受时以 gzip 或 deflate 压缩较大的响应(Range 请求除外)
+"""
+import hmac
+import json
+import random
+import re
+import sys
+import threading
+import zipfile
+import zlib
+from email.utils import parsedate_tz, mktime_tz
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from socketserver import ThreadingMixIn
+from time import sleep, time
+from urllib.parse import urlsplit, parse_qsl
+
+from zaoshu.zaoshu import ZaoshuSigner
+
+CONTENT_DISPOSITION = "attachment; filename*=UTF-8''%s"
+
+ROUTES = [
+    ('GET', re.compile(r'/instances$'), 'instances'),
+    ('GET', re.compile(r'/instance/(?P<instance_id>[^/]+)$'), 'instance'),
+    ('PATCH', re.compile(r'/instance/(?P<instance_id>[^/]+)$'), 'edit'),
+    ('POST', re.compile(r'/instance/(?P<instance_id>[^/]+)$'), 'run'),
+    ('GET', re.compile(r'/instance/(?P<instance_id>[^/]+)/schema$'), 'schema'),
+    ('GET', re.compile(r'/instance/(?P<instance_id>[^/]+)/tasks$'), 'tasks'),
+    ('GET', re.compile(r'/instance/(?P<instance_id>[^/]+)/task/(?P<task_id>[^/]+)$'), 'task'),
+    ('GET', re.compile(r'/instance/(?P<instance_id>[^/]+)/task/(?P<task_id>[^/]+)'
+                       r'/result/file$'), 'result'),
+    ('GET', re.compile(r'/user/account$'), 'account'),
+    ('GET', re.compile(r'/user/wallet$'), 'wallet'),
+]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """
+    忽略客户端断开连接的错误(如并行下载中断)，其他错误照常输出
+    """
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        HTTPServer.handle_error(self, request, client_address)
+
+
+def csv_result(rows):
+    """
+    生成 csv 结果
+    :param rows: 行数
+    :return: bytes
+    """
+    lines = ['id,title,price,url\n']
+    lines.extend('%d,item %d,%d.%02d,https://example.com/item/%d\n'
+                 % (index, index, index % 1000, index % 100, index) for index in range(rows))
+    return ''.join(lines).encode('utf-8')
+
+
+def json_result(rows):
+    """
+    生成 json 结果(数组)
+    :param rows: 记录数
+    :return: bytes
+    """
+    return json.dumps([{'id': index, 'title': 'item %d' % index,
+                        'price': '%d.%02d' % (index % 1000, index % 100),
+                        'url': 'https://example.com/item/%d' % index}
+                       for index in range(rows)]).encode('utf-8')
+
+
+def zip_result(rows):
+    """
+    生成 zip 结果，包含 surface.csv 和 depth.csv
+    :param rows: 每个文件的行数
+    :return: bytes
+    """
+    content = BytesIO()
+    with zipfile.ZipFile(content, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('surface.csv', csv_result(rows))
+        zip_file.writestr('depth.csv', csv_result(rows))
+    return content.getvalue()
+
+
+class MockServer(object):
+    """
+    模拟的造数 OpenAPI 服务，在后台线程中运行
+    """
+
+    def __init__(self, api_key='mock-key', api_secret='mock-secret', host='127.0.0.1', port=0,
+                 prefix='/v2', instances=3, tasks=5, result_rows=1000, task_duration=0.2,
+                 latency=0.0, error_rate=0.0, verify=True, max_skew=300, seed=0,
+                 compress_min=1024):
+        """
+        构造函数
+        :param api_key: 接受的 api key
+        :param api_secret: 校验签名使用的 api secret
+        :param host: 监听地址
+        :param port: 监听端口，0为随机端口
+        :param prefix: 接口路径前缀
+        :param instances: 初始的实例数
+        :param tasks: 每个实例初始的已完成任务数
+        :param result_rows: 结果文件的行数
+        :param task_duration: 运行实例新建的任务运行多少秒后结束
+        :param latency: 每个请求增加的延迟(秒)
+        :param error_rate: 返回 500 的概率
+        :param verify: 是否校验签名
+        :param max_skew: 允许的 Date 头与本机时间的最大偏差(秒)
+        :param seed: 随机数种子，保证错误出现的顺序可重现
+        :param compress_min: 客户端接受压缩时压缩的最小响应字节数，None为不压缩
+        """
+        self.api_key = api_key
+        self.signer = ZaoshuSigner(api_key, api_secret)
+        self.prefix = prefix
+        self.result_rows = result_rows
+        self.task_duration = task_duration
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verify = verify
+        self.max_skew = max_skew
+        self.compress_min = compress_min
+        self.requests = 0
+
+        self._random = random.Random(seed)
+        self._results = {}
+        self._lock = threading.Lock()
+        self._instances = {}
+        self._tasks = {}
+        now = int(time())
+        for index in range(instances):
+            instance_id = 'instance-%d' % index
+            self._instances[instance_id] = {'id': instance_id, 'title': 'instance %d' % index,
+                                            'result_notify_uri': None, 'created_at': now}
+            self._tasks[instance_id] = [
+                {'id': 'task-%d' % number, 'status': 'success', 'created_at': now - number}
+                for number in range(tasks)]
+
+        self._thread = None
+        self._server = _Server((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        """
+        接口基本地址，可作为 ZaoshuSdk 的 base_url
+        :return: str
+        """
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d%s' % (host, port, self.prefix)
+
+    def start(self):
+        """
+        在后台线程中启动服务
+        :return: self
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        停止服务
+        :return: None
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def result(self, file_type):
+        """
+        获得某种类型的结果文件，生成后缓存
+        :param file_type: csv, json, zip
+        :return: (文件名, bytes)
+        """
+        with self._lock:
+            if file_type not in self._results:
+                generate = {'csv': csv_result, 'json': json_result, 'zip': zip_result}
+                self._results[file_type] = generate.get(file_type, csv_result)(self.result_rows)
+            suffix = file_type if file_type in ('csv', 'json', 'zip') else 'csv'
+            return 'result.' + suffix, self._results[file_type]
+
+    def check_signature(self, method, path, headers, body):
+        """
+        校验请求签名
+        :return: 错误信息，通过时返回 None
+        """
+        authorization = headers.get('Authorization') or ''
+        if not authorization.startswith('ZAOSHU '):
+            return 'missing signature'
+        api_key, _, signature = authorization[len('ZAOSHU '):].partition(':')
+        if api_key != self.api_key:
+            return 'unknown api key'
+        date = headers.get('Date') or ''
+        parsed = parsedate_tz(date)
+        if parsed is None or (self.max_skew is not None and
+                              abs(time() - mktime_tz(parsed)) > self.max_skew):
+            return 'invalid date'
+        query = dict(parse_qsl(urlsplit(path).query, keep_blank_values=True))
+        expected = self.signer.sign(method, date, query, body)
+        if not hmac.compare_digest(signature.encode('utf-8'), expected.encode('utf-8')):
+            return 'invalid signature'
+        return None
+
+    def _task_status(self, task):
+        if task['status'] == 'running' and time() - task['started'] >= self.task_duration:
+            task['status'] = 'success'
+        return task
+
+    @staticmethod
+    def _page(items, query):
+        if 'page' not in query:
+            return items
+        size = int(query.get('pageSize') or 100)
+        page = int(query['page'])
+        return items[(page - 1) * size:page * size]
+
+    def handle(self, method, path, headers, body):
+        """
+        处理请求
+        :return: (状态码, 响应头, 响应内容 bytes)
+        """
+        with self._lock:
+            self.requests += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if self.latency:
+            sleep(self.latency)
+        if failed:
+            return 500, {}, b'{"message": "mock error"}'
+
+        url = urlsplit(path)
+        if not url.path.startswith(self.prefix):
+            return 404, {}, b'{"message": "not found"}'
+        route_path = url.path[len(self.prefix):]
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(route_path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {}, b'{"message": "not found"}'
+
+        if self.verify:
+            error = self.check_signature(method, path, headers, body)
+            if error:
+                return 401, {}, json.dumps({'message': error}).encode('utf-8')
+
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        status, response_headers, content = getattr(self, '_route_' + name)(
+            query=query, headers=headers, body=body, **match.groupdict())
+        return self._compress(headers, status, response_headers, content)
+
+    def _compress(self, headers, status, response_headers, content):
+        """
+        客户端接受时压缩响应内容
+        """
+        if self.compress_min is None or len(content) < self.compress_min or \
+                status != 200 or headers.get('Range'):
+            return status, response_headers, content
+        accepted = [item.split(';')[0].strip().lower()
+                    for item in (headers.get('Accept-Encoding') or '').split(',')]
+        if 'gzip' in accepted:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            encoding = 'gzip'
+        elif 'deflate' in accepted:
+            compressor = zlib.compressobj(6)
+            encoding = 'deflate'
+        else:
+            return status, response_headers, content
+        response_headers = dict(response_headers)
+        response_headers['Content-Encoding'] = encoding
+        response_headers['Vary'] = 'Accept-Encoding'
+        return status, response_headers, compressor.compress(content) + compressor.flush()
+
+    @staticmethod
+    def _json(data, status=200):
+        return status, {'Content-Type': 'application/json; charset=utf-8'}, \
+            json.dumps({'data': data}).encode('utf-8')
+
+    def _instance_or_404(self, instance_id):
+        instance = self._instances.get(instance_id)
+        if instance is None:
+            return None, (404, {}, b'{"message": "instance not found"}')
+        return instance, None
+
+    def _route_instances(self, query, **_):
+        with self._lock:
+            items = list(self._instances.values())
+        return self._json(self._page(items, query))
+
+    def _route_instance(self, instance_id, **_):
+        instance, error = self._instance_or_404(instance_id)
+        return error or self._json(instance)
+
+    def _route_edit(self, instance_id, body, **_):
+        instance, error = self._instance_or_404(instance_id)
+        if error:
+            return error
+        changes = json.loads(body.decode('utf-8') or '{}')
+        with self._lock:
+            instance.update((key, value) for key, value in changes.items() if value is not None)
+        return self._json(instance)
+
+    def _route_run(self, instance_id, **_):
+        instance, error = self._instance_or_404(instance_id)
+        if error:
+            return error
+        with self._lock:
+            tasks = self._tasks.setdefault(instance_id, [])
+            task = {'id': 'task-%d' % (len(tasks) + 1000), 'status': 'running',
+                    'created_at': int(time()), 'started': time()}
+            tasks.insert(0, task)
+        return self._json({'id': task['id']})
+
+    def _route_schema(self, instance_id, **_):
+        instance, error = self._instance_or_404(instance_id)
+        return error or self._json({'surface': ['id', 'title', 'price', 'url'], 'depth': []})
+
+    def _route_tasks(self, instance_id, query, **_):
+        instance, error = self._instance_or_404(instance_id)
+        if error:
+            return error
+        with self._lock:
+            tasks = [dict(self._task_status(task)) for task in self._tasks.get(instance_id, [])]
+        for task in tasks:
+            task.pop('started', None)
+        return self._json(self._page(tasks, query))
+
+    def _find_task(self, instance_id, task_id):
+        with self._lock:
+            for task in self._tasks.get(instance_id, []):
+                if task['id'] == task_id:
+                    task = dict(self._task_status(task))
+                    task.pop('started', None)
+                    return task
+        return None
+
+    def _route_task(self, instance_id, task_id, **_):
+        task = self._find_task(instance_id, task_id)
+        if task is None:
+            return 404, {}, b'{"message": "task not found"}'
+        return self._json(task)
+
+    def _route_result(self, instance_id, task_id, query, headers, **_):
+        task = self._find_task(instance_id, task_id)
+        if task is None or task['status'] != 'success':
+            return 404, {}, b'{"message": "result not found"}'
+        name, content = self.result(query.get('contentType', 'csv'))
+        response_headers = {'content-disposition': CONTENT_DISPOSITION % name,
+                            'ETag': '"%s-%d"' % (name, len(content)),
+                            'Accept-Ranges': 'bytes'}
+        match = re.match(r'bytes=(\d+)-(\d*)$', headers.get('Range') or '')
+        if_range = headers.get('If-Range')
+        if match and (not if_range or if_range == response_headers['ETag']):
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(content) - 1,
+                      len(content) - 1)
+            if start >= len(content):
+                return 416, {'Content-Range': 'bytes */%d' % len(content)}, b''
+            response_headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(content))
+            return 206, response_headers, content[start:end + 1]
+        return 200, response_headers, content
+
+    def _route_account(self, **_):
+        return self._json({'id': 'user-1', 'name': 'mock', 'email': 'mock@example.com'})
+
+    def _route_wallet(self, **_):
+        return self._json({'balance': 100.0, 'currency': 'CNY'})
+
+    def _handler_class(self):
+        """
+        创建处理HTTP请求的类
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头与内容分两次写入，关闭 Nagle 算法避免与客户端的延迟确认叠加产生 40ms 延迟
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, headers, content = server.handle(self.command, self.path,
+                                                         self.headers, body)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PATCH = _reply
+
+        return Handler
@@ -0,0 +1,68 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+模拟造数 OpenAPI 服务的单元测试
+"""
+import unittest
+from io import BytesIO
+
+import requests
+
+from zaoshu import ZaoshuSdk
+from zaoshu.mock import MockServer, csv_result
+
+
+class TestMockServer(unittest.TestCase):
+    """
+    模拟服务 MockServer 单元测试，同时验证 SDK 与服务的签名规则一致
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(result_rows=100, task_duration=0.05).start()
+        self.addCleanup(self.server.stop)
+        self.sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url=self.server.url, max_retries=0)
+        self.addCleanup(self.sdk.close)
+
+    def test_instances(self):
+        """测试实例及用户接口"""
+        instances = self.sdk.instance.get_instances()
+        self.assertEqual([item.id for item in instances],
+                         ['instance-0', 'instance-1', 'instance-2'])
+        self.assertEqual(self.sdk.instance.edit('instance-1', title='new').status_code, 200)
+        self.assertEqual(self.sdk.instance.get_instance('instance-1').title, 'new')
+        self.assertEqual(len(list(self.sdk.instance.iter_tasks('instance-0', page_size=2))), 5)
+        self.assertEqual(self.sdk.user.get_wallet().balance, 100.0)
+        self.assertEqual(self.sdk.instance.item('missing').status_code, 404)
+
+    def test_run_and_download(self):
+        """测试运行实例、等待任务结束及下载结果"""
+        task_id, response = self.sdk.instance.run_and_wait('instance-0', timeout=5)
+        self.assertEqual(response.json()['data']['status'], 'success')
+
+        fileobj = BytesIO()
+        self.sdk.instance.download_run_data('instance-0', task_id, fileobj=fileobj)
+        self.assertEqual(fileobj.getvalue(), csv_result(100))
+        surface, depth = self.sdk.instance.download_run_data('instance-0', task_id,
+                                                             file_type='zip')
+        self.assertEqual(surface.encode('utf-8'), csv_result(100))
+        rows = list(self.sdk.instance.iter_results('instance-0', task_id, file_type='json'))
+        self.assertEqual(rows[-1]['id'], 99)
+
+    def test_signature(self):
+        """测试拒绝没有签名或签名错误的请求"""
+        self.assertEqual(requests.get(self.server.url + '/instances').status_code, 401)
+        with ZaoshuSdk('mock-key', 'wrong', base_url=self.server.url) as sdk:
+            response = sdk.instance.list()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['message'], 'invalid signature')
+
+    def test_errors(self):
+        """测试按错误率返回 500"""
+        self.server.error_rate = 1.0
+        self.assertEqual(self.sdk.instance.list().status_code, 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
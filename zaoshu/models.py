@@ -0,0 +1,312 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+models 模块提供基于 __slots__ 的响应模型：每条记录只保存自身的 json 字节，
+第一次访问字段时才解码，字段值保存在 slots 中，大量记录的内存占用远小于 dict
+"""
+import re
+
+from zaoshu.codec import STDLIB, response_codec
+from zaoshu.pages import page_items
+
+# json 中的字符串及括号，用于在不解码的情况下定位记录的边界
+JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+JSON_SPACE = b' \t\r\n'
+
+
+def _value_end(content, start):
+    """
+    获得以括号开始的 json 值的结束位置
+    :param content: json bytes
+    :param start: 值的开始位置，content[start] 为 '{' 或 '['
+    :return: 结束位置(不包含)
+    """
+    depth = 0
+    for match in JSON_TOKEN.finditer(content, start):
+        token = match.group()
+        if token in (b'{', b'['):
+            depth += 1
+        elif token in (b'}', b']'):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError('unexpected end of json')
+
+
+def data_span(content):
+    """
+    定位响应 {"data": ...} 中 data 的值，data 不是对象或数组时返回 None
+    :param content: 响应内容 bytes
+    :return: (start, end)
+    """
+    depth = 0
+    for match in JSON_TOKEN.finditer(content):
+        token = match.group()
+        if token in (b'{', b'['):
+            depth += 1
+        elif token in (b'}', b']'):
+            depth -= 1
+        elif depth == 1 and token == b'"data"':
+            position = match.end()
+            while position < len(content) and content[position] in JSON_SPACE:
+                position += 1
+            if position >= len(content) or content[position:position + 1] != b':':
+                continue
+            position += 1
+            while position < len(content) and content[position] in JSON_SPACE:
+                position += 1
+            if content[position:position + 1] not in (b'{', b'['):
+                return None
+            return position, _value_end(content, position)
+    return None
+
+
+def _is_separator(data):
+    """
+    是否只包含空白及逗号
+    """
+    return not data.translate(None, JSON_SPACE + b',')
+
+
+def split_objects(content, start, end):
+    """
+    切分 json 数组中的对象
+    :param content: json bytes
+    :param start: 数组的开始位置
+    :param end: 数组的结束位置
+    :return: [对象的 bytes, ...]，数组中有非对象元素时返回 None
+    """
+    objects = []
+    depth = 0
+    object_start = None
+    previous = start + 1
+    for match in JSON_TOKEN.finditer(content, start + 1, end - 1):
+        token = match.group()
+        if token in (b'{', b'['):
+            if depth == 0:
+                if token != b'{' or not _is_separator(content[previous:match.start()]):
+                    return None
+                object_start = match.start()
+            depth += 1
+        elif token in (b'}', b']'):
+            depth -= 1
+            if depth == 0:
+                objects.append(content[object_start:match.end()])
+                previous = match.end()
+        elif depth == 0:
+            return None
+    if not _is_separator(content[previous:end - 1]):
+        return None
+    return objects
+
+
+def check_response(response, name):
+    """
+    检查响应状态
+    :param response: requests.Response
+    :param name: 接口名称，用于异常信息
+    :return: None
+    """
+    if response.status_code != 200:
+        raise Exception("%s Error: %d %s" % (name, response.status_code, response.text))
+
+
+class Model(object):
+    """
+    响应模型基类，子类在 FIELDS 中声明 {属性名: (json 字段名, ...)}，并在 __slots__ 中声明同名属性
+    """
+
+    __slots__ = ('_raw', '_codec')
+    FIELDS = {}
+
+    def __init__(self, raw, codec=STDLIB):
+        """
+        构造函数
+        :param raw: 记录的 json bytes
+        :param codec: 解码使用的 JsonCodec，默认为标准库
+        """
+        self._raw = raw
+        self._codec = codec
+
+    @property
+    def raw(self):
+        """
+        记录的原始 json bytes
+        """
+        return self._raw
+
+    def to_dict(self):
+        """
+        解码为 dict
+        :return: dict
+        """
+        return self._codec.loads(self._raw)
+
+    def get(self, key, default=None):
+        """
+        获取 FIELDS 中未声明的字段
+        :param key: json 字段名
+        :param default: 默认值
+        :return: 字段值
+        """
+        data = self.to_dict()
+        return data.get(key, default) if isinstance(data, dict) else default
+
+    def _decode(self):
+        """
+        解码并将声明的字段保存到 slots 中
+        """
+        data = self.to_dict()
+        if not isinstance(data, dict):
+            data = {}
+        for name, keys in self.FIELDS.items():
+            value = None
+            for key in keys:
+                if data.get(key) is not None:
+                    value = data[key]
+                    break
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # 只有 slot 尚未赋值时才会调用
+        if name in type(self).FIELDS:
+            self._decode()
+            return object.__getattribute__(self, name)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name != '_raw' and name in type(self).FIELDS:
+            raise AttributeError('%s is read-only' % name)
+        object.__setattr__(self, name, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._raw == other._raw
+
+    def __hash__(self):
+        return hash(self._raw)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, self._raw.decode('utf-8', 'replace'))
+
+    @classmethod
+    def from_response(cls, response, name=None):
+        """
+        从响应 {"data": {...}} 创建模型
+        :param response: requests.Response
+        :param name: 接口名称，用于异常信息
+        :return: Model
+        """
+        check_response(response, name or cls.__name__)
+        codec = response_codec(response)
+        content = response.content
+        span = data_span(content)
+        if span is None:
+            return cls(codec.dumps(codec.loads(content).get('data')), codec)
+        return cls(content[span[0]:span[1]], codec)
+
+
+class ModelList(list):
+    """
+    模型列表，可通过 response 属性访问原始响应
+    """
+
+    def __init__(self, items, response=None):
+        """
+        构造函数
+        :param items: Model 的可迭代对象
+        :param response: 原始响应
+        """
+        super(ModelList, self).__init__(items)
+        self.response = response
+
+    @classmethod
+    def from_response(cls, model, response, name=None):
+        """
+        从响应 {"data": [...]} 创建模型列表，只切分各记录的 json 字节，不解码
+        :param model: Model 子类
+        :param response: requests.Response
+        :param name: 接口名称，用于异常信息
+        :return: ModelList
+        """
+        check_response(response, name or model.__name__)
+        codec = response_codec(response)
+        content = response.content
+        span = data_span(content)
+        raws = None
+        if span is not None and content[span[0]:span[0] + 1] == b'[':
+            raws = split_objects(content, span[0], span[1])
+        if raws is None:
+            # data 为 {"list": [...]} 等其他格式时先解码再逐条编码
+            raws = [codec.dumps(item) for item in page_items(response)]
+        return cls((model(raw, codec) for raw in raws), response)
+
+
+class InstanceInfo(Model):
+    """
+    爬虫实例
+    """
+
+    FIELDS = {
+        'id': ('id', 'instance_id', 'instanceId'),
+        'title': ('title', 'name'),
+        'status': ('status',),
+        'result_notify_uri': ('result_notify_uri', 'resultNotifyUri'),
+        'created_at': ('created_at', 'createdAt'),
+        'updated_at': ('updated_at', 'updatedAt'),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Task(Model):
+    """
+    实例的任务
+    """
+
+    FIELDS = {
+        'id': ('id', 'task_id', 'taskId'),
+        'instance_id': ('instance_id', 'instanceId'),
+        'status': ('status',),
+        'created_at': ('created_at', 'createdAt', 'start_time', 'startTime'),
+        'finished_at': ('finished_at', 'finishedAt', 'end_time', 'endTime'),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Schema(Model):
+    """
+    实例的数据格式
+    """
+
+    FIELDS = {
+        'surface': ('surface',),
+        'depth': ('depth',),
+        'fields': ('fields', 'columns'),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Account(Model):
+    """
+    用户帐号
+    """
+
+    FIELDS = {
+        'id': ('id', 'user_id', 'userId'),
+        'name': ('name', 'username', 'nickname'),
+        'email': ('email',),
+        'phone': ('phone', 'mobile'),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Wallet(Model):
+    """
+    用户钱包
+    """
+
+    FIELDS = {
+        'balance': ('balance', 'amount'),
+        'currency': ('currency',),
+    }
+    __slots__ = tuple(FIELDS)
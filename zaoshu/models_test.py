@@ -0,0 +1,107 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+响应模型的单元测试
+"""
+import json
+import sys
+import unittest
+
+import requests
+
+from zaoshu import Instance
+from zaoshu import User
+from zaoshu import ZaoshuRequests
+from zaoshu.models import ModelList, InstanceInfo, Task, Wallet, data_span, split_objects
+from zaoshu.zaoshu_test import LocalServer
+
+
+def json_response(data, status_code=200):
+    """创建 json 响应"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(data).encode('utf-8')
+    return response
+
+
+class TestModels(unittest.TestCase):
+    """
+    响应模型单元测试
+    """
+
+    def test_lazy(self):
+        """测试字段在第一次访问时解码"""
+        task = Task(b'{"taskId": "t1", "status": "success", "extra": [1, "}"]}')
+        self.assertRaises(AttributeError, object.__getattribute__, task, 'id')
+        self.assertEqual(task.id, 't1')
+        self.assertEqual(object.__getattribute__(task, 'status'), 'success')
+        self.assertIsNone(task.finished_at)
+        self.assertEqual(task.get('extra'), [1, '}'])
+        self.assertRaises(AttributeError, setattr, task, 'id', 't2')
+        self.assertRaises(AttributeError, getattr, task, 'missing')
+        self.assertFalse(hasattr(task, '__dict__'))
+
+    def test_list(self):
+        """测试切分列表中的记录"""
+        tasks = [{'id': 't%d' % index, 'title': '任务 "%d" {[' % index} for index in range(3)]
+        response = json_response({'code': 0, 'meta': {'data': 1}, 'data': tasks})
+        models = ModelList.from_response(Task, response)
+        self.assertIs(models.response, response)
+        self.assertEqual([model.to_dict() for model in models], tasks)
+        self.assertEqual(models[2].id, 't2')
+
+        # 其他格式的列表
+        models = ModelList.from_response(Task, json_response({'data': {'list': tasks}}))
+        self.assertEqual([model.id for model in models], ['t0', 't1', 't2'])
+        self.assertEqual(ModelList.from_response(Task, json_response({'data': []})), [])
+
+    def test_split(self):
+        """测试定位 data 及切分对象"""
+        content = b'{"a": {"data": 1}, "data" : [ {"x": "]"} ,{"y": [{}]} ] }'
+        start, end = data_span(content)
+        self.assertEqual(content[start:end], b'[ {"x": "]"} ,{"y": [{}]} ]')
+        self.assertEqual(split_objects(content, start, end), [b'{"x": "]"}', b'{"y": [{}]}'])
+        self.assertIsNone(split_objects(b'[{}, 1]', 0, 7))
+        self.assertIsNone(data_span(b'{"data": "text"}'))
+
+    def test_item(self):
+        """测试单条记录及错误响应"""
+        wallet = Wallet.from_response(json_response({'data': {'balance': 12.5}}))
+        self.assertEqual(wallet.balance, 12.5)
+        self.assertRaises(Exception, InstanceInfo.from_response, json_response({}, 404))
+
+    def test_memory(self):
+        """测试模型比 dict 占用更少的内存"""
+        record = {'id': 'task-000001', 'status': 'success', 'createdAt': '2020-01-01T00:00:00Z'}
+        model = Task(json.dumps(record).encode('utf-8'))
+        model_size = sys.getsizeof(model) + sys.getsizeof(model.raw)
+        dict_size = sys.getsizeof(record) + sum(sys.getsizeof(key) + sys.getsizeof(value)
+                                                for key, value in record.items())
+        self.assertLess(model_size, dict_size)
+
+
+class TestInstanceModels(unittest.TestCase):
+    """
+    造数 实例 Instance、用户 User 返回模型的单元测试
+    """
+
+    def test_methods(self):
+        """测试获取模型的方法"""
+        body = json.dumps({'data': [{'id': 'i1', 'title': 't'}]}).encode('utf-8')
+        with LocalServer([(200, {}, body)]) as server:
+            request = ZaoshuRequests('key', 'secret', max_retries=0)
+            self.addCleanup(request.close)
+            instances = Instance(server.url, request).get_instances()
+            self.assertEqual(instances[0].title, 't')
+            self.assertEqual(instances.response.json()['data'][0]['id'], 'i1')
+
+            server.responses = [(200, {}, b'{"data": {"id": "t1", "status": "running"}}')]
+            self.assertEqual(Instance(server.url, request).get_task('i1', 't1').status,
+                             'running')
+            server.responses = [(500, {}, b'error')]
+            self.assertRaises(Exception, User(server.url, request).get_account)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+pages 模块提供实例列表、任务列表的分页迭代：按需逐页请求，可在后台预取下一页，
+支持提前结束以及按状态、时间过滤
+"""
+import re
+from datetime import datetime, timezone
+
+from zaoshu.codec import decode_json
+
+# 分页请求参数名
+PAGE_PARAM = 'page'
+PAGE_SIZE_PARAM = 'pageSize'
+# 每页的记录数
+PAGE_SIZE = 100
+# 列表响应中存放记录的字段，data 本身为列表时直接使用
+ITEMS_FIELDS = ('list', 'items', 'rows', 'records')
+# 记录中表示时间的字段
+TIME_FIELDS = ('created_at', 'createdAt', 'create_time', 'createTime',
+               'start_time', 'startTime')
+# 支持的 ISO 8601 时间格式，时区已规范为 +hhmm
+ISO_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M%z',
+               '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d')
+
+
+def parse_iso(value):
+    """
+    解析 ISO 8601 时间字符串，不依赖 datetime.fromisoformat(Python 3.7 起才有)
+    :param value: 如 2020-01-01T08:00:00Z、2020-01-01 08:00:00.123+08:00、2020-01-01
+    :return: datetime，无法解析时返回 None
+    """
+    text = value.strip().replace(' ', 'T', 1)
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+0000'
+    # strptime 的 %z 在 Python 3.6 不接受带冒号的时区，%f 最多6位
+    text = re.sub(r'([+-]\d\d):(\d\d)$', r'\1\2', text)
+    text = re.sub(r'(\.\d{6})\d+', r'\1', text)
+    for fmt in ISO_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def page_items(response):
+    """
+    获得列表响应中的记录
+    :param response: 列表接口的响应
+    :return: list
+    """
+    if response.status_code != 200:
+        raise Exception("list Error: %d %s" % (response.status_code, response.text))
+    data = decode_json(response).get('data')
+    if isinstance(data, dict):
+        for field in ITEMS_FIELDS:
+            if isinstance(data.get(field), list):
+                return data[field]
+        return []
+    return data or []
+
+
+def to_timestamp(value):
+    """
+    将时间转换为时间戳
+    :param value: datetime、时间戳(秒或毫秒)或 ISO 8601 字符串
+    :return: 秒，无法转换时返回 None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        # 毫秒时间戳
+        return value / 1000.0 if value > 1e11 else float(value)
+    try:
+        return to_timestamp(float(value))
+    except ValueError:
+        pass
+    return to_timestamp(parse_iso(str(value)))
+
+
+def item_time(item):
+    """
+    获得记录的创建时间
+    :param item: 记录 dict
+    :return: 时间戳，没有时间字段时返回 None
+    """
+    for field in TIME_FIELDS:
+        if item.get(field) is not None:
+            return to_timestamp(item[field])
+    return None
+
+
+def iter_pages(fetch, page_size=PAGE_SIZE, start=1, prefetch=True):
+    """
+    逐页获取记录，某页记录数不足 page_size 或与上一页相同(服务器不支持分页)时结束
+    :param fetch: 接收分页参数 dict、返回列表响应的函数
+    :param page_size: 每页的记录数
+    :param start: 起始页码
+    :param prefetch: 是否在处理当前页时于后台请求下一页
+    :return: 生成器 每页的记录 list
+    """
+    def get(page):
+        return page_items(fetch({PAGE_PARAM: page, PAGE_SIZE_PARAM: page_size}))
+
+    executor = None
+    if prefetch:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = start
+        items = get(page)
+        previous = None
+        while items and items != previous:
+            last = len(items) < page_size
+            following = None
+            if executor is not None and not last:
+                following = executor.submit(get, page + 1)
+            yield items
+            if last:
+                return
+            page += 1
+            previous = items
+            items = following.result() if following is not None else get(page)
+    finally:
+        if executor is not None:
+            # 提前结束时不等待预取的请求
+            executor.shutdown(wait=False)
+
+
+def iter_items(fetch, page_size=PAGE_SIZE, prefetch=True, status=None, since=None,
+               until=None, where=None, limit=None, newest_first=False, start=1):
+    """
+    逐条获取记录并过滤
+    :param fetch: 接收分页参数 dict、返回列表响应的函数
+    :param page_size: 每页的记录数
+    :param prefetch: 是否在后台预取下一页
+    :param status: 只返回这些状态的记录，str 或 str 的集合，不区分大小写
+    :param since: 只返回该时间及之后创建的记录，datetime 或时间戳
+    :param until: 只返回该时间之前创建的记录，datetime 或时间戳
+    :param where: 接收记录、返回是否保留的函数
+    :param limit: 最多返回的记录数，达到后不再请求后续页
+    :param newest_first: 列表是否按创建时间倒序，为True时遇到早于 since 的记录即结束；
+                         接口默认按创建时间正序返回，只在确认列表为倒序时设置
+    :param start: 起始页码
+    :return: 生成器 记录 dict
+    """
+    if isinstance(status, str):
+        status = (status,)
+    statuses = None if status is None else set(str(value).lower() for value in status)
+    since = to_timestamp(since)
+    until = to_timestamp(until)
+    count = 0
+    if limit is not None and limit <= 0:
+        return
+
+    for items in iter_pages(fetch, page_size, start=start, prefetch=prefetch):
+        for item in items:
+            created = item_time(item) if since is not None or until is not None else None
+            if since is not None and created is not None and created < since:
+                if newest_first:
+                    return
+                continue
+            if until is not None and created is not None and created >= until:
+                continue
+            if statuses is not None and str(item.get('status')).lower() not in statuses:
+                continue
+            if where is not None and not where(item):
+                continue
+            yield item
+            count += 1
+            if limit is not None and count >= limit:
+                return
@@ -0,0 +1,103 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+分页迭代的单元测试
+"""
+import json
+import unittest
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+
+from zaoshu import Instance
+from zaoshu import ZaoshuRequests
+from zaoshu.pages import to_timestamp
+from zaoshu.zaoshu_test import LocalServer
+
+# 按创建时间倒序的任务，每小时一个
+TASKS = [{'id': 't%d' % index, 'status': 'success' if index % 2 else 'failed',
+          'createdAt': '2020-01-01T%02d:00:00Z' % (23 - index)} for index in range(24)]
+
+
+def paged_server(items, paged=True):
+    """按 page/pageSize 参数分页返回记录，paged 为False时忽略分页参数"""
+    def respond(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        page = int(query.get('page', ['1'])[0])
+        size = int(query.get('pageSize', ['100'])[0])
+        data = items[(page - 1) * size:page * size] if paged else items
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'data': data}).encode()
+    return LocalServer([(200, None, respond)])
+
+
+class TestInstancePages(unittest.TestCase):
+    """
+    造数 实例 Instance 分页迭代单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.request = ZaoshuRequests('key', 'secret')
+        self.addCleanup(self.request.close)
+
+    def serve(self, items, paged=True):
+        """启动本地服务并创建 Instance"""
+        server = paged_server(items, paged).__enter__()
+        self.addCleanup(server.__exit__)
+        return server, Instance(server.url, self.request)
+
+    def test_pages(self):
+        """测试逐页获取全部记录"""
+        server, instance = self.serve(TASKS)
+        for prefetch in (True, False):
+            tasks = list(instance.iter_tasks('i1', page_size=5, prefetch=prefetch))
+            self.assertEqual(tasks, TASKS)
+        self.assertEqual(len(server.requests), 10)
+        self.assertTrue(server.requests[0][1].startswith('/instance/i1/tasks?'))
+
+    def test_limit(self):
+        """测试提前结束时不请求后续页"""
+        server, instance = self.serve(TASKS)
+        tasks = list(instance.iter_tasks('i1', page_size=5, prefetch=False, status='success',
+                                         limit=3))
+        self.assertEqual([task['id'] for task in tasks], ['t1', 't3', 't5'])
+        self.assertEqual(len(server.requests), 2)
+
+    def test_time(self):
+        """测试按时间过滤，倒序时遇到更早的记录即结束"""
+        server, instance = self.serve(TASKS)
+        since = datetime(2020, 1, 1, 20, tzinfo=timezone.utc)
+        tasks = list(instance.iter_tasks('i1', page_size=2, prefetch=False, since=since,
+                                         until='2020-01-01T23:00:00Z', newest_first=True))
+        self.assertEqual([task['id'] for task in tasks], ['t1', 't2', 't3'])
+        self.assertEqual(len(server.requests), 3)
+
+    def test_time_oldest_first(self):
+        """测试默认按正序列表过滤，早于 since 的记录不会提前结束"""
+        server, instance = self.serve(TASKS[::-1])
+        tasks = list(instance.iter_tasks('i1', page_size=5, prefetch=False,
+                                         since='2020-01-01T20:00:00Z'))
+        self.assertEqual([task['id'] for task in tasks], ['t3', 't2', 't1', 't0'])
+        self.assertEqual(len(server.requests), 5)
+
+    def test_unpaged(self):
+        """测试服务器忽略分页参数时不重复返回"""
+        server, instance = self.serve(TASKS[:3], paged=False)
+        self.assertEqual(list(instance.iter_instances(page_size=2, where=lambda item: True)),
+                         TASKS[:3])
+        self.assertEqual(len(server.requests), 2)
+
+    def test_timestamp(self):
+        """测试时间转换"""
+        self.assertEqual(to_timestamp(1577836800000), 1577836800.0)
+        self.assertEqual(to_timestamp('1577836800'), 1577836800.0)
+        self.assertEqual(to_timestamp('2020-01-01T00:00:00Z'), 1577836800.0)
+        self.assertEqual(to_timestamp('2020-01-01T08:00:00.500+08:00'), 1577836800.5)
+        self.assertEqual(to_timestamp('2020-01-01 00:00:00.1234567'), 1577836800.123456)
+        self.assertEqual(to_timestamp('2020-01-01'), 1577836800.0)
+        self.assertEqual(to_timestamp(datetime(2020, 1, 1)), 1577836800.0)
+        self.assertIsNone(to_timestamp('yesterday'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,354 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+parallel 模块提供大结果文件的多进程解析：ParallelParser 把 csv/json 结果文件按记录边界切分为多段，
+各进程以 mmap 读取自己的一段并用 RowDecoder 解码，按原顺序产出各批，或在进程内写入输出(sink)
+"""
+import json
+import mmap
+import os
+import re
+from collections import deque
+
+from zaoshu.decoder import ColumnBuilder, STRING, _numpy
+
+# 每段的字节数
+CHUNK_BYTES = 32 * 1024 * 1024
+# 推断字段类型时每次读取的字节数
+SAMPLE_BYTES = 1024 * 1024
+# json 的结构字符及完整的字符串(段末尾的字符串可能不完整)
+JSON_TOKEN = re.compile(b'"[^"\\\\]*(?:\\\\.[^"\\\\]*)*"?|[{}\\[\\]]', re.S)
+# 段开始处位于字符串内时，该字符串的剩余部分
+JSON_STRING_TAIL = re.compile(b'[^"\\\\]*(?:\\\\.[^"\\\\]*)*(")?', re.S)
+# 空白
+JSON_SPACE = re.compile(b'[ \\t\\r\\n]*')
+_OPEN_OBJECT, _CLOSE_OBJECT, _OPEN_ARRAY, _CLOSE_ARRAY = b'{}[]'
+# json 字符串中的转义
+JSON_ESCAPE = re.compile(b'\\\\(.)', re.S)
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+def quote_parity(data, file_type):
+    """
+    不被转义的双引号个数的奇偶，为1时 data 之后位于引号内
+    csv 中引号以 "" 转义，不影响奇偶；json 中以 \\" 转义
+    :param data: 不以被转义字符开始的 bytes
+    :param file_type: csv, json
+    :return: 0 或 1
+    """
+    count = data.count(b'"')
+    if file_type == 'json' and b'\\' in data:
+        count -= JSON_ESCAPE.findall(data).count(b'"')
+    return count & 1
+
+
+def _open(path):
+    """
+    以只读方式 mmap 文件
+    :return: mmap.mmap，空文件返回 b''
+    """
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _json_scan(data, start, end, inside):
+    """
+    扫描一段 json 的结构：记录边界为紧跟在同层的 '}' 之后的 '{'，
+    段开始处的嵌套深度要等前面各段扫描后才知道，因此按相对深度记录
+    :param data: 文件内容
+    :param start: 段的开始位置
+    :param end: 段的结束位置
+    :param inside: 为1时段开始处位于字符串内
+    :return: (段结束处相对开始处的深度, {相对深度: 该深度下第一个记录边界的位置})
+    """
+    depth, closed, boundaries = 0, None, {}
+    position = start
+    if inside:
+        match = JSON_STRING_TAIL.match(data, start, end)
+        if match.group(1) is None:
+            return 0, boundaries
+        position = match.end()
+    for match in JSON_TOKEN.finditer(data, position, end):
+        token = data[match.start()]
+        if token == _OPEN_OBJECT or token == _OPEN_ARRAY:
+            if token == _OPEN_OBJECT and closed == depth and depth not in boundaries:
+                boundaries[depth] = match.start()
+            depth += 1
+            closed = None
+        elif token == _CLOSE_OBJECT or token == _CLOSE_ARRAY:
+            depth -= 1
+            closed = depth if token == _CLOSE_OBJECT else None
+        else:
+            closed = None
+    return depth, boundaries
+
+
+def _scan(task):
+    """
+    在进程中扫描一段：该段的引号奇偶，及该段开始处分别位于引号外、引号内时的记录边界
+    :param task: (path, file_type, start, end)
+    :return: (奇偶, [引号外时的结果, 引号内时的结果])，
+             csv 的结果为第一个记录边界的位置，段内没有边界时为 None，json 的结果见 _json_scan
+    """
+    path, file_type, start, end = task
+    data = _open(path)
+    try:
+        parity = quote_parity(data[start:end], file_type)
+        if file_type == 'json':
+            return parity, [_json_scan(data, start, end, inside) for inside in (0, 1)]
+        positions = [None, None]
+        previous, inside = start, 0
+        while None in positions:
+            position = data.find(b'\n', previous, end) + 1
+            if not position:
+                break
+            inside ^= quote_parity(data[previous:position], file_type)
+            if positions[inside] is None:
+                positions[inside] = position
+            previous = position
+        return parity, positions
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def _range_chunks(data, file_type, header, start, end, last):
+    """
+    一段内容的 bytes 块，csv 在前面加上表头，json 整理为数组
+    """
+    body = data[start:end]
+    if file_type == 'csv':
+        return [header, body]
+    body = body.strip()
+    if body.startswith(b'['):
+        body = body[1:]
+    if last and body.endswith(b']'):
+        body = body[:-1]
+    return [b'[', body, b']']
+
+
+def _parse_range(task):
+    """
+    在进程中解码一段
+    :param task: (decoder, path, file_type, header, start, end, last, mode, sink, index)
+    :return: mode 为 rows 时为各批的行，columns 时为各列的值，sink 时为 sink.write 的返回值
+    """
+    decoder, path, file_type, header, start, end, last, mode, sink, index = task
+    data = _open(path)
+    try:
+        chunks = _range_chunks(data, file_type, header, start, end, last)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    if mode == 'columns':
+        builders = [ColumnBuilder(field.type) for field in decoder.fields]
+        for columns in decoder.iter_column_batches(chunks, file_type):
+            for builder, column in zip(builders, columns):
+                builder.extend(column)
+        return [builder.values for builder in builders]
+    batches = decoder.iter_batches(chunks, file_type)
+    if mode == 'sink':
+        return sink.write(index, decoder.names, batches)
+    return list(batches)
+
+
+class JsonLinesSink(object):
+    """
+    把每段解码后的行写入目录中的 json lines 文件 part-00000.jsonl、part-00001.jsonl...
+    在解析进程中写入，需可 pickle
+    """
+
+    def __init__(self, directory, prefix='part'):
+        """
+        构造函数
+        :param directory: 输出目录，不存在时创建
+        :param prefix: 文件名前缀
+        """
+        self.directory = directory
+        self.prefix = prefix
+
+    def write(self, index, names, batches):
+        """
+        写入一段的行
+        :param index: 段的序号
+        :param names: 字段名
+        :param batches: [tuple, ...] 的迭代器
+        :return: (文件路径, 行数)
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '%s-%05d.jsonl' % (self.prefix, index))
+        count = 0
+        with open(path, 'w', encoding='utf-8') as file:
+            for batch in batches:
+                file.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n'
+                                for row in batch)
+                count += len(batch)
+        return path, count
+
+
+class ParallelParser(object):
+    """
+    多进程解析 csv/json 结果文件
+    文件按 chunk_bytes 切分，切分点移到记录边界(csv 为引号外的换行，json 为记录之间)：
+    各段先在进程中统计引号的奇偶以确定切分点是否位于引号内，再由各进程 mmap 读取并解码。
+    json 结果需为 json 数组或 json lines，记录为对象
+    """
+
+    def __init__(self, decoder, workers=None, chunk_bytes=CHUNK_BYTES):
+        """
+        构造函数
+        :param decoder: RowDecoder，没有类型的字段在主进程中根据第一批数据推断后再分发
+        :param workers: 进程数，默认为CPU核数，为1时在当前进程中依次解析
+        :param chunk_bytes: 每段的字节数
+        """
+        self.decoder = decoder
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes
+
+    def iter_batches(self, path, file_type='csv'):
+        """
+        按原顺序产出带类型的行
+        :param path: 结果文件路径
+        :param file_type: csv, json
+        :return: 生成器 [tuple, ...]，每行的值与 decoder.names 顺序一致
+        """
+        for batches in self._run(path, file_type, 'rows'):
+            for batch in batches:
+                yield batch
+
+    def columns(self, path, file_type='csv', numpy=None):
+        """
+        解码全部记录并按列输出，见 RowDecoder.columns
+        :param path: 结果文件路径
+        :param file_type: csv, json
+        :param numpy: None 在已安装 NumPy 时输出 NumPy 数组，False 输出 array.array，True 必须使用 NumPy
+        :return: {字段名: 列}
+        """
+        module = _numpy(numpy)
+        builders = None
+        for values in self._run(path, file_type, 'columns'):
+            if builders is None:
+                builders = [ColumnBuilder(field.type) for field in self.decoder.fields]
+            for builder, column in zip(builders, values):
+                builder.merge(column)
+        if builders is None:
+            builders = [ColumnBuilder(field.type or STRING) for field in self.decoder.fields]
+        return dict((field.name, builder.result(module))
+                    for field, builder in zip(self.decoder.fields, builders))
+
+    def write(self, path, sink, file_type='csv'):
+        """
+        在各进程中把解码后的行写入 sink
+        :param path: 结果文件路径
+        :param sink: 有 write(index, names, batches) 方法且可 pickle 的对象，如 JsonLinesSink
+        :param file_type: csv, json
+        :return: 按段顺序的 sink.write 返回值的列表
+        """
+        return list(self._run(path, file_type, 'sink', sink))
+
+    def _run(self, path, file_type, mode, sink=None):
+        """
+        切分文件并解码各段，按段的顺序产出结果；同时进行的段不超过进程数的两倍
+        """
+        if file_type not in ('csv', 'json'):
+            raise ValueError('unsupported file type: %s' % file_type)
+        data = _open(path)
+        try:
+            start = 3 if data[:3] == UTF8_BOM else 0
+            header = b''
+            if file_type == 'csv':
+                end = data.find(b'\n', start) + 1 or len(data)
+                header, start = data[start:end], end
+            segments = self._segments(data, file_type, start)
+            self._resolve(data, file_type, header, start)
+            # json 数组的记录位于第1层，json lines 位于第0层
+            first = JSON_SPACE.match(data, start).end()
+            depth = 1 if data[first:first + 1] == b'[' else 0
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+        executor = None
+        if self.workers > 1 and len(segments) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(min(self.workers, len(segments)))
+        try:
+            ranges = self._align(executor, path, file_type, segments, depth)
+            tasks = [(self.decoder, path, file_type, header, begin, end,
+                      index == len(ranges) - 1, mode, sink, index)
+                     for index, (begin, end) in enumerate(ranges)]
+            if executor is None:
+                for task in tasks:
+                    yield _parse_range(task)
+                return
+            pending = deque()
+            try:
+                for task in tasks:
+                    pending.append(executor.submit(_parse_range, task))
+                    if len(pending) >= self.workers * 2:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _segments(self, data, file_type, start):
+        """
+        按 chunk_bytes 初步切分，json 的切分点不紧跟在反斜杠之后
+        :return: [(start, end), ...]
+        """
+        points = [start]
+        for point in range(start + self.chunk_bytes, len(data), self.chunk_bytes):
+            while file_type == 'json' and point < len(data) and data[point - 1:point] == b'\\':
+                point += 1
+            if points[-1] < point < len(data):
+                points.append(point)
+        points.append(len(data))
+        return list(zip(points[:-1], points[1:]))
+
+    def _resolve(self, data, file_type, header, start):
+        """
+        在主进程中确定字段及未指定的类型，各进程使用相同的类型
+        """
+        if self.decoder.fields and all(field.type for field in self.decoder.fields):
+            return
+
+        def samples():
+            yield header
+            for position in range(start, len(data), SAMPLE_BYTES):
+                yield data[position:position + SAMPLE_BYTES]
+
+        next(self.decoder.iter_column_batches(samples(), file_type), None)
+
+    def _align(self, executor, path, file_type, segments, depth=0):
+        """
+        把切分点移到记录边界，json 只在记录所在的层切分
+        :param depth: json 记录所在的嵌套深度
+        :return: [(start, end), ...]
+        """
+        tasks = [(path, file_type, start, end) for start, end in segments]
+        scans = list(executor.map(_scan, tasks)) if executor else [_scan(task) for task in tasks]
+        points = [segments[0][0]]
+        inside = scans[0][0]
+        # 当前段开始处的嵌套深度
+        level = scans[0][1][0][0] if file_type == 'json' else 0
+        for (parity, results) in scans[1:]:
+            if file_type == 'json':
+                shift, boundaries = results[inside]
+                position = boundaries.get(depth - level)
+                level += shift
+            else:
+                position = results[inside]
+            if position is not None and position > points[-1]:
+                points.append(position)
+            inside ^= parity
+        points.append(segments[-1][1])
+        return list(zip(points[:-1], points[1:]))
@@ -0,0 +1,145 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+多进程解析结果文件的单元测试
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+
+from zaoshu import ZaoshuSdk
+from zaoshu.decoder import RowDecoder, INTEGER, STRING
+from zaoshu.mock import MockServer, csv_result
+from zaoshu.parallel import ParallelParser, JsonLinesSink, quote_parity
+from zaoshu.transport import MemoryTransport
+
+
+class TestParallelParser(unittest.TestCase):
+    """
+    ParallelParser 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, data):
+        """写入临时文件"""
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+    def parse(self, path, file_type='csv', workers=2, decoder=None):
+        """多进程解析，小的 chunk_bytes 使切分点落在各种位置"""
+        parser = ParallelParser(decoder or RowDecoder([], batch_size=50), workers=workers,
+                                chunk_bytes=997)
+        return [row for batch in parser.iter_batches(path, file_type) for row in batch]
+
+    def test_quote_parity(self):
+        """测试引号的奇偶"""
+        self.assertEqual(quote_parity(b'a,"b ""c""', 'csv'), 1)
+        self.assertEqual(quote_parity(b'{"a": "\\"\\\\"}', 'json'), 0)
+
+    def test_csv(self):
+        """测试含引号、分隔符及换行的字段不被切开，结果与顺序解析一致"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['id', 'title'])
+        expected = []
+        for index in range(2000):
+            title = 'q "%d", \n next' % index if index % 7 == 0 else 'plain %d' % index
+            writer.writerow([index, title])
+            expected.append((index, title))
+        path = self.write('result.csv', b'\xef\xbb\xbf' + output.getvalue().encode('utf-8'))
+        decoder = RowDecoder([('id', INTEGER), ('title', STRING)], batch_size=50)
+        self.assertEqual(self.parse(path, decoder=decoder), expected)
+        self.assertEqual(self.parse(path, workers=1), expected)
+
+    def test_json(self):
+        """测试 json 数组及 json lines，字符串中含记录分隔符及转义的引号"""
+        records = [{'id': index, 'title': 'a}, {"x\\' if index % 5 == 0 else '\\"}\n{'}
+                   for index in range(1500)]
+        expected = [(record['id'], record['title']) for record in records]
+        for text in (json.dumps(records), json.dumps(records, separators=(',', ':')),
+                     '\n'.join(json.dumps(record) for record in records)):
+            path = self.write('result.json', text.encode('utf-8'))
+            self.assertEqual(self.parse(path, 'json'), expected)
+
+    def test_json_nested(self):
+        """测试记录中嵌套的对象数组不被当作记录边界"""
+        records = [{'id': index, 'tags': [{'k': 'a'}, {'k': 'b'}]} for index in range(2000)]
+        expected = [(record['id'], record['tags']) for record in records]
+        for text in (json.dumps(records), '\n'.join(json.dumps(record) for record in records)):
+            path = self.write('result.json', text.encode('utf-8'))
+            parser = ParallelParser(RowDecoder([], batch_size=50), workers=2, chunk_bytes=4096)
+            rows = [row for batch in parser.iter_batches(path, 'json') for row in batch]
+            self.assertEqual(rows, expected)
+            self.assertEqual(self.parse(path, 'json'), expected)
+
+    def test_columns(self):
+        """测试按列合并各进程的结果，类型在主进程中统一推断"""
+        lines = ['id,price\n'] + ['%d,%s\n' % (index, '' if index == 1500 else index)
+                                  for index in range(2000)]
+        path = self.write('result.csv', ''.join(lines).encode('utf-8'))
+        decoder = RowDecoder([])
+        columns = ParallelParser(decoder, workers=2, chunk_bytes=1000).columns(path, numpy=False)
+        self.assertEqual(columns['id'], array('q', range(2000)))
+        self.assertEqual(columns['price'].typecode, 'd')
+        self.assertEqual(len(columns['price']), 2000)
+        self.assertEqual(decoder.names, ['id', 'price'])
+
+    def test_sink(self):
+        """测试在各进程中写入 sink"""
+        path = self.write('result.csv', csv_result(3000))
+        output = os.path.join(self.directory, 'output')
+        written = ParallelParser(RowDecoder([]), workers=2, chunk_bytes=20000).write(
+            path, JsonLinesSink(output))
+        self.assertGreater(len(written), 1)
+        self.assertEqual(sum(count for _, count in written), 3000)
+        with open(written[-1][0], encoding='utf-8') as file:
+            last = [json.loads(line) for line in file][-1]
+        self.assertEqual(last['url'], 'https://example.com/item/2999')
+
+    def test_empty(self):
+        """测试空文件及只有表头的文件"""
+        self.assertEqual(self.parse(self.write('empty.csv', b'')), [])
+        self.assertEqual(self.parse(self.write('header.csv', b'id,title\n')), [])
+        with self.assertRaises(ValueError):
+            self.parse(self.write('result.xml', b'<a/>'), 'xml')
+
+
+class TestInstanceParse(unittest.TestCase):
+    """
+    Instance 下载后多进程解析单元测试
+    """
+
+    def test(self):
+        """测试 csv 及 zip 结果"""
+        server = MockServer(result_rows=500)
+        self.addCleanup(server.stop)
+        sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                        transport=MemoryTransport(server.handle))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            for file_type in ('csv', 'zip'):
+                batches = sdk.instance.parse_run_data('instance-0', 'task-0', '/data', file_type,
+                                                      workers=2, chunk_bytes=4096)
+                rows = [row for batch in batches for row in batch]
+                self.assertEqual([row[0] for row in rows], list(range(500)))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
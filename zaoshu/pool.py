@@ -0,0 +1,204 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+pool 模块提供多账号共用的客户端池 ClientPool：为每个 api key 提供轻量的 ZaoshuSdk，
+所有账号共用一个传输(连接池)及元数据缓存存储，每个账号有各自的签名器、限流器及指标；
+长时间未使用或超出数量上限的账号按最近最少使用淘汰
+"""
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from zaoshu.limit import RateLimiter
+from zaoshu.metrics import Metrics
+from zaoshu.transport import create_transport
+from zaoshu.zaoshu import ZaoshuSdk
+
+
+class _Tenant(object):
+    """
+    池中的一个账号
+    """
+
+    __slots__ = ('sdk', 'api_secret', 'metrics', 'used_at')
+
+    def __init__(self, sdk, api_secret, metrics):
+        self.sdk = sdk
+        self.api_secret = api_secret
+        self.metrics = metrics
+        self.used_at = monotonic()
+
+
+class ClientPool(object):
+    """
+    多账号客户端池，线程安全
+    """
+
+    def __init__(self, base_url='https://openapi.zaoshu.io/v2', secrets=None, transport=None,
+                 cache=None, rate_limit=None, metrics=False, max_tenants=1000, idle_timeout=600,
+                 on_evict=None, pool_connections=10, pool_maxsize=64, pool_block=False,
+                 keep_alive=True, **options):
+        """
+        构造函数
+        :param base_url: 造数基本API接口
+        :param secrets: 由 api key 获得 api secret 的函数，client 未传入 api_secret 时使用
+        :param transport: 共用的传输，名称 requests(默认)、stdlib 或 Transport 对象
+        :param cache: 共用存储的元数据缓存 ResponseCache，各账号以 api key 为键前缀，None为不缓存
+        :param rate_limit: 每个账号的 RateLimiter 参数 dict(如 {'rate': 20})，None为不限流
+        :param metrics: 是否为每个账号收集指标 Metrics
+        :param max_tenants: 保留的账号数上限
+        :param idle_timeout: 账号未使用超过该秒数后淘汰，None为不按时间淘汰
+        :param on_evict: 账号被淘汰时调用 on_evict(api_key, sdk, metrics)，如导出指标
+        :param pool_connections: 连接池缓存的主机数，transport 为名称时使用
+        :param pool_maxsize: 每个主机保持的最大连接数，transport 为名称时使用
+        :param pool_block: 连接数用尽时是否阻塞等待空闲连接，transport 为名称时使用
+        :param keep_alive: 是否保持长连接，transport 为名称时使用
+        :param options: 每个账号的 ZaoshuRequests 其他设置，如 timeout, max_retries
+        """
+        self.base_url = base_url
+        self.secrets = secrets
+        self._owns_transport = transport is None or isinstance(transport, str)
+        if self._owns_transport:
+            transport = create_transport(transport or 'requests',
+                                         pool_connections=pool_connections,
+                                         pool_maxsize=pool_maxsize, pool_block=pool_block,
+                                         keep_alive=keep_alive)
+        self.transport = transport
+        self.cache = cache
+        self.rate_limit = rate_limit
+        self.metrics_enabled = metrics
+        self.max_tenants = max_tenants
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self.options = options
+
+        # {api key: _Tenant}，按最近使用的顺序
+        self._tenants = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def __contains__(self, api_key):
+        return api_key in self._tenants
+
+    def client(self, api_key, api_secret=None):
+        """
+        获得账号的 ZaoshuSdk，同一账号复用同一个对象；api secret 变化时重新创建
+        :param api_key: api key
+        :param api_secret: api secret，为None时由 secrets 获得
+        :return: ZaoshuSdk，close 不会关闭共用的传输
+        """
+        with self._lock:
+            sdk = self._reuse(api_key, api_secret)
+            evicted = self._expired()
+        if sdk is None:
+            # 获取 secret 及创建对象在锁外进行
+            created = self._create(api_key, api_secret)
+            with self._lock:
+                sdk = self._reuse(api_key, api_secret)
+                if sdk is None:
+                    tenant = self._tenants.pop(api_key, None)
+                    if tenant is not None:
+                        evicted.append((api_key, tenant))
+                    self._tenants[api_key] = created
+                    sdk = created.sdk
+                evicted.extend(self._expired())
+        self._evicted(evicted)
+        return sdk
+
+    def _reuse(self, api_key, api_secret):
+        """
+        在锁内获得池中的账号并标记为最近使用
+        :return: ZaoshuSdk，不在池中或 api secret 变化时返回 None
+        """
+        tenant = self._tenants.get(api_key)
+        if tenant is None or api_secret is not None and api_secret != tenant.api_secret:
+            return None
+        self._tenants.move_to_end(api_key)
+        tenant.used_at = monotonic()
+        return tenant.sdk
+
+    def metrics(self, api_key):
+        """
+        获得账号的指标
+        :param api_key: api key
+        :return: Metrics，未收集指标或账号不在池中时返回 None
+        """
+        tenant = self._tenants.get(api_key)
+        return tenant.metrics if tenant is not None else None
+
+    def evict(self, api_key):
+        """
+        淘汰账号，如账号被停用或 api secret 已失效
+        :param api_key: api key
+        :return: bool 账号是否在池中
+        """
+        with self._lock:
+            tenant = self._tenants.pop(api_key, None)
+        if tenant is not None:
+            self._evicted([(api_key, tenant)])
+        return tenant is not None
+
+    def close(self):
+        """
+        淘汰所有账号并关闭共用的传输(传入的 Transport 对象除外)
+        :return: None
+        """
+        with self._lock:
+            evicted = list(self._tenants.items())
+            self._tenants.clear()
+        self._evicted(evicted)
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _create(self, api_key, api_secret):
+        """
+        创建账号的 ZaoshuSdk，共用传输及缓存存储
+        """
+        if api_secret is None and self.secrets is not None:
+            api_secret = self.secrets(api_key)
+        if api_secret is None:
+            raise Exception("api_secret Error: no secret for %s" % api_key)
+        options = dict(self.options)
+        options['transport'] = self.transport
+        if self.cache is not None:
+            options['cache'] = self.cache.scoped('%s|' % api_key)
+        if self.rate_limit is not None:
+            options['rate_limiter'] = RateLimiter(**self.rate_limit)
+        sdk = ZaoshuSdk(api_key, api_secret, base_url=self.base_url, **options)
+        metrics = Metrics().install(sdk.request) if self.metrics_enabled else None
+        return _Tenant(sdk, api_secret, metrics)
+
+    def _expired(self):
+        """
+        在锁内取出超出数量上限或空闲超时的账号
+        :return: [(api key, _Tenant), ...]
+        """
+        evicted = []
+        while len(self._tenants) > self.max_tenants:
+            evicted.append(self._tenants.popitem(last=False))
+        if self.idle_timeout is not None:
+            deadline = monotonic() - self.idle_timeout
+            while self._tenants:
+                api_key, tenant = next(iter(self._tenants.items()))
+                if tenant.used_at > deadline:
+                    break
+                evicted.append(self._tenants.popitem(last=False))
+        return evicted
+
+    def _evicted(self, evicted):
+        """
+        在锁外通知淘汰的账号
+        """
+        if self.on_evict is None:
+            return
+        for api_key, tenant in evicted:
+            self.on_evict(api_key, tenant.sdk, tenant.metrics)
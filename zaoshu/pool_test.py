@@ -0,0 +1,108 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+多账号客户端池的单元测试
+"""
+import unittest
+from time import sleep
+
+from zaoshu import ClientPool, ResponseCache
+from zaoshu.mock import MockServer
+from zaoshu.transport import MemoryTransport
+
+
+class ClosingTransport(MemoryTransport):
+    """记录是否被关闭的 MemoryTransport"""
+
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestClientPool(unittest.TestCase):
+    """
+    ClientPool 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer()
+        self.addCleanup(self.server.stop)
+        self.transport = ClosingTransport(self.server.handle)
+        self.secrets = {'mock-key': 'mock-secret', 'other-key': 'other-secret'}
+
+    def pool(self, **options):
+        """创建共用 MemoryTransport 的客户端池"""
+        return ClientPool('http://mock/v2', secrets=self.secrets.get, transport=self.transport,
+                          **options)
+
+    def test_client(self):
+        """测试同一账号复用、各账号共用传输并使用各自的签名器、限流器及指标"""
+        pool = self.pool(rate_limit={'rate': 100}, metrics=True)
+        sdk = pool.client('mock-key')
+        self.assertIs(pool.client('mock-key'), sdk)
+        other = pool.client('other-key')
+        self.assertIs(sdk.request.transport, other.request.transport)
+        self.assertIsNot(sdk.request.signer, other.request.signer)
+        self.assertIsNot(sdk.request.rate_limiter, other.request.rate_limiter)
+
+        self.assertEqual(sdk.instance.item('instance-0').status_code, 200)
+        # 签名校验失败说明使用了该账号自己的 secret
+        self.assertEqual(other.instance.item('instance-0').status_code, 401)
+        for api_key, status in (('mock-key', 200), ('other-key', 401)):
+            stats = list(pool.metrics(api_key).snapshot().values())
+            self.assertEqual([item['status'] for item in stats], [{status: 1}])
+
+        # secret 变化时重新创建
+        self.assertIsNot(pool.client('mock-key', 'new-secret'), sdk)
+        with self.assertRaises(Exception):
+            pool.client('unknown-key')
+
+    def test_cache(self):
+        """测试共用缓存存储，各账号的缓存互不可见"""
+        cache = ResponseCache()
+        pool = self.pool(cache=cache)
+        sdk = pool.client('mock-key')
+        sdk.instance.item('instance-0')
+        sdk.instance.item('instance-0')
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(pool.client('other-key').instance.item('instance-0').status_code, 401)
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(len(cache.backend._entries), 1)
+
+    def test_evict(self):
+        """测试超出数量上限及空闲超时淘汰"""
+        evicted = []
+        pool = self.pool(max_tenants=1, idle_timeout=0.1,
+                         on_evict=lambda api_key, sdk, metrics: evicted.append(api_key))
+        pool.client('mock-key')
+        pool.client('other-key')
+        self.assertEqual(evicted, ['mock-key'])
+        self.assertNotIn('mock-key', pool)
+        sleep(0.15)
+        pool.client('mock-key')
+        self.assertEqual(evicted, ['mock-key', 'other-key'])
+        self.assertEqual(len(pool), 1)
+        self.assertTrue(pool.evict('mock-key'))
+        self.assertFalse(pool.evict('mock-key'))
+
+    def test_close(self):
+        """测试账号的 close 不关闭共用的传输，传入的传输由调用方关闭"""
+        pool = self.pool()
+        with pool.client('mock-key') as sdk:
+            sdk.instance.item('instance-0')
+        self.assertFalse(self.transport.closed)
+        pool.close()
+        self.assertFalse(self.transport.closed)
+        self.assertEqual(len(pool), 0)
+
+        owned = ClientPool('http://mock/v2', transport='stdlib')
+        transport = owned.transport
+        owned.close()
+        self.assertEqual(transport._pools, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
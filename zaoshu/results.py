@@ -0,0 +1,299 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+results 模块提供运行结果的流式解析，逐行产出 csv/json 记录，zip 文件按成员依次解压，
+内存占用与结果文件大小无关
+"""
+import codecs
+import csv
+import json
+import struct
+import zlib
+
+# zip 文件各记录的签名
+ZIP_LOCAL_FILE = b'PK\x03\x04'
+ZIP_DATA_DESCRIPTOR = b'PK\x07\x08'
+# zip 压缩方式
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+class ChunkReader(object):
+    """
+    对字节块迭代器提供按字节数读取及回退的能力
+    """
+
+    def __init__(self, chunks):
+        """
+        构造函数
+        :param chunks: bytes 块的迭代器
+        """
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def read_some(self):
+        """
+        读取下一块数据
+        :return: bytes，读取完毕时返回 b''
+        """
+        if self._buffer:
+            data, self._buffer = self._buffer, b''
+            return data
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b''
+
+    def read(self, size):
+        """
+        读取指定字节数，数据不足时返回已读取的部分
+        :param size: 字节数
+        :return: bytes
+        """
+        parts = []
+        while size > 0:
+            chunk = self.read_some()
+            if not chunk:
+                break
+            if len(chunk) > size:
+                chunk, self._buffer = chunk[:size], chunk[size:]
+            parts.append(chunk)
+            size -= len(chunk)
+        return b''.join(parts)
+
+    def read_exact(self, size):
+        """
+        读取指定字节数，数据不足时抛出异常
+        :param size: 字节数
+        :return: bytes
+        """
+        data = self.read(size)
+        if len(data) != size:
+            raise ValueError('unexpected end of data')
+        return data
+
+    def unread(self, data):
+        """
+        将数据放回，下次读取时优先返回
+        :param data: bytes
+        :return: None
+        """
+        if data:
+            self._buffer = data + self._buffer
+
+
+def _zip64_sizes(extra):
+    """
+    从 zip64 扩展字段中读取 (压缩后大小, 原始大小)
+    :param extra: 本地文件头的扩展字段
+    :return: (csize, usize)，没有 zip64 扩展字段时返回 None
+    """
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, size = struct.unpack('<HH', extra[offset:offset + 4])
+        if header_id == 0x0001 and size >= 16:
+            usize, csize = struct.unpack('<QQ', extra[offset + 4:offset + 20])
+            return csize, usize
+        offset += 4 + size
+    return None
+
+
+def _iter_stored(reader, size):
+    """
+    读取未压缩的成员数据
+    """
+    while size > 0:
+        chunk = reader.read_some()
+        if not chunk:
+            raise ValueError('unexpected end of zip member')
+        if len(chunk) > size:
+            reader.unread(chunk[size:])
+            chunk = chunk[:size]
+        size -= len(chunk)
+        yield chunk
+
+
+def _iter_deflated(reader):
+    """
+    解压 deflate 压缩的成员数据，压缩流结束后将多读的数据放回
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    while not decompressor.eof:
+        chunk = reader.read_some()
+        if not chunk:
+            raise ValueError('unexpected end of zip member')
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    reader.unread(decompressor.unused_data)
+
+
+def iter_zip_members(chunks):
+    """
+    流式读取 zip 文件，按顺序产出各成员，无需等待整个文件下载完毕
+    产出的数据迭代器需在读取下一个成员前使用，未读取完的部分会被跳过
+    :param chunks: zip 文件内容的 bytes 块迭代器
+    :return: 生成器 (成员文件名, bytes 块迭代器)
+    """
+    reader = ChunkReader(chunks)
+    while True:
+        signature = reader.read(4)
+        if signature != ZIP_LOCAL_FILE:
+            # 到达中央目录或文件结尾
+            return
+        header = reader.read_exact(26)
+        (_, flags, method, _, _, _, csize, usize,
+         name_length, extra_length) = struct.unpack('<HHHHHIIIHH', header)
+        name = reader.read_exact(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = reader.read_exact(extra_length)
+        zip64 = _zip64_sizes(extra)
+        if zip64 and csize == 0xFFFFFFFF:
+            csize, usize = zip64
+
+        if method == ZIP_DEFLATED:
+            data = _iter_deflated(reader)
+        elif method == ZIP_STORED and not flags & 0x08:
+            data = _iter_stored(reader, csize)
+        else:
+            raise ValueError('unsupported zip member: %s' % name)
+
+        yield name, data
+
+        # 跳过未读取的数据
+        for _ in data:
+            pass
+        if flags & 0x08:
+            descriptor = reader.read_exact(4)
+            if descriptor != ZIP_DATA_DESCRIPTOR:
+                reader.unread(descriptor)
+            reader.read_exact(20 if zip64 else 12)
+
+
+def iter_lines(chunks, encoding='utf-8-sig'):
+    """
+    将 bytes 块增量解码为文本行(保留换行符)
+    :param chunks: bytes 块迭代器
+    :param encoding: 编码，默认兼容带 BOM 的 utf-8
+    :return: 生成器 str
+    """
+    pending = ''
+    for text in codecs.iterdecode(chunks, encoding):
+        lines = (pending + text).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+def iter_csv(chunks, encoding='utf-8-sig'):
+    """
+    流式解析 csv，首行为表头
+    :param chunks: bytes 块迭代器
+    :param encoding: 编码
+    :return: 生成器 dict
+    """
+    return csv.DictReader(iter_lines(chunks, encoding))
+
+
+def iter_json(chunks, encoding='utf-8-sig'):
+    """
+    流式解析 json，支持 json 数组(逐个产出数组元素)及每行一条记录的 json lines
+    :param chunks: bytes 块迭代器
+    :param encoding: 编码
+    :return: 生成器 json 记录
+    """
+    decoder = json.JSONDecoder()
+    texts = codecs.iterdecode(chunks, encoding)
+    buffer = ''
+    position = 0
+    eof = False
+    in_array = None
+
+    while True:
+        # 跳过空白及数组分隔符
+        while position < len(buffer) and (buffer[position].isspace() or
+                                          in_array and buffer[position] == ','):
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer, position = buffer[position:], 0
+            try:
+                buffer += next(texts)
+            except StopIteration:
+                eof = True
+            continue
+
+        if in_array is None:
+            in_array = buffer[position] == '['
+            if in_array:
+                position += 1
+            continue
+        if in_array and buffer[position] == ']':
+            in_array = False
+            position += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            value, end = None, None
+        # 解析失败或记录可能被截断(如数字)时继续读取
+        if end is None or end == len(buffer) and not eof:
+            if eof:
+                raise ValueError('invalid json at position %d' % position)
+            buffer, position = buffer[position:], 0
+            try:
+                buffer += next(texts)
+            except StopIteration:
+                eof = True
+            continue
+        position = end
+        yield value
+
+
+def iter_rows(chunks, file_type, encoding='utf-8-sig'):
+    """
+    按文件类型流式解析记录
+    :param chunks: bytes 块迭代器
+    :param file_type: 文件类型 csv, json
+    :param encoding: 编码
+    :return: 生成器 记录
+    """
+    if file_type == 'csv':
+        return iter_csv(chunks, encoding)
+    elif file_type == 'json':
+        return iter_json(chunks, encoding)
+    raise ValueError('unsupported file type: %s' % file_type)
+
+
+def iter_members(chunks, file_name, suffix, file_type):
+    """
+    按文件产出下载的运行结果，zip文件按成员依次产出
+    :param chunks: 结果文件内容的 bytes 块迭代器
+    :param file_name: 以'/'开头的文件名
+    :param suffix: 后缀
+    :param file_type: 下载时的文件类型，zip成员没有后缀时使用
+    :return: 生成器 (文件名, 文件类型, bytes 块迭代器)
+    """
+    if suffix == '.zip':
+        for name, data in iter_zip_members(chunks):
+            member_type = name.rsplit('.', 1)[-1] if '.' in name else file_type
+            yield name, member_type, data
+    else:
+        yield file_name.lstrip('/') + suffix, suffix.lstrip('.'), chunks
+
+
+def iter_files(chunks, file_name, suffix, file_type):
+    """
+    流式解析下载的运行结果文件，zip文件按成员依次产出
+    :param chunks: 结果文件内容的 bytes 块迭代器
+    :param file_name: 以'/'开头的文件名
+    :param suffix: 后缀
+    :param file_type: 下载时的文件类型，zip成员没有后缀时使用
+    :return: 生成器 (文件名, 记录生成器)
+    """
+    for name, member_type, data in iter_members(chunks, file_name, suffix, file_type):
+        yield name, iter_rows(data, member_type)
@@ -0,0 +1,86 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+运行结果流式解析模块的单元测试
+"""
+import io
+import json
+import unittest
+import zipfile
+
+from zaoshu.results import iter_csv, iter_json, iter_zip_members
+
+
+def chunked(data, size):
+    """按指定大小切分 bytes"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class Unseekable(io.RawIOBase):
+    """不可 seek 的输出流，使 zipfile 写入数据描述符"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+class TestResults(unittest.TestCase):
+    """
+    运行结果流式解析单元测试
+    """
+
+    def test_csv(self):
+        """测试csv解析，含带换行的字段与BOM"""
+        content = '﻿name,desc\r\n甲,"多\n行"\r\n乙,b\r\n'.encode('utf-8')
+        for size in (1, 3, 1024):
+            rows = list(iter_csv(chunked(content, size)))
+            self.assertEqual(rows, [{'name': '甲', 'desc': '多\n行'},
+                                    {'name': '乙', 'desc': 'b'}])
+
+    def test_json_array(self):
+        """测试json数组解析"""
+        records = [{'a': i, 'b': '值%d' % i} for i in range(100)] + [12345, 'x']
+        content = json.dumps(records, ensure_ascii=False).encode('utf-8')
+        for size in (1, 7, 4096):
+            self.assertEqual(list(iter_json(chunked(content, size))), records)
+
+    def test_json_lines(self):
+        """测试json lines解析"""
+        content = b'{"a": 1}\n{"a": 2}\n123\n'
+        self.assertEqual(list(iter_json(chunked(content, 2))), [{'a': 1}, {'a': 2}, 123])
+
+    def test_json_invalid(self):
+        """测试无效json"""
+        with self.assertRaises(ValueError):
+            list(iter_json([b'[{"a": 1}, {"a": ']))
+
+    def test_zip_members(self):
+        """测试流式读取zip，含数据描述符、未压缩成员与跳过未读取的成员"""
+        surface = b'a,b\n' + b'1,2\n' * 1000
+        depth = b'c\n' + b'3\n' * 1000
+        for seekable in (True, False):
+            output = io.BytesIO() if seekable else Unseekable()
+            with zipfile.ZipFile(output, 'w') as zip_file:
+                zip_file.writestr('surface.csv', surface, zipfile.ZIP_DEFLATED)
+                zip_file.writestr('skip.csv', b'skip', zipfile.ZIP_DEFLATED)
+                if seekable:
+                    zip_file.writestr('depth.csv', depth, zipfile.ZIP_STORED)
+                else:
+                    zip_file.writestr('depth.csv', depth, zipfile.ZIP_DEFLATED)
+            content = output.getvalue() if seekable else output.buffer.getvalue()
+
+            members = {}
+            for name, data in iter_zip_members(chunked(content, 100)):
+                if name != 'skip.csv':
+                    members[name] = b''.join(data)
+            self.assertEqual(members, {'surface.csv': surface, 'depth.csv': depth})
+
+
+if __name__ == '__main__':
+    unittest.main()
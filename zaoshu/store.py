@@ -0,0 +1,305 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+store 模块提供本机共用的运行结果存储 ResultStore：
+已结束任务的结果不会再变化，按 (instance_id, task_id, file_type) 及内容哈希保存在磁盘上，
+同一台机器上的多个进程只需从网络下载一次，按总字节数LRU淘汰
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下只在进程内加锁
+    fcntl = None
+
+# 结果存储中的一个结果文件
+# path: 存储中的文件路径(只读)，file_name: 以'/'开头的原始文件名，suffix: 后缀
+# digest: 内容的 sha256，size: 字节数
+StoredResult = namedtuple('StoredResult', ['path', 'file_name', 'suffix', 'digest', 'size'])
+
+# 复制文件时每次读取的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class _HashingWriter(object):
+    """
+    写入文件的同时计算 sha256
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+
+class ResultStore(object):
+    """
+    按内容寻址的运行结果存储，可在多个进程间共用
+    目录结构: objects/<sha256前2位>/<sha256><后缀> 保存文件内容，相同内容只保存一份；
+    index/<键的sha1>.json 记录键对应的文件，其修改时间即最近使用时间
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024 * 1024):
+        """
+        构造函数
+        :param path: 存储目录
+        :param max_bytes: 最大字节数，超出时淘汰最久未使用的结果
+        """
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # 本进程中正在获取的键及其数量，淘汰时跳过
+        self._active = {}
+        for name in ('objects', 'index', 'tmp', 'locks'):
+            directory = os.path.join(self.path, name)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(instance_id, task_id, file_type):
+        """
+        获得结果的存储键
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型
+        :return: str
+        """
+        return '%s/%s/%s' % (instance_id, task_id, file_type)
+
+    def _name(self, key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _index_path(self, key):
+        return os.path.join(self.path, 'index', self._name(key) + '.json')
+
+    def _object_path(self, digest, suffix):
+        return os.path.join(self.path, 'objects', digest[:2], digest + suffix)
+
+    def _temp_path(self, name):
+        return os.path.join(self.path, 'tmp', '%s.%d.%d' % (name, os.getpid(),
+                                                            threading.get_ident()))
+
+    def _lock(self, key):
+        """
+        获得某个键的进程内锁
+        """
+        with self._locks_lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def get(self, instance_id, task_id, file_type):
+        """
+        获取已保存的结果
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型
+        :return: StoredResult，不存在时返回 None
+        """
+        return self._get(self.key(instance_id, task_id, file_type))
+
+    def _get(self, key):
+        index_path = self._index_path(key)
+        try:
+            with open(index_path, 'r') as file:
+                meta = json.load(file)
+            if meta['key'] != key:
+                return None
+            result = StoredResult(self._object_path(meta['digest'], meta['suffix']),
+                                  meta['file_name'], meta['suffix'], meta['digest'], meta['size'])
+            if os.path.getsize(result.path) != result.size:
+                return None
+            # 以修改时间记录最近使用时间
+            os.utime(index_path, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        return result
+
+    def fetch(self, instance_id, task_id, file_type, download):
+        """
+        获取结果，不存在时调用 download 下载并保存
+        同一个键同时只有一个线程/进程下载，其余等待后直接使用下载好的结果
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型
+        :param download: 接收可写文件对象、写入结果内容并返回 (以'/'开头的文件名, 后缀) 的函数
+        :return: StoredResult
+        """
+        key = self.key(instance_id, task_id, file_type)
+        result = self._get(key)
+        if result is not None:
+            return result
+
+        with self._locks_lock:
+            self._active[key] = self._active.get(key, 0) + 1
+        try:
+            with self._lock(key):
+                lock_file = open(os.path.join(self.path, 'locks', self._name(key)), 'a')
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    result = self._get(key)
+                    if result is None:
+                        result = self._put(key, download)
+                finally:
+                    # 关闭文件同时释放文件锁
+                    lock_file.close()
+            # 刚保存的结果即将交给调用方，即使超过 max_bytes 也不在本次淘汰
+            self._evict()
+        finally:
+            with self._locks_lock:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+        return result
+
+    def _put(self, key, download):
+        """
+        下载到临时文件，计算哈希后原子地移入存储
+        """
+        temp_path = self._temp_path(self._name(key))
+        try:
+            with open(temp_path, 'wb') as file:
+                writer = _HashingWriter(file)
+                file_name, suffix = download(writer)
+            digest = writer.hash.hexdigest()
+            object_path = self._object_path(digest, suffix)
+            if os.path.exists(object_path):
+                # 内容相同的结果已保存过
+                os.remove(temp_path)
+            else:
+                directory = os.path.dirname(object_path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory, exist_ok=True)
+                # 只读，防止通过硬链接修改存储中的内容
+                os.chmod(temp_path, 0o444)
+                os.replace(temp_path, object_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        meta = {'key': key, 'file_name': file_name, 'suffix': suffix, 'digest': digest,
+                'size': writer.size}
+        index_temp_path = self._temp_path(self._name(key) + '.json')
+        with open(index_temp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(index_temp_path, self._index_path(key))
+        return StoredResult(object_path, file_name, suffix, digest, writer.size)
+
+    def _entries(self):
+        """
+        所有结果的索引，按最近使用时间排序
+        :return: [(mtime, index_path, meta), ...]
+        """
+        entries = []
+        directory = os.path.join(self.path, 'index')
+        for name in os.listdir(directory):
+            index_path = os.path.join(directory, name)
+            try:
+                mtime = os.stat(index_path).st_mtime
+                with open(index_path, 'r') as file:
+                    entries.append((mtime, index_path, json.load(file)))
+            except (IOError, OSError, ValueError):
+                continue
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def _evict(self):
+        """
+        超出最大字节数时淘汰最久未使用的结果，文件内容不再被引用时删除；
+        本进程中正在获取的结果不淘汰
+        """
+        entries = self._entries()
+        objects = {}
+        for _, _, meta in entries:
+            objects[(meta['digest'], meta['suffix'])] = meta['size']
+        total = sum(objects.values())
+        with self._locks_lock:
+            active = set(self._active)
+        kept = [meta for _, _, meta in entries if meta.get('key') in active]
+        entries = [entry for entry in entries if entry[2].get('key') not in active]
+        while entries and total > self.max_bytes:
+            _, index_path, meta = entries.pop(0)
+            self._unlink(index_path)
+            digest = (meta['digest'], meta['suffix'])
+            others = kept + [other for _, _, other in entries]
+            if all((other['digest'], other['suffix']) != digest for other in others):
+                self._unlink(self._object_path(*digest))
+                total -= objects.pop(digest, 0)
+
+    @staticmethod
+    def _unlink(file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """
+        清空存储
+        """
+        for _, index_path, _ in self._entries():
+            self._unlink(index_path)
+        shutil.rmtree(os.path.join(self.path, 'objects'), ignore_errors=True)
+        os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+
+    @staticmethod
+    def link(result, file_path):
+        """
+        将结果交给调用方：优先创建硬链接，不支持时(如跨文件系统)复制
+        硬链接与存储共用同一份只读内容，不占用额外空间
+        :param result: StoredResult
+        :param file_path: 目标路径，已存在时替换
+        :return: 目标路径
+        """
+        temp_path = '%s.%d.%d.tmp' % (file_path, os.getpid(), threading.get_ident())
+        try:
+            os.link(result.path, temp_path)
+        except (OSError, AttributeError):
+            shutil.copyfile(result.path, temp_path)
+        os.replace(temp_path, file_path)
+        return file_path
+
+    @staticmethod
+    def open_mmap(result):
+        """
+        以只读内存映射的方式打开结果，多个进程共用操作系统的页缓存
+        :param result: StoredResult
+        :return: mmap.mmap，使用完毕后需调用 close()；空文件返回 b''
+        """
+        if not result.size:
+            return b''
+        with open(result.path, 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def iter_chunks(result, chunk_size=COPY_CHUNK_SIZE):
+        """
+        按块读取结果内容
+        :param result: StoredResult
+        :param chunk_size: 每次读取的字节数
+        :return: 生成器 bytes
+        """
+        with open(result.path, 'rb') as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
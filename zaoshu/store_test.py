@@ -0,0 +1,194 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+运行结果存储的单元测试
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from time import sleep
+
+from zaoshu import Instance
+from zaoshu import ZaoshuRequests
+from zaoshu.batch import fan_out
+from zaoshu.store import ResultStore
+from zaoshu.zaoshu_test import LocalServer
+
+
+def writer(content, name='/result', suffix='.csv'):
+    """返回写入固定内容的下载函数"""
+    def download(fileobj):
+        fileobj.write(content)
+        return name, suffix
+    return download
+
+
+class TestResultStore(unittest.TestCase):
+    """
+    运行结果存储 ResultStore 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_fetch_once(self):
+        """测试同一结果只下载一次，相同内容只保存一份"""
+        store = ResultStore(self.path)
+        calls = []
+
+        def download(fileobj):
+            calls.append(1)
+            sleep(0.05)
+            return writer(b'a,b\n1,2\n')(fileobj)
+
+        results = list(fan_out(lambda _: store.fetch('i1', 't1', 'csv', download), range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(result.response for result in results)), 1)
+
+        other = store.fetch('i1', 't2', 'csv', writer(b'a,b\n1,2\n'))
+        self.assertEqual(other.path, results[0].response.path)
+        with open(other.path, 'rb') as file:
+            self.assertEqual(file.read(), b'a,b\n1,2\n')
+        self.assertEqual(ResultStore(self.path).get('i1', 't1', 'csv'), results[0].response)
+        self.assertIsNone(store.get('i1', 't1', 'json'))
+
+    def test_failed_download(self):
+        """测试下载失败时不保存"""
+        store = ResultStore(self.path)
+
+        def download(fileobj):
+            fileobj.write(b'partial')
+            raise IOError('connection reset')
+
+        self.assertRaises(IOError, store.fetch, 'i1', 't1', 'csv', download)
+        self.assertIsNone(store.get('i1', 't1', 'csv'))
+        self.assertEqual(os.listdir(os.path.join(self.path, 'tmp')), [])
+
+    def test_evict(self):
+        """测试超出最大字节数时淘汰最久未使用的结果"""
+        store = ResultStore(self.path, max_bytes=250)
+        for task_id in ('t1', 't2'):
+            store.fetch('i1', task_id, 'csv', writer(task_id.encode() * 50))
+            sleep(0.01)
+        store.get('i1', 't1', 'csv')
+        sleep(0.01)
+        store.fetch('i1', 't3', 'csv', writer(b't3' * 50))
+        self.assertIsNotNone(store.get('i1', 't1', 'csv'))
+        self.assertIsNone(store.get('i1', 't2', 'csv'))
+        self.assertIsNotNone(store.get('i1', 't3', 'csv'))
+        objects = [name for _, _, names in os.walk(os.path.join(self.path, 'objects'))
+                   for name in names]
+        self.assertEqual(len(objects), 2)
+
+    def test_evict_oversized(self):
+        """测试超过最大字节数的结果在交给调用方前不被淘汰"""
+        store = ResultStore(self.path, max_bytes=100)
+        store.fetch('i1', 't1', 'csv', writer(b't1' * 25))
+        sleep(0.01)
+        result = store.fetch('i1', 't2', 'csv', writer(b't2' * 100))
+        with open(result.path, 'rb') as file:
+            self.assertEqual(file.read(), b't2' * 100)
+        self.assertIsNone(store.get('i1', 't1', 'csv'))
+
+    def test_hand_out(self):
+        """测试硬链接及内存映射"""
+        store = ResultStore(self.path)
+        result = store.fetch('i1', 't1', 'csv', writer(b'a,b\n1,2\n'))
+        target = os.path.join(self.path, 'result.csv')
+        store.link(result, target)
+        store.link(result, target)
+        self.assertEqual(os.stat(target).st_ino, os.stat(result.path).st_ino)
+        data = store.open_mmap(result)
+        try:
+            self.assertEqual(data[:4], b'a,b\n')
+        finally:
+            data.close()
+
+
+class TestInstanceStore(unittest.TestCase):
+    """
+    使用结果存储下载运行结果的单元测试
+    """
+
+    content = b'a,b\n' + b'1,2\n' * 1000
+    headers = {'content-disposition': "attachment; filename*=UTF-8''result.csv"}
+
+    def setUp(self):
+        """初始化工作"""
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.status = 'success'
+        self.downloads = [(200, self.headers, self.content)]
+
+        def respond(handler):
+            if not handler.path.split('?')[0].endswith('/result/file'):
+                data = {'data': {'id': 't1', 'status': self.status}}
+                return 200, None, json.dumps(data).encode()
+            return self.downloads.pop(0) if len(self.downloads) > 1 else self.downloads[0]
+
+        self.server = LocalServer([(200, None, respond)]).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.request = ZaoshuRequests('key', 'secret')
+        self.addCleanup(self.request.close)
+        self.instance = Instance(self.server.url, self.request,
+                                 store=ResultStore(os.path.join(self.path, 'store')))
+
+    def test_download(self):
+        """测试各种下载方式共用一次下载"""
+        self.assertEqual(self.instance.download_run_data('i1', 't1'),
+                         (self.content.decode(),))
+        fileobj = BytesIO()
+        self.instance.download_run_data('i1', 't1', fileobj=fileobj)
+        self.assertEqual(fileobj.getvalue(), self.content)
+        self.assertEqual(len(list(self.instance.iter_results('i1', 't1'))), 1000)
+
+        cwd = os.getcwd()
+        os.chdir(self.path)
+        try:
+            path = self.instance.download_run_data('i1', 't1', save_file=True, save_path='/data')
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(path, os.path.join(os.path.realpath(self.path),
+                                            'data/datafile/result.csv'))
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(self.download_count(), 1)
+
+    def download_count(self):
+        """下载结果文件的请求数"""
+        return len([request for request in self.server.requests
+                    if request[1].split('?')[0].endswith('/result/file')])
+
+    def test_running(self):
+        """测试任务未结束时不使用结果存储"""
+        self.status = 'running'
+        for _ in range(2):
+            self.assertEqual(self.instance.download_run_data('i1', 't1'),
+                             (self.content.decode(),))
+        self.assertEqual(len(list(self.instance.iter_results('i1', 't1'))), 1000)
+        self.assertEqual(self.download_count(), 3)
+        self.assertIsNone(self.instance.store.get('i1', 't1', 'csv'))
+
+    def test_small_store(self):
+        """测试结果大于存储的最大字节数时仍可下载"""
+        self.instance.store = ResultStore(os.path.join(self.path, 'small'), max_bytes=100)
+        for _ in range(2):
+            self.assertEqual(self.instance.download_run_data('i1', 't1'),
+                             (self.content.decode(),))
+
+    def test_error(self):
+        """测试下载失败时抛出异常且不保存"""
+        self.downloads = [(404, {}, b'not found'), (200, self.headers, self.content)]
+        self.assertRaises(Exception, self.instance.download_run_data, 'i1', 't1')
+        self.assertEqual(self.instance.download_run_data('i1', 't1'),
+                         (self.content.decode(),))
+
+
+if __name__ == '__main__':
+    unittest.main()
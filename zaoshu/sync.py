@@ -0,0 +1,265 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+sync 模块提供运行结果的增量同步 SyncEngine：在本地 SQLite 索引中记录已同步的任务，
+每次只下载新增或变化的已结束任务的结果，进程中断后再次运行会继续未完成的同步；
+每个实例记录已检查到的位置(高水位)，之后只从该位置起获取任务列表
+"""
+import hashlib
+import json
+import sqlite3
+from collections import namedtuple
+from contextlib import closing
+from time import time
+
+from zaoshu.batch import fan_out
+from zaoshu.pages import PAGE_SIZE, item_time
+from zaoshu.wait import TASK_FINISHED_STATUS
+
+# 任务同步状态
+STATE_PENDING = 'pending'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+# 一次同步的结果，各项为 [(instance_id, task_id), ...]
+# synced: 本次同步成功，skipped: 已同步且未变化，failed: 同步失败(下次运行重试)
+SyncReport = namedtuple('SyncReport', ['synced', 'skipped', 'failed'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    instance_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    state TEXT NOT NULL,
+    status TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (instance_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state);
+CREATE TABLE IF NOT EXISTS marks (
+    instance_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    position INTEGER NOT NULL
+);
+'''
+
+
+def task_fingerprint(task):
+    """
+    获得任务记录的指纹，任务记录变化时指纹随之变化
+    :param task: 任务列表中的任务 dict
+    :return: str
+    """
+    return hashlib.sha1(json.dumps(task, sort_keys=True, default=str)
+                        .encode('utf-8')).hexdigest()
+
+
+class SyncEngine(object):
+    """
+    运行结果增量同步
+    """
+
+    def __init__(self, instance, db_path, handler=None, file_type='csv', save_path=None,
+                 workers=4, page_size=PAGE_SIZE, newest_first=False, known_streak=100,
+                 finished_status=TASK_FINISHED_STATUS):
+        """
+        构造函数
+        :param instance: Instance
+        :param db_path: SQLite 索引文件路径
+        :param handler: 同步单个任务的函数 handler(instance_id, task_id, task)，返回值记录在索引中，
+                        task 为任务列表中的任务 dict(继续上次未完成的同步时可能为 None)，
+                        为None时以断点续传方式下载结果文件到 save_path
+        :param file_type: 下载的文件类型
+        :param save_path: 保存目录，handler 为None时使用
+        :param workers: 同时同步的任务数
+        :param page_size: 分页获取任务列表时每页的任务数
+        :param newest_first: 任务列表是否按创建时间倒序，为True时遇到早于高水位的任务或连续遇到
+                             known_streak 个已同步且未变化的任务后不再请求后续页；
+                             为False(接口默认的正序)时从高水位所在页附近开始请求
+        :param known_streak: 见 newest_first
+        :param finished_status: 任务结束时的状态，只同步已结束的任务
+        """
+        if handler is None and not save_path:
+            raise Exception("save_path Error")
+        self.instance = instance
+        self.db_path = db_path
+        self.handler = handler or self._download
+        self.file_type = file_type
+        self.save_path = save_path
+        self.workers = workers
+        self.page_size = page_size
+        self.newest_first = newest_first
+        self.known_streak = known_streak
+        self.finished_status = tuple(finished_status)
+
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path)
+        db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def _download(self, instance_id, task_id, task):
+        """
+        默认的同步函数：断点续传下载结果文件
+        :return: 保存文件的路径
+        """
+        return self.instance.download_run_data(instance_id, task_id, file_type=self.file_type,
+                                               save_file=True, save_path=self.save_path,
+                                               resume=True)
+
+    def state(self, instance_id, task_id):
+        """
+        获得任务的同步状态
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :return: dict，未同步过时返回 None
+        """
+        with closing(self._connect()) as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute('SELECT * FROM tasks WHERE instance_id = ? AND task_id = ?',
+                             (instance_id, task_id)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _mark(self, db, instance_id):
+        """
+        实例的高水位
+        :return: (创建时间, 在任务列表中的位置)，没有时返回 None
+        """
+        return db.execute('SELECT created, position FROM marks WHERE instance_id = ?',
+                          (instance_id,)).fetchone()
+
+    def _changed(self, db, instance_ids, full=False):
+        """
+        遍历任务列表，找出需要同步的任务
+        有高水位时跳过更早创建的任务：倒序列表遇到更早的任务即结束，
+        正序列表从高水位所在页的前一页开始(允许其间有一页以内的任务被删除)
+        :return: ([(instance_id, task_id, task, fingerprint), ...], 已同步且未变化的任务,
+                 {instance_id: 新的高水位或 None})
+        """
+        changed = []
+        skipped = []
+        marks = {}
+        for instance_id in instance_ids:
+            mark = None if full else self._mark(db, instance_id)
+            since = mark[0] if mark is not None else None
+            start = 1
+            if mark is not None and not self.newest_first:
+                start = max(1, mark[1] // self.page_size)
+            # 新的高水位：最早的未结束任务，没有时为最新的任务；有任务没有创建时间时不记录
+            oldest_open = newest = None
+            timeless = False
+            streak = 0
+            tasks = self.instance.iter_tasks(instance_id, page_size=self.page_size, start=start)
+            for position, task in enumerate(tasks, (start - 1) * self.page_size):
+                created = item_time(task)
+                if created is None:
+                    timeless = True
+                elif since is not None and created < since:
+                    if self.newest_first:
+                        break
+                    continue
+                else:
+                    if newest is None or created > newest[0]:
+                        newest = (created, position)
+                finished = str(task.get('status')).lower() in self.finished_status
+                if not finished:
+                    if created is not None and (oldest_open is None or
+                                                created < oldest_open[0]):
+                        oldest_open = (created, position)
+                    continue
+                task_id = str(task['id'])
+                fingerprint = task_fingerprint(task)
+                row = db.execute('SELECT fingerprint, state FROM tasks '
+                                 'WHERE instance_id = ? AND task_id = ?',
+                                 (instance_id, task_id)).fetchone()
+                if row is not None and row == (fingerprint, STATE_DONE):
+                    skipped.append((instance_id, task_id))
+                    streak += 1
+                    if self.newest_first and streak >= self.known_streak:
+                        break
+                    continue
+                streak = 0
+                changed.append((instance_id, task_id, task, fingerprint))
+            if timeless:
+                marks[instance_id] = None
+            elif oldest_open is not None or newest is not None:
+                marks[instance_id] = oldest_open or newest
+        return changed, skipped, marks
+
+    def _unfinished(self, db, instance_ids, changed):
+        """
+        上次运行中断或失败、本次任务列表中未出现的任务
+        """
+        seen = set((instance_id, task_id) for instance_id, task_id, _, _ in changed)
+        rows = db.execute('SELECT instance_id, task_id, fingerprint FROM tasks WHERE state != ?',
+                          (STATE_DONE,)).fetchall()
+        return [(instance_id, task_id, None, fingerprint)
+                for instance_id, task_id, fingerprint in rows
+                if (instance_id, task_id) not in seen and
+                (instance_ids is None or instance_id in instance_ids)]
+
+    def run(self, instance_ids=None, full=False):
+        """
+        同步一次
+        高水位之前创建的已结束任务不再检查变化，需要时设置 full 重新检查全部任务
+        :param instance_ids: 同步的实例ID列表，为None时同步所有实例
+        :param full: 为True时忽略高水位，遍历全部任务
+        :return: SyncReport
+        """
+        wanted = None if instance_ids is None else set(instance_ids)
+        if instance_ids is None:
+            instance_ids = [str(item['id']) for item in self.instance.iter_instances()]
+
+        with closing(self._connect()) as db:
+            changed, skipped, marks = self._changed(db, instance_ids, full)
+            changed += self._unfinished(db, wanted, changed)
+
+            # 先记录为待同步，中断后下次运行继续；未同步的任务由此继续，高水位可同时更新
+            now = time()
+            with db:
+                for instance_id, mark in marks.items():
+                    if mark is None:
+                        db.execute('DELETE FROM marks WHERE instance_id = ?', (instance_id,))
+                    else:
+                        db.execute('INSERT OR REPLACE INTO marks (instance_id, created, '
+                                   'position) VALUES (?, ?, ?)', (instance_id,) + mark)
+                # UPSERT 需要 SQLite 3.24，较早的版本先插入再更新
+                for instance_id, task_id, task, fingerprint in changed:
+                    status = task.get('status') if task else None
+                    db.execute('INSERT OR IGNORE INTO tasks (instance_id, task_id, fingerprint, '
+                               'state, updated_at) VALUES (?, ?, ?, ?, ?)',
+                               (instance_id, task_id, fingerprint, STATE_PENDING, now))
+                    db.execute('UPDATE tasks SET fingerprint = ?, state = ?, '
+                               'status = COALESCE(?, status), updated_at = ? '
+                               'WHERE instance_id = ? AND task_id = ?',
+                               (fingerprint, STATE_PENDING, status, now, instance_id, task_id))
+
+            synced = []
+            failed = []
+            tasks = dict(((instance_id, task_id), task)
+                         for instance_id, task_id, task, _ in changed)
+            for result in fan_out(lambda key: self.handler(key[0], key[1], tasks[key]),
+                                  list(tasks), self.workers, ordered=False):
+                instance_id, task_id = result.key
+                with db:
+                    if result.error is None:
+                        db.execute('UPDATE tasks SET state = ?, result = ?, error = NULL, '
+                                   'attempts = attempts + 1, updated_at = ? '
+                                   'WHERE instance_id = ? AND task_id = ?',
+                                   (STATE_DONE, json.dumps(result.response, default=str),
+                                    time(), instance_id, task_id))
+                        synced.append(result.key)
+                    else:
+                        db.execute('UPDATE tasks SET state = ?, error = ?, '
+                                   'attempts = attempts + 1, updated_at = ? '
+                                   'WHERE instance_id = ? AND task_id = ?',
+                                   (STATE_FAILED, repr(result.error), time(),
+                                    instance_id, task_id))
+                        failed.append(result.key)
+        return SyncReport(synced, skipped, failed)
@@ -0,0 +1,118 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+增量同步的单元测试
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from zaoshu import Instance
+from zaoshu import ZaoshuRequests
+from zaoshu.pages_test import paged_server
+from zaoshu.sync import SyncEngine, STATE_DONE, STATE_FAILED
+
+
+class TestSyncEngine(unittest.TestCase):
+    """
+    运行结果增量同步 SyncEngine 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.db_path = os.path.join(self.path, 'sync.db')
+        self.tasks = [{'id': 't3', 'status': 'running'},
+                      {'id': 't2', 'status': 'success'},
+                      {'id': 't1', 'status': 'success'}]
+        self.server = paged_server(self.tasks).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.request = ZaoshuRequests('key', 'secret')
+        self.addCleanup(self.request.close)
+        self.instance = Instance(self.server.url, self.request)
+        self.synced = []
+        self.fail = set()
+
+    def handler(self, instance_id, task_id, task):
+        """记录同步的任务"""
+        if task_id in self.fail:
+            raise IOError('download failed')
+        self.synced.append((instance_id, task_id))
+        return task_id + '.csv'
+
+    def engine(self, **kwargs):
+        """创建同步引擎"""
+        return SyncEngine(self.instance, self.db_path, handler=self.handler, **kwargs)
+
+    def test_incremental(self):
+        """测试只同步新增或变化的已结束任务"""
+        report = self.engine().run(['i1'])
+        self.assertEqual(sorted(report.synced), [('i1', 't1'), ('i1', 't2')])
+        self.assertEqual(self.engine().state('i1', 't2')['result'], '"t2.csv"')
+
+        self.tasks[0]['status'] = 'success'
+        self.tasks[1]['status'] = 'failed'
+        report = self.engine().run(['i1'])
+        self.assertEqual(sorted(report.synced), [('i1', 't2'), ('i1', 't3')])
+        self.assertEqual(report.skipped, [('i1', 't1')])
+        self.assertEqual(len(self.synced), 4)
+
+    def test_retry(self):
+        """测试失败及中断的任务在下次运行时继续同步"""
+        self.fail.add('t1')
+        report = self.engine().run(['i1'])
+        self.assertEqual(report.failed, [('i1', 't1')])
+        self.assertEqual(self.engine().state('i1', 't1')['state'], STATE_FAILED)
+
+        # 任务从列表中消失后仍会继续同步
+        self.fail.clear()
+        del self.tasks[2]
+        report = self.engine().run(['i1'])
+        self.assertEqual(report.synced, [('i1', 't1')])
+        state = self.engine().state('i1', 't1')
+        self.assertEqual((state['state'], state['attempts']), (STATE_DONE, 2))
+
+    def test_known_streak(self):
+        """测试倒序列表中连续遇到已同步的任务后不再请求后续页"""
+        self.tasks[:] = [{'id': 't%d' % index, 'status': 'success'} for index in range(10, 0, -1)]
+        self.engine().run(['i1'])
+        self.tasks.insert(0, {'id': 't11', 'status': 'success'})
+        count = len(self.server.requests)
+
+        engine = self.engine(page_size=2, newest_first=True, known_streak=2)
+        report = engine.run(['i1'])
+        self.assertEqual(report.synced, [('i1', 't11')])
+        # 预取最多多请求一页
+        self.assertLessEqual(len(self.server.requests) - count, 3)
+
+    def test_high_water_mark(self):
+        """测试再次同步时只从高水位开始请求任务列表，未结束的任务结束后仍会同步"""
+        self.tasks[:] = [{'id': 't%d' % index, 'status': 'success',
+                          'createdAt': 1577836800 + index * 60} for index in range(1, 21)]
+        self.tasks[15]['status'] = 'running'
+        report = self.engine(page_size=2).run(['i1'])
+        self.assertEqual(len(report.synced), 19)
+
+        self.tasks[15]['status'] = 'success'
+        self.tasks.append({'id': 't21', 'status': 'success', 'createdAt': 1577836800 + 21 * 60})
+        count = len(self.server.requests)
+        report = self.engine(page_size=2).run(['i1'])
+        self.assertEqual(sorted(report.synced), [('i1', 't16'), ('i1', 't21')])
+        self.assertLessEqual(len(self.server.requests) - count, 5)
+
+        count = len(self.server.requests)
+        report = self.engine(page_size=2).run(['i1'])
+        self.assertEqual(report.synced, [])
+        self.assertLessEqual(len(self.server.requests) - count, 3)
+        self.assertEqual(len(self.engine(page_size=2).run(['i1'], full=True).skipped), 21)
+
+    def test_save_path(self):
+        """测试未设置 handler 时需要保存目录"""
+        self.assertRaises(Exception, SyncEngine, self.instance, self.db_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,570 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+transport 模块提供 ZaoshuRequests 底层的HTTP传输，可替换：
+RequestsTransport 基于 requests(默认)，StdlibTransport 只使用标准库 http.client 并保持长连接，
+MemoryTransport 不经过网络、把请求交给进程内的处理函数，用于测试。
+各传输的依赖均在第一次发送请求时才导入，以缩短 import zaoshu 的时间。
+requests 自行协商压缩并解压；StdlibTransport 发送 Accept-Encoding 并按块流式解压
+"""
+import threading
+from collections.abc import MutableMapping
+from io import BytesIO
+from urllib.parse import urlsplit, urlencode
+
+from zaoshu.compress import DecodingReader, accept_encoding, content_encodings, decompress
+
+# 标准库传输使用的 User-Agent
+USER_AGENT = 'zaoshu-pysdk'
+# 标准库传输在连接被服务器关闭时自动重发一次的请求类型(POST 不是幂等操作)
+REUSE_RETRY_METHODS = ('GET', 'HEAD', 'PATCH', 'PUT', 'DELETE', 'OPTIONS')
+# 可按名称创建的传输，见 create_transport
+TRANSPORTS = ('requests', 'stdlib')
+
+
+def split_timeout(timeout):
+    """
+    拆分超时时间
+    :param timeout: 数字或 (连接超时, 读取超时)，None为不限制
+    :return: (连接超时, 读取超时)
+    """
+    if isinstance(timeout, (tuple, list)):
+        return timeout[0], timeout[1]
+    return timeout, timeout
+
+
+def request_target(url, params=None):
+    """
+    请求行中的路径及查询参数，参数的编码方式与 requests 一致
+    :param url: 请求url
+    :param params: 请求参数
+    :return: (urlsplit 结果, 路径?查询参数)
+    """
+    parts = urlsplit(url)
+    target = parts.path or '/'
+    query = parts.query
+    if params:
+        encoded = urlencode(params, doseq=True)
+        query = query + '&' + encoded if query else encoded
+    if query:
+        target += '?' + query
+    return parts, target
+
+
+def content_charset(headers):
+    """
+    从响应头 Content-Type 中获得字符集
+    :param headers: 响应头
+    :return: str，没有时返回 None
+    """
+    for param in (headers.get('content-type') or '').split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'charset' and value:
+            return value.strip('"\' ')
+    return None
+
+
+class Headers(MutableMapping):
+    """
+    不区分大小写的请求头/响应头，保留第一次写入时的大小写
+    """
+
+    def __init__(self, data=None):
+        self._store = {}
+        if data:
+            self.update(data)
+
+    def __setitem__(self, key, value):
+        self._store[key.lower()] = (key, value)
+
+    def __getitem__(self, key):
+        return self._store[key.lower()][1]
+
+    def __delitem__(self, key):
+        del self._store[key.lower()]
+
+    def __iter__(self):
+        return (key for key, _ in self._store.values())
+
+    def __len__(self):
+        return len(self._store)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class Response(object):
+    """
+    StdlibTransport 及 MemoryTransport 的响应，常用属性与 requests.Response 保持一致
+    """
+
+    # 解析json响应内容的编解码器，由 ZaoshuRequests 设置，None为标准库
+    codec = None
+
+    def __init__(self, status_code, headers, url, content=None, raw=None, reason='',
+                 release=None):
+        """
+        构造函数
+        :param status_code: 状态码
+        :param headers: 响应头 Headers
+        :param url: 请求url
+        :param content: 已读取的响应内容，为 None 时从 raw 读取
+        :param raw: 原始字节流
+        :param reason: 状态描述
+        :param release: 响应内容读取完毕或关闭时调用，参数为是否已完整读取
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self.url = url
+        self.reason = reason
+        self.raw = raw if raw is not None else BytesIO(content or b'')
+        self.encoding = content_charset(headers)
+        self._content = content
+        self._release = release
+
+    def __repr__(self):
+        return '<Response [%d]>' % self.status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def ok(self):
+        """
+        状态码是否小于400
+        :return: bool
+        """
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        """
+        响应内容，第一次访问时读取全部
+        :return: bytes
+        """
+        if self._content is None:
+            try:
+                self._content = self.raw.read()
+            except BaseException:
+                self._done(False)
+                raise
+            self._done(True)
+        return self._content
+
+    @property
+    def text(self):
+        """
+        响应内容文本，没有指定字符集时按 utf-8 解码
+        :return: str
+        """
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self, **kwargs):
+        """
+        解析json响应内容，设置了编解码器且没有其他参数时使用该编解码器
+        :return: dict
+        """
+        if self.codec is not None and not kwargs:
+            return self.codec.loads(self.content)
+        import json
+        return json.loads(self.text, **kwargs)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        """
+        按块读取响应内容
+        :param chunk_size: 每块的字节数，None为一次读取全部
+        :param decode_unicode: 是否解码为 str
+        :return: 生成器 bytes
+        """
+        if self._content is not None:
+            content = self._content
+            step = chunk_size or len(content) or 1
+            chunks = (content[start:start + step] for start in range(0, len(content), step))
+        else:
+            chunks = self._read_chunks(chunk_size)
+        if not decode_unicode:
+            return chunks
+        return (chunk.decode(self.encoding or 'utf-8', errors='replace') for chunk in chunks)
+
+    def _read_chunks(self, chunk_size):
+        complete = False
+        try:
+            while True:
+                chunk = self.raw.read(chunk_size) if chunk_size else self.raw.read()
+                if not chunk:
+                    break
+                yield chunk
+                if not chunk_size:
+                    break
+            complete = True
+        finally:
+            self._done(complete)
+
+    def raise_for_status(self):
+        """
+        状态码为4xx、5xx时抛出异常
+        :return: None
+        """
+        if self.status_code >= 400:
+            raise Exception("HTTP Error: %d %s for url: %s"
+                            % (self.status_code, self.reason, self.url))
+
+    def close(self):
+        """
+        关闭响应，未读取完的连接不再复用
+        :return: None
+        """
+        self._done(self._content is not None)
+
+    def _done(self, complete):
+        release, self._release = self._release, None
+        if release is not None:
+            release(complete)
+
+
+class Transport(object):
+    """
+    传输的接口，request 返回与 requests.Response 兼容的响应
+    """
+
+    # 连接失败、超时等请求未得到响应的异常，ZaoshuRequests 据此重试
+    errors = ()
+    # 读取响应内容时连接中断的异常，断点续传据此续传
+    read_errors = ()
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None,
+                stream=False):
+        """
+        发送请求
+        :param method: 请求类型
+        :param url: 请求url
+        :param params: 请求参数
+        :param data: 请求内容 str 或 bytes
+        :param headers: 请求头
+        :param timeout: 超时时间(秒)，数字或 (连接超时, 读取超时)
+        :param stream: 是否以流的方式读取响应内容
+        :return: 响应
+        """
+        raise NotImplementedError
+
+    def build_response(self, url, status_code, headers, content):
+        """
+        由已有的内容创建响应，用于返回缓存
+        :return: 响应
+        """
+        return Response(status_code, Headers(headers), url, content=content, reason='OK')
+
+    def close(self):
+        """
+        关闭连接
+        :return: None
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RequestsTransport(Transport):
+    """
+    基于 requests.Session 的传输，线程安全的连接池复用TCP/TLS连接
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True):
+        """
+        构造函数
+        :param pool_connections: 连接池缓存的主机数
+        :param pool_maxsize: 每个主机保持的最大连接数
+        :param pool_block: 连接数用尽时是否阻塞等待空闲连接
+        :param keep_alive: 是否保持长连接
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def errors(self):
+        from requests.exceptions import ConnectionError, Timeout
+        return ConnectionError, Timeout
+
+    @property
+    def read_errors(self):
+        from requests.exceptions import ConnectionError, ChunkedEncodingError, Timeout
+        return ConnectionError, ChunkedEncodingError, Timeout
+
+    @property
+    def session(self):
+        """
+        连接池，第一次使用时创建
+        :return: requests.Session
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        """
+        创建带连接池的 requests.Session，重试由 ZaoshuRequests 自行处理以便每次重新签名
+        :return: requests.Session
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block,
+                              max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None,
+                stream=False):
+        return self.session.request(method, url, params=params, data=data, headers=headers,
+                                    timeout=timeout, stream=stream)
+
+    def build_response(self, url, status_code, headers, content):
+        from requests import Response as RequestsResponse
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        response = RequestsResponse()
+        response.url = url
+        response.status_code = status_code
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class StdlibTransport(Transport):
+    """
+    只使用标准库 http.client 的传输，没有第三方依赖
+    按 (协议, 主机, 端口) 保持空闲的长连接，线程安全；响应内容读取完毕后连接放回连接池
+    请求头默认带 Accept-Encoding，压缩的响应内容按块解压，raw 为解压后的字节流
+    """
+
+    def __init__(self, pool_maxsize=10, keep_alive=True, context=None):
+        """
+        构造函数
+        :param pool_maxsize: 每个主机保持的最大空闲连接数
+        :param keep_alive: 是否保持长连接
+        :param context: https 使用的 ssl.SSLContext，默认为 ssl.create_default_context()
+        """
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.context = context
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    @property
+    def errors(self):
+        from http.client import HTTPException
+        return OSError, HTTPException
+
+    read_errors = errors
+
+    def _connect(self, scheme, host, port, timeout):
+        """
+        新建连接
+        """
+        import http.client
+        if scheme == 'https':
+            if self.context is None:
+                import ssl
+                self.context = ssl.create_default_context()
+            connection = http.client.HTTPSConnection(host, port, timeout=timeout,
+                                                     context=self.context)
+        elif scheme == 'http':
+            connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        else:
+            raise ValueError('unsupported url scheme: %s' % scheme)
+        connection.connect()
+        return connection
+
+    def _acquire(self, key, timeout):
+        """
+        从连接池取出空闲连接，没有时新建
+        :return: (连接, 是否为复用的连接)
+        """
+        with self._lock:
+            pool = self._pools.get(key)
+            while pool:
+                connection = pool.pop()
+                if not _dropped(connection):
+                    return connection, True
+                connection.close()
+        return self._connect(key[0], key[1], key[2], timeout), False
+
+    def _release(self, key, connection, response, complete):
+        """
+        响应结束后放回连接池，未读取完或服务器要求关闭的连接直接关闭
+        """
+        if not complete or response.will_close or not self.keep_alive:
+            connection.close()
+            return
+        with self._lock:
+            pool = self._pools.setdefault(key, [])
+            if len(pool) < self.pool_maxsize:
+                pool.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None,
+                stream=False):
+        from http.client import BadStatusLine
+
+        parts, target = request_target(url, params)
+        key = (parts.scheme, parts.hostname, parts.port)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        request_headers = {'User-Agent': USER_AGENT, 'Accept': '*/*',
+                           'Accept-Encoding': accept_encoding()}
+        if not self.keep_alive:
+            request_headers['Connection'] = 'close'
+        request_headers.update(headers or {})
+        connect_timeout, read_timeout = split_timeout(timeout)
+
+        while True:
+            connection, reused = self._acquire(key, connect_timeout)
+            try:
+                connection.sock.settimeout(read_timeout)
+                connection.request(method, target, body=data, headers=request_headers)
+                raw = connection.getresponse()
+            except (ConnectionError, BadStatusLine):
+                connection.close()
+                # 复用的空闲连接可能已被服务器关闭，换新连接重发一次
+                if reused and method in REUSE_RETRY_METHODS:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            break
+
+        response_headers = _merge_headers(raw.getheaders())
+        encodings = content_encodings(response_headers) if method != 'HEAD' else []
+        if stream:
+            reader = DecodingReader(raw, encodings) if encodings else raw
+            return Response(raw.status, response_headers, url, raw=reader, reason=raw.reason,
+                            release=lambda complete: self._release(key, connection, raw,
+                                                                   complete))
+        try:
+            content = raw.read()
+        except BaseException:
+            connection.close()
+            raise
+        self._release(key, connection, raw, True)
+        return Response(raw.status, response_headers, url, content=decompress(content, encodings),
+                        reason=raw.reason)
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for connection in pool:
+                connection.close()
+
+
+class MemoryTransport(Transport):
+    """
+    进程内传输，把请求交给处理函数，不经过网络，用于测试
+    处理函数与 zaoshu.mock.MockServer.handle 的参数一致，可直接使用 MockServer(...).handle；
+    不发送 Accept-Encoding，处理函数返回压缩的内容时同样会解压
+    """
+
+    def __init__(self, handler):
+        """
+        构造函数
+        :param handler: 处理函数 (请求类型, 路径?查询参数, 请求头 Headers, 请求内容 bytes)
+                        -> (状态码, 响应头 dict, 响应内容 bytes 或 str)
+        """
+        self.handler = handler
+        # 收到的请求 [(请求类型, 路径?查询参数, 请求头, 请求内容), ...]
+        self.requests = []
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None,
+                stream=False):
+        _, target = request_target(url, params)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        request_headers = Headers(headers)
+        self.requests.append((method, target, request_headers, data))
+        status_code, response_headers, content = self.handler(method, target, request_headers,
+                                                              data or b'')
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        response_headers = Headers(response_headers)
+        encodings = content_encodings(response_headers)
+        if stream and encodings:
+            return Response(status_code, response_headers, url,
+                            raw=DecodingReader(BytesIO(content), encodings))
+        return Response(status_code, response_headers, url,
+                        content=decompress(content, encodings))
+
+
+def _merge_headers(items):
+    """
+    合并同名响应头
+    """
+    headers = Headers()
+    for key, value in items:
+        if key in headers:
+            headers[key] = headers[key] + ', ' + value
+        else:
+            headers[key] = value
+    return headers
+
+
+def _dropped(connection):
+    """
+    空闲连接是否已被服务器关闭(可读即表示收到了 EOF 或意外数据)
+    """
+    import select
+    sock = connection.sock
+    if sock is None:
+        return True
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+
+def create_transport(name, pool_connections=10, pool_maxsize=10, pool_block=False,
+                     keep_alive=True):
+    """
+    按名称创建传输
+    :param name: requests, stdlib
+    :param pool_connections: 连接池缓存的主机数(仅 requests)
+    :param pool_maxsize: 每个主机保持的最大连接数
+    :param pool_block: 连接数用尽时是否阻塞等待空闲连接(仅 requests)
+    :param keep_alive: 是否保持长连接
+    :return: Transport
+    """
+    if name == 'requests':
+        return RequestsTransport(pool_connections, pool_maxsize, pool_block, keep_alive)
+    if name == 'stdlib':
+        return StdlibTransport(pool_maxsize, keep_alive)
+    raise ValueError('unknown transport: %s' % name)
@@ -0,0 +1,182 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+可替换的HTTP传输的单元测试
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+
+from zaoshu import ZaoshuSdk, ZaoshuRequests, ResponseCache
+from zaoshu.mock import MockServer, csv_result
+from zaoshu.transport import Headers, Response, MemoryTransport, StdlibTransport
+from zaoshu.transport import create_transport
+
+
+class TestHeaders(unittest.TestCase):
+    """
+    不区分大小写的 Headers 单元测试
+    """
+
+    def test(self):
+        """测试大小写及保留原始的键"""
+        headers = Headers({'Content-Type': 'text/csv'})
+        headers['etag'] = '"v1"'
+        self.assertEqual(headers['content-type'], 'text/csv')
+        self.assertIn('ETag', headers)
+        self.assertEqual(sorted(headers), ['Content-Type', 'etag'])
+        del headers['CONTENT-TYPE']
+        self.assertEqual(dict(headers), {'etag': '"v1"'})
+
+    def test_response(self):
+        """测试响应的内容、文本及按块读取"""
+        response = Response(200, Headers({'Content-Type': 'application/json; charset=gbk'}),
+                            'http://localhost/', raw=BytesIO('{"a": "中"}'.encode('gbk')))
+        chunks = list(response.iter_content(chunk_size=3))
+        self.assertEqual(b''.join(chunks), '{"a": "中"}'.encode('gbk'))
+        self.assertEqual(response.encoding, 'gbk')
+        self.assertTrue(response.ok)
+        with self.assertRaises(Exception):
+            Response(404, Headers(), 'http://localhost/', content=b'').raise_for_status()
+
+
+class TestMemoryTransport(unittest.TestCase):
+    """
+    进程内传输 MemoryTransport 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(result_rows=100)
+        self.addCleanup(self.server.stop)
+        self.transport = MemoryTransport(self.server.handle)
+        self.sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url='http://mock/v2',
+                             transport=self.transport, max_retries=0)
+
+    def test_requests(self):
+        """测试签名校验、查询参数及下载，不经过网络"""
+        instances = self.sdk.instance.get_instances({'page': 1, 'pageSize': 2})
+        self.assertEqual([item.id for item in instances], ['instance-0', 'instance-1'])
+        self.assertEqual(self.transport.requests[-1][1], '/v2/instances?page=1&pageSize=2')
+        self.assertEqual(self.sdk.instance.edit('instance-0', title='新标题').status_code, 200)
+        self.assertEqual(self.sdk.instance.get_instance('instance-0').title, '新标题')
+
+        fileobj = BytesIO()
+        self.sdk.instance.download_run_data('instance-0', 'task-0', fileobj=fileobj)
+        self.assertEqual(fileobj.getvalue(), csv_result(100))
+
+    def test_cache(self):
+        """测试缓存返回与传输相同类型的响应"""
+        request = ZaoshuRequests('mock-key', 'mock-secret', transport=self.transport,
+                                 cache=ResponseCache())
+        url = 'http://mock/v2/instance/instance-0'
+        first = request.get(url, endpoint='http://mock/v2/instance/:instance_id')
+        second = request.get(url, endpoint='http://mock/v2/instance/:instance_id')
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertIsInstance(second, Response)
+        self.assertEqual(second.json(), first.json())
+
+
+class TestStdlibTransport(unittest.TestCase):
+    """
+    标准库传输 StdlibTransport 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = MockServer(result_rows=20000).start()
+        self.addCleanup(self.server.stop)
+        self.sdk = ZaoshuSdk('mock-key', 'mock-secret', base_url=self.server.url,
+                             transport='stdlib', max_retries=0)
+        self.addCleanup(self.sdk.close)
+
+    def test_keep_alive(self):
+        """测试串行请求复用同一个连接"""
+        for _ in range(5):
+            self.assertEqual(self.sdk.instance.item('instance-0').status_code, 200)
+        pools = self.sdk.request.transport._pools
+        self.assertEqual([len(pool) for pool in pools.values()], [1])
+        connection = list(pools.values())[0][0]
+        self.assertEqual(self.sdk.user.get_wallet().balance, 100.0)
+        self.assertIs(list(pools.values())[0][0], connection)
+
+    def test_download(self):
+        """测试流式、分段并行及断点续传下载"""
+        expected = self.server.result('csv')[1]
+        fileobj = BytesIO()
+        self.sdk.instance.download_run_data('instance-0', 'task-0', fileobj=fileobj)
+        self.assertEqual(fileobj.getvalue(), expected)
+
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        cwd = os.getcwd()
+        os.chdir(save_dir)
+        try:
+            for options in ({'workers': 3, 'part_size': 100000}, {'resume': True}):
+                path = self.sdk.instance.download_run_data('instance-0', 'task-0', save_file=True,
+                                                           save_path='/data', **options)
+                with open(path, 'rb') as file:
+                    self.assertEqual(file.read(), expected)
+        finally:
+            os.chdir(cwd)
+
+        raw = self.sdk.instance.download_run_data('instance-0', 'task-0', stream=True)
+        self.assertEqual(raw.read(), expected)
+        raw.close()
+
+    def test_connection_error(self):
+        """测试连接失败时按重试次数重试后抛出异常"""
+        request = ZaoshuRequests('key', 'secret', transport='stdlib', max_retries=1,
+                                 backoff_factor=0, timeout=1)
+        retries = []
+        request.add_hook('on_retry', retries.append)
+        with self.assertRaises(OSError):
+            request.get('http://127.0.0.1:1/instances')
+        self.assertEqual(len(retries), 1)
+
+    def test_unknown(self):
+        """测试未知的传输名称"""
+        with self.assertRaises(ValueError):
+            create_transport('curl')
+        self.assertIsInstance(create_transport('stdlib'), StdlibTransport)
+
+
+class TestLazyImport(unittest.TestCase):
+    """
+    延迟导入单元测试
+    """
+
+    def test(self):
+        """测试 import zaoshu 及使用标准库传输发送请求时不导入 requests"""
+        code = ("import sys, zaoshu\n"
+                "assert sys.version_info < (3, 7) or 'zaoshu.zaoshu' not in sys.modules\n"
+                "from zaoshu.mock import MockServer\n"
+                "with MockServer(result_rows=10) as server:\n"
+                "    sdk = zaoshu.ZaoshuSdk('mock-key', 'mock-secret', base_url=server.url,\n"
+                "                           transport='stdlib')\n"
+                "    assert sdk.instance.item('instance-0').status_code == 200\n"
+                "print('requests' in sys.modules)\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.decode('utf-8').strip(), 'False')
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Python 3.6 imports all exports eagerly')
+    def test_sdk(self):
+        """测试导入 ZaoshuSdk 不导入批量请求、json 及结果解析的依赖"""
+        code = ("import sys\n"
+                "from zaoshu import ZaoshuSdk\n"
+                "print(' '.join(sorted(name for name in ('concurrent.futures', 'logging', 'json',\n"
+                "      'csv', 'mmap', 'array', 'zaoshu.models', 'zaoshu.decoder')\n"
+                "      if name in sys.modules)))\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.decode('utf-8').strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
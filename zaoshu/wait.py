@@ -0,0 +1,145 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+wait 模块负责等待任务运行结束：带随机抖动的指数退避轮询，多个任务共用一个轮询循环
+"""
+import random
+from time import monotonic, sleep
+
+from zaoshu.codec import decode_json
+
+# 任务结束时的状态
+TASK_FINISHED_STATUS = ('success', 'succeed', 'succeeded', 'finished', 'completed', 'done',
+                        'failed', 'failure', 'error', 'stopped', 'cancelled', 'canceled',
+                        'timeout')
+# 第一次轮询前的等待时间及最长轮询间隔(秒)
+POLL_INITIAL = 0.05
+POLL_MAXIMUM = 30.0
+# 轮询时仍继续重试的 4xx 状态码，其他 4xx(如任务不存在)不再等待
+POLL_RETRY_STATUS = (408, 429)
+
+
+class Backoff(object):
+    """
+    带随机抖动的指数退避
+    """
+
+    def __init__(self, initial=POLL_INITIAL, maximum=POLL_MAXIMUM, factor=2.0, jitter=0.5):
+        """
+        构造函数
+        :param initial: 第一次的等待时间(秒)
+        :param maximum: 最长等待时间(秒)
+        :param factor: 每次等待时间的增长倍数
+        :param jitter: 随机抖动比例，实际等待时间在 [1-jitter, 1] 倍之间
+        """
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self._current = initial
+
+    def next(self):
+        """
+        获得下一次的等待时间
+        :return: 秒
+        """
+        interval = self._current
+        self._current = min(self._current * self.factor, self.maximum)
+        return interval * (1 - self.jitter * random.random())
+
+
+def task_status(response):
+    """
+    获得任务详情响应中的任务状态
+    :param response: Instance.task 的响应
+    :return: 小写的状态，无法获取时返回 None
+    """
+    try:
+        status = decode_json(response)['data']['status']
+    except (ValueError, KeyError, TypeError):
+        return None
+    return str(status).lower()
+
+
+def is_task_finished(response):
+    """
+    判断任务是否已运行结束
+    :param response: Instance.task 的响应
+    :return: bool
+    """
+    return response.status_code == 200 and task_status(response) in TASK_FINISHED_STATUS
+
+
+def check_poll(key, response):
+    """
+    检查未结束的任务详情响应，4xx(请求超时及限流除外)表示请求本身有误，继续轮询也不会结束
+    :param key: (instance_id, task_id)
+    :param response: Instance.task 的响应
+    :return: None
+    """
+    status_code = response.status_code
+    if 400 <= status_code < 500 and status_code not in POLL_RETRY_STATUS:
+        raise Exception("task Error: %s/%s %d %s" % (key[0], key[1], status_code, response.text))
+
+
+def run_task_id(response):
+    """
+    从运行实例的响应中获得新建任务的id
+    :param response: Instance.run 的响应
+    :return: 任务id
+    """
+    data = decode_json(response).get('data')
+    if isinstance(data, dict):
+        for key in ('id', 'task_id', 'taskId'):
+            if data.get(key):
+                return data[key]
+    elif data and isinstance(data, str):
+        return data
+    raise Exception("run Error: task id not found in %s" % response.text)
+
+
+def wait_tasks(instance, keys, timeout=None, initial=POLL_INITIAL, maximum=POLL_MAXIMUM,
+               finished=is_task_finished, workers=10):
+    """
+    在一个轮询循环中等待多个任务运行结束，每个任务独立退避，到期的任务并发查询
+    5xx 及连接错误继续退避重试，其他 4xx 响应(如任务不存在)抛出异常
+    :param instance: Instance
+    :param keys: (instance_id, task_id) 的可迭代对象
+    :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+    :param initial: 第一次查询前的等待时间(秒)
+    :param maximum: 最长查询间隔(秒)
+    :param finished: 根据任务详情响应判断任务是否结束的函数
+    :param workers: 同时查询的任务数
+    :return: {(instance_id, task_id): 任务结束时的任务详情响应}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from zaoshu.batch import fan_out
+    deadline = None if timeout is None else monotonic() + timeout
+    waiting = {}
+    for key in keys:
+        backoff = Backoff(initial, maximum)
+        waiting[tuple(key)] = [monotonic() + backoff.next(), backoff]
+    finished_tasks = {}
+
+    # 整个等待过程共用一个线程池，不在每轮查询时重新创建线程
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while waiting:
+            wake = min(state[0] for state in waiting.values())
+            if deadline is not None and wake > deadline:
+                raise TimeoutError('tasks not finished: %s' % sorted(waiting))
+            sleep(max(0, wake - monotonic()))
+
+            now = monotonic()
+            due = [key for key, state in waiting.items() if state[0] <= now]
+            for result in fan_out(lambda key: instance.task(*key), due, workers,
+                                  executor=executor):
+                if result.error is None and finished(result.response):
+                    finished_tasks[result.key] = result.response
+                    del waiting[result.key]
+                else:
+                    if result.error is None:
+                        check_poll(result.key, result.response)
+                    # 查询出错按未结束处理，继续退避
+                    state = waiting[result.key]
+                    state[0] = monotonic() + state[1].next()
+    return finished_tasks
@@ -0,0 +1,282 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+webhook 模块提供接收任务结束回调(result_notify_uri)的内嵌HTTP服务 WebhookReceiver，
+带签名的回调使用与 ZaoshuRequests.sign 相同的规则校验
+"""
+import hmac
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from email.utils import parsedate_tz, mktime_tz
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from time import time
+from urllib.parse import urlsplit, parse_qsl
+
+from zaoshu.zaoshu import ZaoshuRequests
+from zaoshu.wait import run_task_id
+
+logger = logging.getLogger(__name__)
+
+# 缓存尚无人等待的回调数量，避免回调先于 expect 到达时丢失
+RECENT_EVENTS = 1024
+
+
+class WebhookEvent(object):
+    """
+    一次任务结束回调
+    """
+
+    def __init__(self, path, headers, body):
+        """
+        构造函数
+        :param path: 请求路径(含查询参数)
+        :param headers: 请求头
+        :param body: 请求内容 bytes
+        """
+        self.path = path
+        self.headers = headers
+        self.body = body
+        try:
+            self.payload = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            self.payload = None
+
+    def _field(self, *names):
+        """
+        从回调内容(或其中的 data)中获取字段
+        """
+        for payload in (self.payload, (self.payload or {}).get('data')
+                        if isinstance(self.payload, dict) else None):
+            if isinstance(payload, dict):
+                for name in names:
+                    if payload.get(name):
+                        return payload[name]
+        return None
+
+    @property
+    def task_id(self):
+        """
+        回调对应的任务id
+        """
+        return self._field('task_id', 'taskId', 'id')
+
+    @property
+    def instance_id(self):
+        """
+        回调对应的实例id
+        """
+        return self._field('instance_id', 'instanceId')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class WebhookReceiver(object):
+    """
+    任务结束回调接收服务，在后台线程中运行
+    收到回调后依次调用注册的处理函数，并完成对应任务的 Future
+    """
+
+    def __init__(self, host='0.0.0.0', port=0, path='/', api_key=None, api_secret=None,
+                 require_signature=None, max_skew=300, public_url=None):
+        """
+        构造函数
+        :param host: 监听地址
+        :param port: 监听端口，0为随机端口
+        :param path: 接收回调的路径
+        :param api_key: 校验签名使用的api key，为None时不校验key
+        :param api_secret: 校验签名使用的api secret，为None时不校验签名
+        :param require_signature: 是否拒绝没有签名的回调，为None时设置了 api_secret 即拒绝
+        :param max_skew: 允许的 Date 头与本机时间的最大偏差(秒)，None为不检查
+        :param public_url: 造数服务器访问本服务的地址，为None时使用监听地址
+        """
+        self.path = path
+        self.public_url = public_url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        if require_signature is None:
+            require_signature = api_secret is not None
+        self.require_signature = require_signature
+        self.max_skew = max_skew
+
+        self._handlers = []
+        self._futures = {}
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = _ThreadingHTTPServer((host, port), self._handler_class())
+
+    @property
+    def url(self):
+        """
+        回调地址，可作为 Instance.edit 的 result_notify_uri
+        :return: str
+        """
+        if self.public_url:
+            return self.public_url
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d%s' % (host, port, self.path)
+
+    def start(self):
+        """
+        在后台线程中启动服务
+        :return: self
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        停止服务
+        :return: None
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def on(self, handler):
+        """
+        注册回调处理函数，可作为装饰器使用
+        :param handler: 接收 WebhookEvent 的函数
+        :return: handler
+        """
+        self._handlers.append(handler)
+        return handler
+
+    def expect(self, task_id):
+        """
+        获得某任务结束回调的 Future，asyncio 中可用 asyncio.wrap_future 等待
+        :param task_id: 任务id
+        :return: concurrent.futures.Future，结果为 WebhookEvent
+        """
+        with self._lock:
+            future = self._futures.get(task_id)
+            if future is None:
+                future = self._futures[task_id] = Future()
+                event = self._recent.pop(task_id, None)
+                if event is not None:
+                    del self._futures[task_id]
+                    future.set_result(event)
+        return future
+
+    def run(self, instance, instance_id, body=None):
+        """
+        运行实例，返回新建任务结束回调的 Future
+        需先通过 Instance.edit 将实例的 result_notify_uri 设置为 self.url
+        :param instance: Instance
+        :param instance_id: 运行实例的id编号
+        :param body: 运行参数
+        :return: (任务id, concurrent.futures.Future)
+        """
+        response = instance.run(instance_id, body=body)
+        if response.status_code != 200:
+            raise Exception("run Error: %d %s" % (response.status_code, response.text))
+        task_id = run_task_id(response)
+        return task_id, self.expect(task_id)
+
+    def verify(self, method, path, headers, body):
+        """
+        校验回调签名
+        :param method: 请求类型
+        :param path: 请求路径(含查询参数)
+        :param headers: 请求头
+        :param body: 请求内容 bytes
+        :return: bool
+        """
+        authorization = headers.get('Authorization') or ''
+        if not authorization.startswith('ZAOSHU '):
+            return not self.require_signature
+        if self.api_secret is None:
+            return True
+
+        api_key, _, signature = authorization[len('ZAOSHU '):].partition(':')
+        if self.api_key is not None and api_key != self.api_key:
+            return False
+        date = headers.get('Date') or ''
+        if self.max_skew is not None:
+            parsed = parsedate_tz(date)
+            if parsed is None or abs(time() - mktime_tz(parsed)) > self.max_skew:
+                return False
+
+        query = dict(parse_qsl(urlsplit(path).query, keep_blank_values=True))
+        expected = ZaoshuRequests.sign(
+            self.api_secret, method,
+            headers={'Content-Type': headers.get('Content-Type') or '', 'Date': date},
+            parame={'query': query, 'body': body.decode('utf-8') if body else None})
+        return hmac.compare_digest(signature.encode('utf-8'), expected.encode('utf-8'))
+
+    def dispatch(self, event):
+        """
+        分发回调：调用处理函数并完成对应任务的 Future
+        :param event: WebhookEvent
+        :return: None
+        """
+        for handler in list(self._handlers):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception('webhook handler error')
+
+        task_id = event.task_id
+        if task_id is None:
+            return
+        with self._lock:
+            future = self._futures.pop(task_id, None)
+            if future is None:
+                self._recent[task_id] = event
+                while len(self._recent) > RECENT_EVENTS:
+                    self._recent.popitem(last=False)
+        if future is not None:
+            future.set_result(event)
+
+    def _handler_class(self):
+        """
+        创建处理HTTP请求的类
+        """
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status):
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if urlsplit(self.path).path != receiver.path:
+                    return self._reply(404)
+                try:
+                    # 签名按 utf-8 文本计算
+                    body.decode('utf-8')
+                except UnicodeDecodeError:
+                    return self._reply(400)
+                if not receiver.verify(self.command, self.path, self.headers, body):
+                    return self._reply(401)
+                self._reply(200)
+                receiver.dispatch(WebhookEvent(self.path, self.headers, body))
+
+            do_PUT = do_PATCH = do_POST
+
+        return Handler
@@ -0,0 +1,90 @@
+#!/usr/bin.env python3
+# coding=utf-8
+
+"""
+任务结束回调接收服务的单元测试
+"""
+import json
+import unittest
+
+import requests
+
+from zaoshu import Instance
+from zaoshu import ZaoshuRequests
+from zaoshu.webhook import WebhookReceiver
+from zaoshu.zaoshu_test import task_server
+
+
+class TestWebhookReceiver(unittest.TestCase):
+    """
+    任务结束回调接收服务 WebhookReceiver 单元测试
+    """
+
+    def setUp(self):
+        """初始化工作"""
+        self.receiver = WebhookReceiver(host='127.0.0.1', path='/notify', api_key='key',
+                                        api_secret='secret', require_signature=True).start()
+        self.addCleanup(self.receiver.stop)
+        self.request = ZaoshuRequests('key', 'secret', max_retries=0)
+        self.addCleanup(self.request.close)
+
+    def notify(self, payload, request=None):
+        """发送带签名的回调"""
+        return (request or self.request).post(self.receiver.url,
+                                              body=json.dumps(payload))
+
+    def test_signed(self):
+        """测试带签名的回调分发给处理函数及 Future"""
+        events = []
+        self.receiver.on(events.append)
+        future = self.receiver.expect('t1')
+        response = self.notify({'data': {'id': 't1', 'instance_id': 'i1', 'status': 'success'}})
+        self.assertEqual(response.status_code, 200)
+        event = future.result(timeout=5)
+        self.assertEqual((event.task_id, event.instance_id), ('t1', 'i1'))
+        self.assertEqual(events, [event])
+
+    def test_event_before_expect(self):
+        """测试回调先于 expect 到达"""
+        self.notify({'task_id': 't2'})
+        self.assertEqual(self.receiver.expect('t2').result(timeout=5).task_id, 't2')
+
+    def test_rejected(self):
+        """测试拒绝签名错误或没有签名的回调"""
+        wrong = ZaoshuRequests('key', 'wrong', max_retries=0)
+        self.addCleanup(wrong.close)
+        self.assertEqual(self.notify({'task_id': 't3'}, request=wrong).status_code, 401)
+        unsigned = requests.post(self.receiver.url, data=json.dumps({'task_id': 't3'}))
+        self.assertEqual(unsigned.status_code, 401)
+        other = requests.post(self.receiver.url.replace('/notify', '/other'), data='{}')
+        self.assertEqual(other.status_code, 404)
+        self.assertFalse(self.receiver.expect('t3').done())
+
+    def test_unsigned_default(self):
+        """测试设置了 api_secret 时默认拒绝没有签名的回调"""
+        receiver = WebhookReceiver(host='127.0.0.1', api_secret='secret').start()
+        self.addCleanup(receiver.stop)
+        response = requests.post(receiver.url, data=json.dumps({'task_id': 't5'}))
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(receiver.expect('t5').done())
+
+    def test_invalid_body(self):
+        """测试内容不是 utf-8 时返回 400"""
+        response = self.request.post(self.receiver.url, body=b'{"task_id": "\xff\xfe"}')
+        self.assertEqual(response.status_code, 400)
+        response = requests.post(self.receiver.url, data=b'\xc3\x28')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.receiver.expect('t4').done())
+
+    def test_run(self):
+        """测试运行实例返回任务结束回调的 Future"""
+        with task_server({}) as server:
+            instance = Instance(server.url, self.request)
+            task_id, future = self.receiver.run(instance, 'i1')
+        self.assertEqual(task_id, 't9')
+        self.notify({'task_id': 't9'})
+        self.assertEqual(future.result(timeout=5).task_id, 't9')
+
+
+if __name__ == '__main__':
+    unittest.main()
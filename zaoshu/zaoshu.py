@@ -9,58 +9,385 @@ import hmac
 import hashlib
 import base64
 import os
-import json
-from io import BytesIO
-from time import gmtime, strftime
-import zipfile
-import requests
+from time import gmtime, strftime, sleep, time, perf_counter
+from zaoshu.transport import create_transport
+from zaoshu.codec import get_codec, encode_body
+from zaoshu.coalesce import SingleFlight, flight_key
+from zaoshu.hooks import EVENTS, BEFORE_SIGN, AFTER_SEND, ON_RETRY, ON_DOWNLOAD_CHUNK
+from zaoshu.hooks import SignEvent, SendEvent, RetryEvent, EndpointResolver
+from zaoshu.hooks import emit, wrap_iter_content
+# 以下模块本身只导入轻量的依赖；批量请求(concurrent.futures)、模型、结果解析及多进程解析
+# 在第一次使用时才在方法中导入
+from zaoshu.pages import PAGE_SIZE
+from zaoshu.wait import POLL_INITIAL, POLL_MAXIMUM, is_task_finished
+from zaoshu.download import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_PART_SIZE
+from zaoshu.download import parse_file_name, data_file_path, write_chunks, decode_run_data
 
 __version__ = '0.2.0'
 
+# 请求的 Content-Type 及 Date 格式
+CONTENT_TYPE = 'application/json; charset=utf-8'
+DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+class ZaoshuSigner(object):
+    """
+    造数签名器，绑定一个 api secret
+    预先计算好 HMAC 的密钥状态，每次签名只复制该状态；Date 头按秒缓存。
+    签名结果与 ZaoshuRequests.sign 完全一致，可在多线程中共用
+    """
+
+    def __init__(self, api_key, api_secret):
+        """
+        构造函数
+        :param api_key: 从造数获取的api key
+        :param api_secret: 从造数获取的api secret
+        """
+        self._api_key = api_key
+        self._hmac = hmac.new(api_secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self._authorization_prefix = 'ZAOSHU {0}:'.format(api_key)
+        # (秒, 格式化后的Date)，整体替换以保证线程安全
+        self._date = (None, None)
+
+    def date(self):
+        """
+        获得当前时间的 Date 头，同一秒内复用格式化结果
+        :return: str
+        """
+        now = int(time())
+        cached = self._date
+        if cached[0] != now:
+            cached = (now, strftime(DATE_FORMAT, gmtime(now)))
+            self._date = cached
+        return cached[1]
+
+    def sign(self, method, date, query=None, body=None):
+        """
+        生成签名
+        :param method: 请求类型 GET, POST, PATCH
+        :param date: Date 头
+        :param query: 查询条件
+        :param body: 请求内容 str 或 bytes，bytes 按原样参与签名，应与实际发送的内容一致
+        :return: str 返回生成的sign签名结果
+        """
+        if query:
+            query = u"\n".join('%s=%s' % (k, query[k]) for k in sorted(query))
+        base_string = u"\n".join((method, CONTENT_TYPE, date, query or "", ""))
+
+        mac = self._hmac.copy()
+        mac.update(base_string.encode("utf-8"))
+        if body:
+            mac.update(body if isinstance(body, bytes) else body.encode("utf-8"))
+        return base64.b64encode(mac.digest()).decode("utf-8")
+
+    def headers(self, method, query=None, body=None):
+        """
+        获得带签名的请求头
+        :param method: 请求类型 GET, POST, PATCH
+        :param query: 查询条件
+        :param body: 请求内容
+        :return: dict
+        """
+        date = self.date()
+        return {
+            'Content-Type': CONTENT_TYPE,
+            'Date': date,
+            'Authorization': self._authorization_prefix + self.sign(method, date, query, body)
+        }
+
 class ZaoshuRequests(object):
     """
        造数HTTP类，为每个请求附加符合造数规则的签名
+       请求由可替换的传输(zaoshu.transport)发送，默认基于 requests.Session 的连接池复用TCP/TLS连接
        """
 
-    def __init__(self, api_key, api_secret):
+    # 默认需要重试的响应状态码
+    RETRY_STATUS = (500, 502, 503, 504)
+    # 默认允许重试的请求类型，POST(运行实例)不是幂等操作，默认不重试
+    RETRY_METHODS = ('GET', 'PATCH')
+
+    def __init__(self, api_key, api_secret, pool_connections=10, pool_maxsize=10,
+                 pool_block=False, keep_alive=True, timeout=(5, 60), max_retries=3,
+                 backoff_factor=0.5, retry_status=None, retry_methods=None, cache=None,
+                 rate_limiter=None, transport=None, coalesce=False, json_codec=None):
         """
         构造函数
         :param api_key: 从造数获取的api key
         :param api_secret:从造数获取的api secret
+        :param pool_connections: 连接池缓存的主机数
+        :param pool_maxsize: 每个主机保持的最大连接数
+        :param pool_block: 连接数用尽时是否阻塞等待空闲连接
+        :param keep_alive: 是否保持长连接
+        :param timeout: 超时时间(秒)，数字或 (连接超时, 读取超时)
+        :param max_retries: 5xx 或连接被重置时的最大重试次数
+        :param backoff_factor: 退避系数，第n次重试前等待 backoff_factor * 2**(n-1) 秒
+        :param retry_status: 需要重试的状态码
+        :param retry_methods: 允许重试的请求类型
+        :param cache: 元数据响应缓存 ResponseCache，None为不缓存
+        :param rate_limiter: 客户端限流 RateLimiter，None为不限流；
+                             设置后 429 响应也会重试，并遵守 Retry-After
+        :param transport: 传输，名称 requests(默认)、stdlib(只使用标准库)或 Transport 对象，
+                          使用 Transport 对象时忽略连接池设置，且 close 时不关闭该对象
+        :param coalesce: 是否合并同时进行的相同 GET 请求(url、查询参数及额外请求头均相同)，
+                         只发送一次、所有调用方共用同一个响应对象(流式请求除外)
+        :param json_codec: 请求内容编码及响应解码使用的 JSON 编解码器，
+                           名称 json(默认)、orjson、ujson、auto 或编解码器对象，见 zaoshu.codec
         """
         self._api_key = api_key
         self._api_secret = api_secret
+        self._signer = None
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_status = tuple(retry_status or self.RETRY_STATUS)
+        self.retry_methods = tuple(retry_methods or self.RETRY_METHODS)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.endpoints = EndpointResolver()
+        # {事件名: [钩子函数, ...]}，没有钩子时为空，请求中不做任何统计
+        self._hooks = {}
+
+        # 传入的 Transport 对象可能由多个 ZaoshuRequests 共用，由调用方关闭
+        self._owns_transport = transport is None or isinstance(transport, str)
+        if self._owns_transport:
+            transport = create_transport(transport or 'requests',
+                                         pool_connections=pool_connections,
+                                         pool_maxsize=pool_maxsize, pool_block=pool_block,
+                                         keep_alive=keep_alive)
+        self.transport = transport
+        # 请求合并，None为不合并
+        self.flights = SingleFlight() if coalesce else None
+        self.codec = get_codec(json_codec)
+
+    @property
+    def signer(self):
+        """
+        签名器，第一次使用时创建
+        :return: ZaoshuSigner
+        """
+        if self._signer is None:
+            self._signer = ZaoshuSigner(self._api_key, self._api_secret)
+        return self._signer
+
+    @property
+    def session(self):
+        """
+        requests 传输的连接池，第一次使用时创建
+        :return: requests.Session
+        """
+        return self.transport.session
+
+    def close(self):
+        """
+        关闭连接池，传入的 Transport 对象不关闭
+        :return: None
+        """
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_hook(self, event, hook):
+        """
+        注册钩子函数
+        :param event: 事件名 before_sign, after_send, on_retry, on_download_chunk
+        :param hook: 接收事件(SignEvent, SendEvent, RetryEvent, ChunkEvent)的函数
+        :return: hook
+        """
+        if event not in EVENTS:
+            raise ValueError('unknown hook event: %s' % event)
+        hooks = dict(self._hooks)
+        hooks[event] = hooks.get(event, []) + [hook]
+        self._hooks = hooks
+        return hook
+
+    def remove_hook(self, event, hook):
+        """
+        移除钩子函数
+        :param event: 事件名
+        :param hook: 钩子函数
+        :return: None
+        """
+        hooks = dict(self._hooks)
+        handlers = [handler for handler in hooks.get(event, []) if handler != hook]
+        if handlers:
+            hooks[event] = handlers
+        else:
+            hooks.pop(event, None)
+        self._hooks = hooks
 
-    def get(self, url, params=None):
+    def request(self, method, url, params=None, body=None, headers=None, stream=False,
+                endpoint=None):
+        """
+        发送带签名的请求，失败时按退避策略重试，每次重试都会重新签名(新的Date)
+        :param method: 请求类型 GET, POST, PATCH
+        :param url: 请求url
+        :param params: 请求参数
+        :param body: 内容 str、bytes，或由 JSON 编解码器编码的对象
+        :param headers: 额外的请求头，不参与签名
+        :param stream: 是否以流的方式读取响应内容
+        :param endpoint: 接口的URL模板，为None时从注册的URL模板中查找
+        :return: requests.Response，或与其兼容的传输响应，codec 属性为 JSON 编解码器
+        """
+        # 只编码一次，签名与发送(包括重试)使用同样的字节
+        body = encode_body(body, self.codec)
+        hooks = self._hooks
+        transport = self.transport
+        if hooks and endpoint is None:
+            endpoint = self.endpoints.resolve(url)
+        limiter = self.rate_limiter
+        retries = self.max_retries if method in self.retry_methods else 0
+        attempt = 0
+        while True:
+            token = limiter.acquire() if limiter is not None else None
+            if hooks:
+                if BEFORE_SIGN in hooks:
+                    emit(hooks[BEFORE_SIGN], SignEvent(method, endpoint, url, attempt))
+                started = perf_counter()
+            request_headers = self.get_headers(method, query=params, body=body)
+            if headers:
+                request_headers.update(headers)
+            if hooks:
+                sent = perf_counter()
+            delay = None
+            status_code = None
+            failure = None
+            try:
+                response = transport.request(method, url, params=params, data=body,
+                                             headers=request_headers, timeout=self.timeout,
+                                             stream=stream)
+            except transport.errors as error:
+                failure = error
+                if limiter is not None:
+                    limiter.release(token, error=error)
+                if hooks:
+                    self._after_send(hooks, method, endpoint, url, None, error, started, sent,
+                                     body, stream, attempt)
+                if attempt >= retries:
+                    raise
+            except BaseException:
+                if limiter is not None:
+                    limiter.release(token, None)
+                raise
+            else:
+                status_code = response.status_code
+                if limiter is not None:
+                    delay = limiter.release(token, response)
+                    # 429 表示请求未被处理，任何请求类型都可以重试
+                    throttled = response.status_code == 429 and attempt < self.max_retries
+                else:
+                    throttled = False
+                if hooks:
+                    self._after_send(hooks, method, endpoint, url, response, None, started,
+                                     sent, body, stream, attempt)
+                    if stream and ON_DOWNLOAD_CHUNK in hooks:
+                        wrap_iter_content(response, hooks[ON_DOWNLOAD_CHUNK], method, endpoint,
+                                          url)
+                if not throttled and (response.status_code not in self.retry_status or
+                                      attempt >= retries):
+                    response.codec = self.codec
+                    return response
+                response.close()
+
+            attempt += 1
+            backoff = max(self.backoff_factor * (2 ** (attempt - 1)), delay or 0)
+            if hooks and ON_RETRY in hooks:
+                emit(hooks[ON_RETRY], RetryEvent(method, endpoint, url, attempt, backoff,
+                                                 status_code, failure))
+            sleep(backoff)
+
+    @staticmethod
+    def _after_send(hooks, method, endpoint, url, response, error, started, sent, body, stream,
+                    attempt):
+        """
+        调用 after_send 钩子
+        """
+        if AFTER_SEND not in hooks:
+            return
+        received = 0
+        if response is not None and not stream:
+            received = len(response.content or b'')
+        emit(hooks[AFTER_SEND], SendEvent(
+            method, endpoint, url, response.status_code if response is not None else None,
+            error, perf_counter() - sent, sent - started, len(body or b''), received, attempt))
+
+    def get(self, url, params=None, headers=None, stream=False, endpoint=None):
         """
         get请求
+        设置了缓存且 endpoint 有缓存有效期时，有效期内直接返回缓存，过期后使用 ETag/Last-Modified 重新验证
         :param url: 请求url
         :param params: 请求参数
+        :param headers: 额外的请求头
+        :param stream: 是否以流的方式读取响应内容
+        :param endpoint: 接口的URL模板，如 /instance/:instance_id
         :return:requests.request
         """
-        return requests.get(url, params=params, headers=self.get_headers('GET', query=params))
+        if self.flights is not None and not stream:
+            return self.flights.do(flight_key('GET', url, params, headers),
+                                   lambda: self._get(url, params, headers, endpoint))
+        return self._get(url, params, headers, endpoint, stream)
 
-    def post(self, url, params=None, body=None):
+    def _get(self, url, params=None, headers=None, endpoint=None, stream=False):
+        """
+        get请求，先查询缓存
+        """
+        if self.cache is None or stream or endpoint is None or self.cache.ttl(endpoint) is None:
+            return self.request('GET', url, params=params, headers=headers, stream=stream,
+                                endpoint=endpoint)
+
+        key = self.cache.key(url, params)
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.fresh(entry, endpoint):
+            return self._cached(entry)
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(entry.validators())
+        response = self.request('GET', url, params=params, headers=request_headers,
+                                endpoint=endpoint)
+        if response.status_code == 304 and entry is not None:
+            return self._cached(self.cache.refresh(entry))
+        if response.status_code == 200:
+            self.cache.store(key, response)
+        return response
+
+    def _cached(self, entry):
+        """
+        由缓存条目创建响应
+        """
+        response = entry.to_response(self.transport)
+        response.codec = self.codec
+        return response
+
+    def post(self, url, params=None, body=None, endpoint=None):
         """
         post请求
         :param url:请求url
         :param params:请求参数
         :param body:内容
+        :param endpoint: 接口的URL模板
         :return:requests.request
         """
-        return requests.post(url, params=params, data=body,
-                             headers=self.get_headers('POST', query=params, body=body))
+        return self.request('POST', url, params=params, body=body, endpoint=endpoint)
 
-    def patch(self, url, params=None, body=None):
+    def patch(self, url, params=None, body=None, endpoint=None):
         """
         patch请求
         :param url:请求url
         :param params:请求参数
         :param body:内容
+        :param endpoint: 接口的URL模板
         :return:requests.request
         """
-        return requests.patch(url, params=params, data=body,
-                              headers=self.get_headers('PATCH', query=params, body=body))
+        return self.request('PATCH', url, params=params, body=body, endpoint=endpoint)
 
     def get_headers(self, method, query=None, body=None):
         """
@@ -70,21 +397,7 @@ class ZaoshuRequests(object):
         :param body: 内参
         :return: 返回带签名的请求头
         """
-        headers = {
-            'Content-Type': 'application/json; charset=utf-8',
-            'Date': strftime("%a, %d %b %Y %H:%M:%S GMT", gmtime()),
-            'Authorization': ''
-        }
-
-        parame = {
-            'query':query,
-            'body':body
-        }
-
-        authorization = self.sign(self._api_secret, method, headers=headers, parame=parame)
-        headers['Authorization'] = 'ZAOSHU {0}:{1}'.format(self._api_key, authorization)
-
-        return headers
+        return self.signer.headers(method, query=query, body=body)
 
     @classmethod
     def sign(cls, secret, methods, headers=None, parame=None):
@@ -120,13 +433,22 @@ class ZaoshuSdk(object):
     造数SDK 这里整合里造数各功能类
     """
 
-    def __init__(self, api_key, api_secret, base_url='https://openapi.zaoshu.io/v2'):
+    def __init__(self, api_key, api_secret, base_url='https://openapi.zaoshu.io/v2',
+                 store=None, **pool_options):
+        """
+        构造函数
+        :param api_key: 从造数获取的api key
+        :param api_secret: 从造数获取的api secret
+        :param base_url: 造数基本API接口
+        :param store: 运行结果存储 ResultStore，None为不保存
+        :param pool_options: 连接池及重试设置，见 ZaoshuRequests
+        """
         self._api_key = api_key
         self._api_secret = api_secret
 
         self._base_url = base_url
-        self.request = ZaoshuRequests(api_key, api_secret)
-        self.instance = Instance(self._base_url, self.request)
+        self.request = ZaoshuRequests(api_key, api_secret, **pool_options)
+        self.instance = Instance(self._base_url, self.request, store=store)
         self.user = User(self._base_url, self.request)
 
     def get_api_key(self):
@@ -150,30 +472,51 @@ class ZaoshuSdk(object):
         """
         return self._base_url
 
+    def close(self):
+        """
+        关闭连接池
+        :return: None
+        """
+        self.request.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 class Instance(object):
     """
     爬虫实例
     """
-    def __init__(self, base_url, request):
+    def __init__(self, base_url, request, store=None):
         """
         构造函数
         :param base_url: 造数基本API接口
         :param request: 造数HTTP对象
+        :param store: 运行结果存储 ResultStore，设置后每个任务的结果只从网络下载一次
         """
         self._request = request
+        self.store = store
         self.instance_list_url = base_url + "/instances"
         self.instance_url = base_url + "/instance/:instance_id"
         self.instance_schema_url = base_url + "/instance/:instance_id/schema"
         self.task_list_url = base_url + "/instance/:instance_id/tasks"
         self.task_url = base_url + "/instance/:instance_id/task/:task_id"
         self.download_url = base_url + "/instance/:instance_id/task/:task_id/result/file"
+        if hasattr(request, 'endpoints'):
+            request.endpoints.register([
+                self.instance_list_url, self.instance_url, self.instance_schema_url,
+                self.task_list_url, self.task_url, self.download_url])
 
-    def list(self):
+    def list(self, params=None):
         """
         获取实例列表
+        :param params: 请求参数，如分页参数
         :return: requests.Response
         """
-        return self._request.get(self.instance_list_url)
+        return self._request.get(self.instance_list_url, params=params,
+                                 endpoint=self.instance_list_url)
 
     def item(self, instance_id):
         """
@@ -182,7 +525,7 @@ class Instance(object):
         :return: requests.Response
         """
         url = self.instance_url.replace(':instance_id', instance_id)
-        return self._request.get(url)
+        return self._request.get(url, endpoint=self.instance_url)
 
     def schema(self, instance_id):
         """
@@ -191,16 +534,43 @@ class Instance(object):
         :return: requests.Response
         """
         url = self.instance_schema_url.replace(':instance_id', instance_id)
-        return self._request.get(url)
+        return self._request.get(url, endpoint=self.instance_schema_url)
 
-    def task_list(self, instance_id):
+    def task_list(self, instance_id, params=None):
         """
         获取某实例下的任务列表
         :param instance_id:
+        :param params: 请求参数，如分页参数
         :return: requests.Response
         """
         url = self.task_list_url.replace(':instance_id', instance_id)
-        return self._request.get(url)
+        return self._request.get(url, params=params, endpoint=self.task_list_url)
+
+    def iter_instances(self, page_size=PAGE_SIZE, prefetch=True, **filters):
+        """
+        分页逐条获取实例，只在需要时请求下一页
+        :param page_size: 每页的实例数
+        :param prefetch: 是否在处理当前页时于后台请求下一页
+        :param filters: 过滤条件 status, since, until, where, limit, newest_first，见 pages.iter_items
+        :return: 生成器 实例 dict
+        """
+        from zaoshu.pages import iter_items
+        return iter_items(self.list, page_size=page_size, prefetch=prefetch, **filters)
+
+    def iter_tasks(self, instance_id, page_size=PAGE_SIZE, prefetch=True, **filters):
+        """
+        分页逐条获取实例的任务，只在需要时请求下一页
+        如最早的10个成功的任务(接口按创建时间正序返回):
+        iter_tasks(instance_id, status='success', limit=10)
+        :param instance_id: 实例ID
+        :param page_size: 每页的任务数
+        :param prefetch: 是否在处理当前页时于后台请求下一页
+        :param filters: 过滤条件 status, since, until, where, limit, newest_first，见 pages.iter_items
+        :return: 生成器 任务 dict
+        """
+        from zaoshu.pages import iter_items
+        return iter_items(lambda params: self.task_list(instance_id, params), page_size=page_size,
+                          prefetch=prefetch, **filters)
 
     def task(self, instance_id, task_id):
         """
@@ -210,78 +580,438 @@ class Instance(object):
         :return: requests.Response
         """
         url = self.task_url.replace(':instance_id', instance_id).replace(':task_id', task_id)
-        return self._request.get(url)
+        return self._request.get(url, endpoint=self.task_url)
+
+    def get_instances(self, params=None):
+        """
+        获取实例列表的模型，字段在第一次访问时解码
+        :param params: 请求参数，如分页参数
+        :return: ModelList [InstanceInfo, ...]，原始响应为其 response 属性
+        """
+        from zaoshu.models import ModelList, InstanceInfo
+        return ModelList.from_response(InstanceInfo, self.list(params), 'list')
+
+    def get_instance(self, instance_id):
+        """
+        获取实例详情的模型
+        :param instance_id: 运行实例的id编号
+        :return: InstanceInfo
+        """
+        from zaoshu.models import InstanceInfo
+        return InstanceInfo.from_response(self.item(instance_id), 'item')
 
-    def download_run_data(self, instance_id, task_id, file_type='csv', save_file=False, save_path = None):
+    def get_schema(self, instance_id):
+        """
+        获取实例数据格式的模型
+        :param instance_id: 运行实例的id编号
+        :return: Schema
+        """
+        from zaoshu.models import Schema
+        return Schema.from_response(self.schema(instance_id), 'schema')
+
+    def get_tasks(self, instance_id, params=None):
+        """
+        获取任务列表的模型，字段在第一次访问时解码
+        :param instance_id: 实例ID
+        :param params: 请求参数，如分页参数
+        :return: ModelList [Task, ...]，原始响应为其 response 属性
+        """
+        from zaoshu.models import ModelList, Task
+        return ModelList.from_response(Task, self.task_list(instance_id, params), 'task_list')
+
+    def get_task(self, instance_id, task_id):
+        """
+        获取任务详情的模型
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :return: Task
+        """
+        from zaoshu.models import Task
+        return Task.from_response(self.task(instance_id, task_id), 'task')
+
+    def _invalidate(self, url):
+        """
+        使该url及其下级url的元数据缓存失效
+        :param url: 请求url
+        :return: None
+        """
+        cache = getattr(self._request, 'cache', None)
+        if cache is not None:
+            cache.invalidate(url)
+
+    def _workers(self, workers):
+        """
+        批量请求的线程数，默认与连接池大小一致
+        """
+        return workers or getattr(self._request, 'pool_maxsize', 10)
+
+    def items_many(self, instance_ids, workers=None, ordered=True):
+        """
+        并发获取多个实例详情
+        :param instance_ids: 实例id的可迭代对象
+        :param workers: 线程数，默认与连接池大小一致
+        :param ordered: True 按输入顺序产出结果，False 按完成的顺序产出
+        :return: 生成器 BatchResult(instance_id, requests.Response, 异常)
+        """
+        from zaoshu.batch import fan_out
+        return fan_out(self.item, instance_ids, self._workers(workers), ordered)
+
+    def schemas_many(self, instance_ids, workers=None, ordered=True):
+        """
+        并发获取多个实例的数据格式
+        :param instance_ids: 实例id的可迭代对象
+        :param workers: 线程数，默认与连接池大小一致
+        :param ordered: True 按输入顺序产出结果，False 按完成的顺序产出
+        :return: 生成器 BatchResult(instance_id, requests.Response, 异常)
+        """
+        from zaoshu.batch import fan_out
+        return fan_out(self.schema, instance_ids, self._workers(workers), ordered)
+
+    def task_many(self, instance_id, task_ids, workers=None, ordered=True):
+        """
+        并发获取某实例下多个任务详情
+        :param instance_id: 实例id
+        :param task_ids: 任务id的可迭代对象
+        :param workers: 线程数，默认与连接池大小一致
+        :param ordered: True 按输入顺序产出结果，False 按完成的顺序产出
+        :return: 生成器 BatchResult(task_id, requests.Response, 异常)
+        """
+        from zaoshu.batch import fan_out
+        return fan_out(lambda task_id: self.task(instance_id, task_id), task_ids,
+                       self._workers(workers), ordered)
+
+    def download_run_data(self, instance_id, task_id, file_type='csv', save_file=False, save_path = None,
+                          fileobj=None, stream=False, chunk_size=DOWNLOAD_CHUNK_SIZE, workers=1,
+                          part_size=DOWNLOAD_PART_SIZE, resume=False):
         """
         下载运行结果
+        保存文件、写入 fileobj 以及 stream 模式均按块流式读取，内存占用与文件大小无关
+        保存文件且 workers 大于1时分段并行下载，服务器不支持 Range 时退回单连接下载
+        保存文件且 resume 为True时单连接断点续传，中断后再次调用从中断处继续下载
+        设置了结果存储时(stream 模式除外)从存储中读取，不存在时下载一次并保存，保存文件时创建硬链接；
+        任务未结束时结果还会变化，不使用结果存储
         :param instance_id: 实例ID
         :param task_id: 任务ID
         :param file_type: 文件类型
-        :param save_file:
-        :return:保存文件的路径/StringIO对象
+        :param save_file: 是否保存文件
+        :param save_path: 保存目录
+        :param fileobj: 可写的文件对象，内容按块写入其中
+        :param stream: 为True时直接返回未读取的原始字节流，由调用方读取并关闭
+        :param chunk_size: 每次读取的字节数
+        :param workers: 保存文件时并行下载的连接数
+        :param part_size: 分段下载时每段的字节数
+        :param resume: 保存文件时是否断点续传
+        :return:保存文件的路径/写入的字节数/原始字节流/文件内容的元组
         """
+        if save_file and not save_path:
+            raise Exception("save_path Error")
+
         params = {"contentType":file_type}
         url = self.download_url.replace(':instance_id', instance_id).replace(':task_id', task_id)
 
-        # 发生请求，获取下载文件
-        response = self._request.get(url, params=params)
+        result = None
+        if self.store is not None and not stream:
+            result = self._fetch_stored(url, params, instance_id, task_id, file_type,
+                                        chunk_size)
+        if result is not None:
+            if save_file:
+                save_file_path = data_file_path(save_path, result.file_name, result.suffix)
+                return os.path.abspath(self.store.link(result, save_file_path))
+            elif fileobj is not None:
+                size = 0
+                for chunk in self.store.iter_chunks(result, chunk_size):
+                    fileobj.write(chunk)
+                    size += len(chunk)
+                return size
+            else:
+                with open(result.path, 'rb') as file:
+                    return decode_run_data(file.read(), result.suffix)
 
-        default_file_name = response.headers['content-disposition']
-        default_file_name = '/' + str(default_file_name.replace("attachment; filename*=UTF-8''",
-                                                                ''))
-        suffix = '.' + default_file_name.split('.')[-1]
-        default_file_name = default_file_name.replace(suffix, '')
+        if save_file and resume:
+            from zaoshu.download import download_resumable
+            name = '%s_%s_%s' % (instance_id, task_id, file_type)
+            return download_resumable(self._request, url, params, save_path, name,
+                                      chunk_size=chunk_size)
+        if save_file and workers > 1:
+            from zaoshu.download import download_ranged
+            return download_ranged(self._request, url, params, save_path, workers=workers,
+                                   part_size=part_size, chunk_size=chunk_size)
 
-        #判断是否保存文件
-        if save_file and save_path:
+        # 发生请求，获取下载文件
+        response = self._request.get(url, params=params, stream=True)
+        if stream:
+            response.raw.decode_content = True
+            return response.raw
 
-            default_dir_path = '.'+save_path+'/datafile'
-            # 获取文件名 和 后缀
+        try:
+            default_file_name, suffix = parse_file_name(response.headers['content-disposition'])
 
-            # 这里需要对权限进行配置，暂后做
-            # 判断路径状态
-            if not os.path.isdir(default_dir_path):
-                os.makedirs(default_dir_path)
+            #判断是否保存文件
+            if save_file:
 
-            # 保存文件
-            save_file_path = default_dir_path+default_file_name+suffix
+                # 这里需要对权限进行配置，暂后做
+                # 保存文件
+                save_file_path = data_file_path(save_path, default_file_name, suffix)
 
-            with open(save_file_path, 'wb') as file:
-                file.write(response.content)
-            return os.path.abspath(save_file_path)
-        elif save_file:
-            raise Exception("save_path Error")
-        else:
-            download_file = BytesIO(response.content)
-            if suffix in '.zip':
-                surface = ''
-                depth = ''
-                decom_bytes = zipfile.ZipFile(file=download_file)
-                # 获取文件名
-                if len(decom_bytes.namelist()) == 2:
-                    surface = decom_bytes.read(decom_bytes.namelist()[0])
-                    depth = decom_bytes.read(decom_bytes.namelist()[-1])
-
-                return surface.decode(), depth.decode()
+                with open(save_file_path, 'wb') as file:
+                    write_chunks(response, file, chunk_size)
+                return os.path.abspath(save_file_path)
+            elif fileobj is not None:
+                return write_chunks(response, fileobj, chunk_size)
             else:
-                return response.content.decode(),
+                return decode_run_data(response.content, suffix)
+        finally:
+            response.close()
+
+    def _fetch_stored(self, url, params, instance_id, task_id, file_type, chunk_size):
+        """
+        从结果存储中获取运行结果，不存在时确认任务已结束后下载并保存
+        :return: StoredResult，不在存储中且任务未结束时返回 None
+        """
+        result = self.store.get(instance_id, task_id, file_type)
+        if result is not None:
+            return result
+        if not is_task_finished(self.task(instance_id, task_id)):
+            return None
+
+        def download(fileobj):
+            response = self._request.get(url, params=params, stream=True)
+            try:
+                if response.status_code != 200:
+                    raise Exception("download Error: %d" % response.status_code)
+                file_name, suffix = parse_file_name(response.headers['content-disposition'])
+                write_chunks(response, fileobj, chunk_size)
+                return file_name, suffix
+            finally:
+                response.close()
 
+        return self.store.fetch(instance_id, task_id, file_type, download)
+
+    def iter_result_files(self, instance_id, task_id, file_type='csv',
+                          chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        流式下载并解析运行结果，zip文件按成员(surface, depth)依次产出
+        每个成员的记录需在读取下一个成员前使用
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型 csv, json
+        :param chunk_size: 每次读取的字节数
+        :return: 生成器 (文件名, 记录生成器)
+        """
+        from zaoshu.results import iter_rows
+        for name, member_type, chunks in self._iter_members(instance_id, task_id, file_type,
+                                                            chunk_size):
+            yield name, iter_rows(chunks, member_type)
+
+    def _iter_members(self, instance_id, task_id, file_type, chunk_size):
+        """
+        流式下载运行结果，zip文件按成员依次产出
+        :return: 生成器 (文件名, 文件类型, bytes 块迭代器)
+        """
+        from zaoshu.results import iter_members
+        params = {"contentType":file_type}
+        url = self.download_url.replace(':instance_id', instance_id).replace(':task_id', task_id)
+
+        result = None
+        if self.store is not None:
+            result = self._fetch_stored(url, params, instance_id, task_id, file_type,
+                                        chunk_size)
+        if result is not None:
+            chunks = self.store.iter_chunks(result, chunk_size)
+            for item in iter_members(chunks, result.file_name, result.suffix, file_type):
+                yield item
+            return
+
+        response = self._request.get(url, params=params, stream=True)
+        try:
+            file_name, suffix = parse_file_name(response.headers['content-disposition'])
+            chunks = response.iter_content(chunk_size=chunk_size)
+            for item in iter_members(chunks, file_name, suffix, file_type):
+                yield item
+        finally:
+            response.close()
+
+    def decoder(self, instance_id, part='surface', types=None, batch_size=None,
+                strict=False):
+        """
+        由实例的数据格式创建解码器，可复用于该实例的多个任务
+        :param instance_id: 实例ID
+        :param part: surface(列表页) 或 depth(详情页)
+        :param types: 覆盖数据格式的字段类型 {字段名: 类型}，没有类型的字段根据数据推断
+        :param batch_size: 每批的记录数，None为 decoder.BATCH_SIZE
+        :param strict: 为True时无法转换的值抛出 ValueError，否则解码为 None
+        :return: RowDecoder
+        """
+        from zaoshu.decoder import RowDecoder, BATCH_SIZE
+        return RowDecoder.from_schema(self.get_schema(instance_id), part=part, types=types,
+                                      batch_size=batch_size or BATCH_SIZE, strict=strict)
+
+    def _decode_source(self, instance_id, task_id, file_type, decoder, chunk_size):
+        """
+        下载运行结果并选择解码器对应的文件，zip文件的成员依次为 surface、depth
+        :return: 生成器 (文件类型, bytes 块迭代器)，只产出一项
+        """
+        index = 1 if decoder.part == 'depth' else 0
+        for position, (_, member_type, chunks) in enumerate(
+                self._iter_members(instance_id, task_id, file_type, chunk_size)):
+            if position == index:
+                yield member_type, chunks
+                return
+        raise Exception("result Error: no %s file" % decoder.part)
+
+    def iter_typed_rows(self, instance_id, task_id, file_type='csv', decoder=None,
+                        chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        流式下载运行结果并按批解码为带类型的行
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型 csv, json, zip
+        :param decoder: RowDecoder，默认由实例的数据格式创建
+        :param chunk_size: 每次读取的字节数
+        :return: 生成器 [tuple, ...]，每行的值与 decoder.names 顺序一致
+        """
+        if decoder is None:
+            decoder = self.decoder(instance_id)
+        for member_type, chunks in self._decode_source(instance_id, task_id, file_type, decoder,
+                                                       chunk_size):
+            for batch in decoder.iter_batches(chunks, member_type):
+                yield batch
+
+    def load_columns(self, instance_id, task_id, file_type='csv', decoder=None, numpy=None,
+                     chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        下载运行结果并按列解码，用于分析大量记录
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型 csv, json, zip
+        :param decoder: RowDecoder，默认由实例的数据格式创建
+        :param numpy: None 在已安装 NumPy 时输出 NumPy 数组，False 输出 array.array，True 必须使用 NumPy
+        :param chunk_size: 每次读取的字节数
+        :return: {字段名: 列}，见 RowDecoder.columns
+        """
+        if decoder is None:
+            decoder = self.decoder(instance_id)
+        for member_type, chunks in self._decode_source(instance_id, task_id, file_type, decoder,
+                                                       chunk_size):
+            return decoder.columns(chunks, member_type, numpy=numpy)
+
+    def parse_run_data(self, instance_id, task_id, save_path, file_type='csv', decoder=None,
+                       workers=None, sink=None, chunk_bytes=None):
+        """
+        下载运行结果到文件后多进程解析，用于单进程解码受限于CPU的大结果
+        zip文件解压出解码器对应的成员(surface 或 depth)后解析
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param save_path: 保存目录，见 download_run_data
+        :param file_type: 文件类型 csv, json, zip
+        :param decoder: RowDecoder，默认由实例的数据格式创建
+        :param workers: 解析的进程数，默认为CPU核数
+        :param sink: 为 None 时按原顺序产出各批的行，否则在各进程中写入 sink，见 ParallelParser.write
+        :param chunk_bytes: 每个进程每次解析的字节数，None为 parallel.CHUNK_BYTES
+        :return: 生成器 [tuple, ...] 或 sink.write 返回值的列表
+        """
+        from zaoshu.parallel import ParallelParser, CHUNK_BYTES
+        if decoder is None:
+            decoder = self.decoder(instance_id)
+        path = self.download_run_data(instance_id, task_id, file_type=file_type, save_file=True,
+                                      save_path=save_path)
+        member_type = file_type
+        if path.endswith('.zip'):
+            import zipfile
+            with zipfile.ZipFile(path) as zip_file:
+                names = zip_file.namelist()
+                index = 1 if decoder.part == 'depth' else 0
+                if index >= len(names):
+                    raise Exception("result Error: no %s file" % decoder.part)
+                path = zip_file.extract(names[index], os.path.dirname(path))
+            member_type = 'json' if path.endswith('.json') else 'csv'
+        parser = ParallelParser(decoder, workers=workers, chunk_bytes=chunk_bytes or CHUNK_BYTES)
+        if sink is not None:
+            return parser.write(path, sink, member_type)
+        return parser.iter_batches(path, member_type)
+
+    def iter_results(self, instance_id, task_id, file_type='csv', chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        流式下载并逐条产出运行结果记录，第一条记录在下载完成前即可使用
+        zip文件依次产出 surface 和 depth 文件的记录
+        :param instance_id: 实例ID
+        :param task_id: 任务ID
+        :param file_type: 文件类型 csv(产出dict), json(产出json记录)
+        :param chunk_size: 每次读取的字节数
+        :return: 生成器 记录
+        """
+        for _, rows in self.iter_result_files(instance_id, task_id, file_type=file_type,
+                                              chunk_size=chunk_size):
+            for row in rows:
+                yield row
 
     def run(self, instance_id, body=None):
         """
         运行实例
         :param instance_id: 运行实例的id编号，可以从实例列表中获取
+        :param body: 运行参数，dict 等对象由 JSON 编解码器编码，str/bytes 原样发送
         :return: requests.Response
         """
         if body is None:
-            body = '{}'
-
-        if not isinstance(body, str):
-            body = json.dumps(body)
+            body = b'{}'
 
         url = self.instance_url.replace(':instance_id', instance_id)
-        return self._request.post(url, body=body)
+        try:
+            return self._request.post(url, body=body, endpoint=self.instance_url)
+        finally:
+            self._invalidate(url)
+
+    def wait_for_task(self, instance_id, task_id, timeout=None, initial=POLL_INITIAL,
+                      maximum=POLL_MAXIMUM, finished=is_task_finished):
+        """
+        等待任务运行结束，以带随机抖动的指数退避查询任务详情
+        :param instance_id: 实例id
+        :param task_id: 任务id
+        :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+        :param initial: 第一次查询前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        :return: 任务结束时的任务详情 requests.Response
+        """
+        from zaoshu.wait import wait_tasks
+        return wait_tasks(self, [(instance_id, task_id)], timeout=timeout, initial=initial,
+                          maximum=maximum, finished=finished, workers=1)[(instance_id, task_id)]
+
+    def wait_for_tasks(self, keys, timeout=None, initial=POLL_INITIAL, maximum=POLL_MAXIMUM,
+                       finished=is_task_finished, workers=None):
+        """
+        在一个轮询循环中等待多个任务运行结束
+        :param keys: (instance_id, task_id) 的可迭代对象
+        :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+        :param initial: 第一次查询前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        :param workers: 同时查询的任务数，默认与连接池大小一致
+        :return: {(instance_id, task_id): 任务结束时的任务详情 requests.Response}
+        """
+        from zaoshu.wait import wait_tasks
+        return wait_tasks(self, keys, timeout=timeout, initial=initial, maximum=maximum,
+                          finished=finished, workers=self._workers(workers))
+
+    def run_and_wait(self, instance_id, body=None, timeout=None, initial=POLL_INITIAL,
+                     maximum=POLL_MAXIMUM, finished=is_task_finished):
+        """
+        运行实例并等待新建的任务运行结束
+        :param instance_id: 运行实例的id编号，可以从实例列表中获取
+        :param body: 运行参数
+        :param timeout: 最长等待时间(秒)，None 为一直等待，超时抛出 TimeoutError
+        :param initial: 第一次查询前的等待时间(秒)
+        :param maximum: 最长查询间隔(秒)
+        :param finished: 根据任务详情响应判断任务是否结束的函数
+        :return: (任务id, 任务结束时的任务详情 requests.Response)
+        """
+        response = self.run(instance_id, body=body)
+        if response.status_code != 200:
+            raise Exception("run Error: %d %s" % (response.status_code, response.text))
+        from zaoshu.wait import run_task_id
+        task_id = run_task_id(response)
+        return task_id, self.wait_for_task(instance_id, task_id, timeout=timeout,
+                                           initial=initial, maximum=maximum, finished=finished)
 
     def edit(self, instance_id, title=None, result_notify_uri=None):
         """
@@ -295,9 +1025,12 @@ class Instance(object):
             'title': title,
             'result_notify_uri': result_notify_uri
         }
-        body = json.dumps(body)
         url = self.instance_url.replace(':instance_id', instance_id)
-        return self._request.patch(url, body=body)
+        try:
+            return self._request.patch(url, body=body, endpoint=self.instance_url)
+        finally:
+            self._invalidate(url)
+            self._invalidate(self.instance_list_url)
 
 class User(object):
     """
@@ -314,17 +1047,35 @@ class User(object):
         self._request = request
         self.account_url = self._base_url+'/user/account'
         self.wallet_url = self._base_url+'/user/wallet'
+        if hasattr(request, 'endpoints'):
+            request.endpoints.register([self.account_url, self.wallet_url])
 
     def account(self):
         """
         获得用户帐号信息
         :return:
         """
-        return self._request.get(self.account_url)
+        return self._request.get(self.account_url, endpoint=self.account_url)
 
     def wallet(self):
         """
         获得用户钱包信息
         :return:
         """
-        return self._request.get(self.wallet_url)
+        return self._request.get(self.wallet_url, endpoint=self.wallet_url)
+
+    def get_account(self):
+        """
+        获得用户帐号信息的模型
+        :return: Account
+        """
+        from zaoshu.models import Account
+        return Account.from_response(self.account(), 'account')
+
+    def get_wallet(self):
+        """
+        获得用户钱包信息的模型
+        :return: Wallet
+        """
+        from zaoshu.models import Wallet
+        return Wallet.from_response(self.wallet(), 'wallet')
@@ -5,12 +5,25 @@
 造数模块的单元测试
 """
 import unittest
+import threading
+from unittest import mock
+import re
+import json
+import socket
+import shutil
+import tempfile
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 
 import requests
 from zaoshu import Instance
 from zaoshu import User
 from zaoshu import ZaoshuRequests
 from zaoshu import ZaoshuSdk
+from zaoshu import ZaoshuSigner
+from zaoshu.download import download_resumable
+from zaoshu.batch import fan_out
 from io import BytesIO
 import os
 
@@ -73,6 +86,167 @@ class TestZaoshuRequests(unittest.TestCase):
         self.assertTrue(isinstance(get_request, requests.models.Response))
 
 
+class TestZaoshuSigner(unittest.TestCase):
+    """
+    造数签名器ZaoshuSigner单元测试
+    """
+
+    def test_sign_compatible(self):
+        """测试与ZaoshuRequests.sign结果一致"""
+        signer = ZaoshuSigner('key', '1234567890-=')
+        date = 'Wed, 18 Mar 2016 08:04:06 GMT'
+        headers = {'Content-Type': 'application/json; charset=utf-8', 'Date': date}
+        cases = [
+            ('POST', {'a': '1', 'b': '2'}, '{"v":"tt"}'),
+            ('GET', None, None),
+            ('GET', {'contentType': 'csv'}, None),
+            ('PATCH', {}, '{"title": "标题"}'),
+        ]
+        for method, query, body in cases:
+            expected = ZaoshuRequests.sign('1234567890-=', method, headers=headers,
+                                           parame={'query': query, 'body': body})
+            self.assertEqual(signer.sign(method, date, query, body), expected)
+        self.assertEqual(signer.sign('POST', date, {'a': '1', 'b': '2'}, '{"v":"tt"}'),
+                         'QzXPkAH7JU5CtFRilL0GgRgdxYyqXKnwdln94ZARis0=')
+
+    def test_headers(self):
+        """测试请求头与Date缓存"""
+        signer = ZaoshuSigner('key', 'secret')
+        headers = signer.headers('GET', query={'a': '1'})
+        self.assertEqual(headers['Content-Type'], 'application/json; charset=utf-8')
+        # 固定时钟，避免两次调用跨过整秒
+        with mock.patch('zaoshu.zaoshu.time', return_value=1458288246.2):
+            date = signer.date()
+            self.assertEqual(date, 'Fri, 18 Mar 2016 08:04:06 GMT')
+            self.assertIs(signer.date(), date)
+        with mock.patch('zaoshu.zaoshu.time', return_value=1458288247.0):
+            self.assertEqual(signer.date(), 'Fri, 18 Mar 2016 08:04:07 GMT')
+        expected = ZaoshuRequests.sign('secret', 'GET', headers=headers,
+                                       parame={'query': {'a': '1'}, 'body': None})
+        self.assertEqual(headers['Authorization'], 'ZAOSHU key:' + expected)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LocalServer(object):
+    """
+    本地HTTP服务，按顺序返回预设的响应，用于离线测试
+    """
+
+    def __init__(self, responses):
+        """
+        :param responses: [(状态码, 响应头dict, 响应内容bytes), ...]，最后一个会被重复使用
+        """
+        self.responses = list(responses)
+        self.requests = []
+        self.client_ports = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                server.requests.append((self.command, self.path, dict(self.headers), body))
+                server.client_ports.add(self.client_address[1])
+                if len(server.responses) > 1:
+                    status, headers, content = server.responses.pop(0)
+                else:
+                    status, headers, content = server.responses[0]
+                if callable(content):
+                    result = content(self)
+                    if result is None:
+                        # 响应函数已自行处理响应
+                        return
+                    status, headers, content = result
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PATCH = _reply
+
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestZaoshuRequestsPool(unittest.TestCase):
+    """
+    造数Http库连接池与重试单元测试，使用本地服务离线运行
+    """
+
+    def test_keep_alive(self):
+        """测试连接复用"""
+        with LocalServer([(200, None, b'{}')]) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                for _ in range(5):
+                    self.assertEqual(request.get(server.url + '/instances').status_code, 200)
+        self.assertEqual(len(server.requests), 5)
+        self.assertEqual(len(server.client_ports), 1)
+
+    def test_retry_resign(self):
+        """测试5xx重试，每次重试重新签名"""
+        responses = [(503, None, b''), (502, None, b''), (200, None, b'{}')]
+        with LocalServer(responses) as server:
+            with ZaoshuRequests('key', 'secret', backoff_factor=0) as request:
+                signed = []
+                get_headers = request.get_headers
+
+                def spy(*args, **kwargs):
+                    headers = get_headers(*args, **kwargs)
+                    signed.append(headers)
+                    return headers
+                request.get_headers = spy
+                response = request.get(server.url + '/instances', params={'a': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(signed), 3)
+        for (_, _, headers, _), sent in zip(server.requests, signed):
+            self.assertEqual(headers['Authorization'], sent['Authorization'])
+
+    def test_retry_exhausted(self):
+        """测试重试次数用尽后返回最后的响应"""
+        with LocalServer([(500, None, b'')]) as server:
+            with ZaoshuRequests('key', 'secret', max_retries=2, backoff_factor=0) as request:
+                response = request.get(server.url + '/instances')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_post_not_retried(self):
+        """测试POST默认不重试"""
+        with LocalServer([(503, None, b''), (200, None, b'{}')]) as server:
+            with ZaoshuRequests('key', 'secret', backoff_factor=0) as request:
+                response = request.post(server.url + '/instance/1', body='{}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_connection_error_retry(self):
+        """测试连接失败时重试后抛出异常"""
+        request = ZaoshuRequests('key', 'secret', max_retries=1, backoff_factor=0,
+                                 timeout=1)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            request.get('http://127.0.0.1:1/instances')
+        request.close()
+
+
 class TestZaoshuSdk(unittest.TestCase):
     """
     造数SDK ZaoshuSdk 单元测试
@@ -92,6 +266,14 @@ class TestZaoshuSdk(unittest.TestCase):
         self.assertTrue(isinstance(sdk.instance, Instance))
         self.assertTrue(isinstance(sdk.user, User))
 
+    def test_pool_options(self):
+        """测试连接池设置与关闭"""
+        with ZaoshuSdk('key', 'secret', pool_maxsize=32, max_retries=5) as sdk:
+            self.assertEqual(sdk.request.pool_maxsize, 32)
+            self.assertEqual(sdk.request.max_retries, 5)
+            self.assertIsNotNone(sdk.request.session)
+        self.assertIsNone(sdk.request.transport._session)
+
 class TestInstance(unittest.TestCase):
     """
     造数 实例 Instance 单元测试
@@ -160,6 +342,344 @@ class TestInstance(unittest.TestCase):
         self.assertTrue(isinstance(instance_download_count, BytesIO))
 
 
+def range_response(content, headers):
+    """
+    生成支持 Range 请求的响应函数
+    :param content: 文件内容
+    :param headers: 响应头
+    :return: LocalServer 使用的响应函数
+    """
+    def respond(handler):
+        match = re.match(r'bytes=(\d+)-(\d*)', handler.headers.get('Range', ''))
+        if not match:
+            return 200, headers, content
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(content) - 1
+        partial = dict(headers)
+        partial['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(content))
+        return 206, partial, content[start:end + 1]
+    return respond
+
+
+class TestInstanceMany(unittest.TestCase):
+    """
+    造数 实例 Instance 批量请求单元测试，使用本地服务离线运行
+    """
+
+    def test_task_many(self):
+        """测试并发获取任务详情，按输入顺序返回"""
+        def respond(handler):
+            task_id = handler.path.rsplit('/', 1)[-1]
+            return 200, None, json.dumps({'data': {'id': task_id}}).encode()
+
+        task_ids = ['t%d' % i for i in range(50)]
+        with LocalServer([(200, None, respond)]) as server:
+            with ZaoshuRequests('key', 'secret', pool_maxsize=8) as request:
+                instance = Instance(server.url, request)
+                results = list(instance.task_many('i1', task_ids))
+                unordered = list(instance.task_many('i1', task_ids, ordered=False, workers=4))
+        self.assertEqual([result.key for result in results], task_ids)
+        self.assertEqual([result.response.json()['data']['id'] for result in results], task_ids)
+        self.assertEqual(sorted(result.key for result in unordered), sorted(task_ids))
+        self.assertLessEqual(len(server.client_ports), 8)
+
+    def test_errors_per_item(self):
+        """测试单个请求出错不中断批次"""
+        def item(key):
+            if key == 2:
+                raise ValueError(key)
+            return key * 10
+
+        results = list(fan_out(item, range(5), workers=2))
+        self.assertEqual([result.response for result in results], [0, 10, None, 30, 40])
+        self.assertIsInstance(results[2].error, ValueError)
+
+
+def task_server(polls, missing=()):
+    """
+    模拟任务运行的本地服务：运行实例返回新任务id，任务在被查询 polls 次后结束，missing 中的任务返回 404
+    """
+    counts = {}
+
+    def respond(handler):
+        if handler.command == 'POST':
+            return 200, None, json.dumps({'data': {'id': 't9'}}).encode()
+        task_id = handler.path.rsplit('/', 1)[-1]
+        if task_id in missing:
+            return 404, None, b'{"message": "task not found"}'
+        counts[task_id] = counts.get(task_id, 0) + 1
+        status = 'success' if counts[task_id] > polls.get(task_id, 2) else 'running'
+        return 200, None, json.dumps({'data': {'id': task_id, 'status': status}}).encode()
+
+    return LocalServer([(200, None, respond)])
+
+
+class TestInstanceWait(unittest.TestCase):
+    """
+    造数 实例 Instance 等待任务结束单元测试，使用本地服务离线运行
+    """
+
+    def test_run_and_wait(self):
+        """测试运行实例并等待任务结束"""
+        with task_server({}) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                instance = Instance(server.url, request)
+                task_id, response = instance.run_and_wait('i1', initial=0.01)
+        self.assertEqual(task_id, 't9')
+        self.assertEqual(response.json()['data']['status'], 'success')
+        self.assertEqual([request[0] for request in server.requests], ['POST'] + ['GET'] * 3)
+
+    def test_wait_for_tasks(self):
+        """测试一个轮询循环等待多个任务"""
+        polls = {'t1': 0, 't2': 3, 't3': 1}
+        with task_server(polls) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                instance = Instance(server.url, request)
+                responses = instance.wait_for_tasks([('i1', task_id) for task_id in polls],
+                                                    initial=0.01, maximum=0.05)
+        self.assertEqual(sorted(responses), [('i1', 't1'), ('i1', 't2'), ('i1', 't3')])
+        self.assertEqual(len(server.requests), sum(polls.values()) + len(polls))
+
+    def test_one_executor(self):
+        """测试多轮查询共用一个线程池"""
+        polls = {'t1': 0, 't2': 3, 't3': 1}
+        pools = set()
+        with task_server(polls) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                instance = Instance(server.url, request)
+                task = instance.task
+
+                def record(instance_id, task_id):
+                    pools.add(threading.current_thread().name.rsplit('_', 1)[0])
+                    return task(instance_id, task_id)
+
+                with mock.patch.object(instance, 'task', record):
+                    instance.wait_for_tasks([('i1', task_id) for task_id in polls],
+                                            initial=0.01, maximum=0.05)
+        self.assertEqual(len(pools), 1)
+
+    def test_not_found(self):
+        """测试任务不存在时抛出异常，不再轮询"""
+        with task_server({'t1': 1000}, missing=('t2',)) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                instance = Instance(server.url, request)
+                with self.assertRaises(Exception) as context:
+                    instance.wait_for_tasks([('i1', 't1'), ('i1', 't2')], initial=0.01,
+                                            maximum=0.05)
+        self.assertIn('i1/t2 404', str(context.exception))
+        self.assertLessEqual(len(server.requests), 4)
+
+    def test_timeout(self):
+        """测试等待超时"""
+        with task_server({'t1': 1000}) as server:
+            with ZaoshuRequests('key', 'secret') as request:
+                instance = Instance(server.url, request)
+                with self.assertRaises(TimeoutError):
+                    instance.wait_for_task('i1', 't1', timeout=0.2, initial=0.01, maximum=0.05)
+
+
+class TestInstanceDownload(unittest.TestCase):
+    """
+    造数 实例 Instance 下载运行结果单元测试，使用本地服务离线运行
+    """
+
+    content = b'a,b\n' + b'1,2\n' * 50000
+    headers = {'content-disposition': "attachment; filename*=UTF-8''result.csv"}
+
+    def setUp(self):
+        """初始化工作"""
+        self.server = LocalServer([(200, self.headers, self.content)]).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.request = ZaoshuRequests('key', 'secret')
+        self.addCleanup(self.request.close)
+        self.instance = Instance(self.server.url, self.request)
+
+    def test_fileobj(self):
+        """测试按块写入文件对象"""
+        fileobj = BytesIO()
+        size = self.instance.download_run_data('i1', 't1', fileobj=fileobj, chunk_size=4096)
+        self.assertEqual(size, len(self.content))
+        self.assertEqual(fileobj.getvalue(), self.content)
+
+    def test_save_file(self):
+        """测试按块保存文件"""
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        cwd = os.getcwd()
+        os.chdir(save_dir)
+        try:
+            path = self.instance.download_run_data('i1', 't1', save_file=True, save_path='/data')
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(path, os.path.join(os.path.realpath(save_dir), 'data/datafile/result.csv'))
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_stream(self):
+        """测试返回原始字节流"""
+        raw = self.instance.download_run_data('i1', 't1', stream=True)
+        try:
+            self.assertEqual(raw.read(4), b'a,b\n')
+            self.assertEqual(raw.read(), self.content[4:])
+        finally:
+            raw.close()
+
+    def test_decode(self):
+        """测试解码zip文件"""
+        zip_content = BytesIO()
+        with zipfile.ZipFile(zip_content, 'w') as zip_file:
+            zip_file.writestr('surface.csv', 'a\n1\n')
+            zip_file.writestr('depth.csv', 'b\n2\n')
+        headers = {'content-disposition': "attachment; filename*=UTF-8''result.zip"}
+        self.server.responses = [(200, headers, zip_content.getvalue())]
+        self.assertEqual(self.instance.download_run_data('i1', 't1'), ('a\n1\n', 'b\n2\n'))
+
+    def save(self, **kwargs):
+        """在临时目录中保存运行结果"""
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        cwd = os.getcwd()
+        os.chdir(save_dir)
+        try:
+            return self.instance.download_run_data('i1', 't1', save_file=True, save_path='/data',
+                                                   **kwargs)
+        finally:
+            os.chdir(cwd)
+
+    def test_parallel(self):
+        """测试分段并行下载"""
+        headers = dict(self.headers, ETag='"v1"')
+        self.server.responses = [(200, None, range_response(self.content, headers))]
+        path = self.save(workers=4, part_size=50000)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        ranges = [request[2].get('Range') for request in self.server.requests]
+        self.assertEqual(len(ranges), 1 + (len(self.content) + 49999) // 50000)
+        self.assertEqual(ranges[0], 'bytes=0-0')
+        self.assertIn('bytes=50000-99999', ranges)
+        self.assertTrue(all(request[2].get('If-Range') == '"v1"'
+                            for request in self.server.requests[1:]))
+
+    def test_parallel_failed(self):
+        """测试分段下载失败时不留下结果文件与 .part 文件"""
+        headers = dict(self.headers, ETag='"v1"')
+        respond = range_response(self.content, headers)
+
+        def failing(handler):
+            if handler.headers.get('Range') == 'bytes=50000-99999':
+                return 404, None, b''
+            return respond(handler)
+
+        self.server.responses = [(200, None, failing)]
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        cwd = os.getcwd()
+        os.chdir(save_dir)
+        try:
+            with self.assertRaises(Exception):
+                self.instance.download_run_data('i1', 't1', save_file=True, save_path='/data',
+                                                workers=4, part_size=50000)
+        finally:
+            os.chdir(cwd)
+        files = [name for _, _, names in os.walk(save_dir) for name in names]
+        self.assertEqual(files, [])
+
+    def test_parallel_fallback(self):
+        """测试服务器忽略Range时退回单连接下载"""
+        path = self.save(workers=4, part_size=50000)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_resume(self):
+        """测试连接中断后断点续传"""
+        headers = dict(self.headers, ETag='"v1"')
+
+        def broken(handler):
+            handler.send_response(200)
+            for key, value in headers.items():
+                handler.send_header(key, value)
+            handler.send_header('Content-Length', str(len(self.content)))
+            handler.end_headers()
+            handler.wfile.write(self.content[:100000])
+            handler.wfile.flush()
+            handler.close_connection = True
+            handler.connection.shutdown(socket.SHUT_RDWR)
+
+        self.server.responses = [(200, None, broken),
+                                 (200, None, range_response(self.content, headers))]
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        cwd = os.getcwd()
+        os.chdir(save_dir)
+        try:
+            url = self.instance.download_url.replace(':instance_id', 'i1').replace(':task_id', 't1')
+            params = {'contentType': 'csv'}
+            with self.assertRaises(requests.exceptions.RequestException):
+                download_resumable(self.request, url, params, '/data', 'i1_t1_csv', retries=0,
+                                   chunk_size=1024)
+            with open('data/datafile/i1_t1_csv.part.json') as file:
+                checkpoint = json.load(file)
+            self.assertTrue(0 < checkpoint['offset'] <= 100000)
+            self.assertEqual(checkpoint['length'], len(self.content))
+            self.assertEqual(checkpoint['validator'], '"v1"')
+
+            path = self.instance.download_run_data('i1', 't1', save_file=True, save_path='/data',
+                                                   resume=True)
+            self.assertEqual(sorted(os.listdir('data/datafile')), ['result.csv'])
+        finally:
+            os.chdir(cwd)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(self.server.requests[-1][2]['Range'],
+                         'bytes=%d-' % checkpoint['offset'])
+        self.assertEqual(self.server.requests[-1][2]['If-Range'], '"v1"')
+
+    def test_resume_unknown_length(self):
+        """测试首次响应没有 Content-Length 时续传以 Content-Range 中的文件大小为准"""
+        self.server.responses = [(200, None, range_response(self.content, self.headers))]
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir)
+        cwd = os.getcwd()
+        os.chdir(save_dir)
+        try:
+            url = self.instance.download_url.replace(':instance_id', 'i1').replace(':task_id', 't1')
+            params = {'contentType': 'csv'}
+            os.makedirs('data/datafile')
+            with open('data/datafile/i1_t1_csv.part', 'wb') as file:
+                file.write(self.content[:100000])
+            with open('data/datafile/i1_t1_csv.part.json', 'w') as file:
+                json.dump({'url': url, 'params': params, 'file_name': '/result', 'suffix': '.csv',
+                           'validator': None, 'length': None, 'offset': 100000}, file)
+            path = download_resumable(self.request, url, params, '/data', 'i1_t1_csv')
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), self.content)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(self.server.requests[-1][2]['Range'], 'bytes=100000-')
+
+    def test_iter_results(self):
+        """测试逐条产出运行结果记录"""
+        rows = self.instance.iter_results('i1', 't1')
+        self.assertEqual(next(rows), {'a': '1', 'b': '2'})
+        self.assertEqual(sum(1 for _ in rows), 49999)
+
+    def test_iter_results_zip(self):
+        """测试逐条产出zip文件中surface和depth的记录"""
+        zip_content = BytesIO()
+        with zipfile.ZipFile(zip_content, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('surface.json', '[{"a": 1}, {"a": 2}]')
+            zip_file.writestr('depth.json', '[{"b": 3}]')
+        headers = {'content-disposition': "attachment; filename*=UTF-8''result.zip"}
+        self.server.responses = [(200, headers, zip_content.getvalue())]
+        files = [(name, list(rows)) for name, rows in
+                 self.instance.iter_result_files('i1', 't1', file_type='json')]
+        self.assertEqual(files, [('surface.json', [{'a': 1}, {'a': 2}]),
+                                 ('depth.json', [{'b': 3}])])
+        self.assertEqual(list(self.instance.iter_results('i1', 't1', file_type='json')),
+                         [{'a': 1}, {'a': 2}, {'b': 3}])
+
+
 class TestUser(unittest.TestCase):
     """测试用户类"""
 